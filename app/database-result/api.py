@@ -1,24 +1,35 @@
 from fastapi import FastAPI, Depends, HTTPException, BackgroundTasks, Request
+from fastapi.responses import JSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
 from sqlalchemy import or_, func
 from typing import List, Optional, Dict, Any, Union
 from pydantic import BaseModel
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 import uuid
 import logging
 import jwt
 import secrets
 
 # Importera egna moduler
-from database import get_dbs, get_podcast_db, get_news_db, get_user_db, init_db
+from database import (
+    get_dbs, get_podcast_db, get_news_db, get_user_db, init_db,
+    NewsSessionLocal, PodcastSessionLocal
+)
 from models import (
     NewsCompany, PodcastCompany, News, Podcast, NewsStockPrice, 
     ChatSession, ChatMessage, NewsArticle, Episode, StockMention,
     User, Notification
 )
 from data_processor import DataProcessor, fetch_company_insights
+from ticker_normalizer import get_ticker_normalizer
+from company_cache import get_company_cache
+from price_series import ARROW_MEDIA_TYPE, get_price_cache
+from indicators import IndicatorParams, get_indicator_cache, indicator_columns, summarize
+from event_study import get_event_study_cache
+from mention_codes import RECOMMENDATION_CODES, mention_distribution_columns
+from transcript_index import get_transcript_index
 from open_ai import get_chatbot_api
 from config import JWT_SECRET_KEY, JWT_ALGORITHM, JWT_EXPIRATION_MINUTES
 
@@ -92,7 +103,7 @@ def get_comprehensive_dashboard():
             if mentioned_tickers:
                 # För varje ticker, hitta relaterade nyheter
                 for ticker in mentioned_tickers:
-                    company = news_db.query(NewsCompany).filter(NewsCompany.ticker == ticker).first()
+                    company = get_company_cache().get("news", news_db, ticker)
                     if company:
                         news_items = news_db.query(News).join(
                             News.companies
@@ -230,6 +241,16 @@ def startup_event():
     Initiera databaser när applikationen startar
     """
     init_db()
+    
+    # Ladda företagsidentiteterna i bulk så att de första förfrågningarna träffar cachen
+    news_db, podcast_db = NewsSessionLocal(), PodcastSessionLocal()
+    try:
+        get_company_cache().warmup({"news": news_db, "podcast": podcast_db})
+    except Exception as e:
+        logger.error(f"Kunde inte värma företagscachen: {str(e)}")
+    finally:
+        news_db.close()
+        podcast_db.close()
 
 # Användare och autentisering
 @app.post("/users/register")
@@ -309,10 +330,11 @@ def watch_company(
     current_user = get_current_user(token, dbs["user"])
     
     # Hitta företaget
-    company_obj = dbs["news"].query(NewsCompany).filter(NewsCompany.ticker == company.ticker).first()
+    identity = get_company_cache().get("news", dbs["news"], company.ticker)
     
-    if not company_obj:
+    if not identity:
         raise HTTPException(status_code=404, detail="Företaget hittades inte")
+    company_obj = dbs["news"].get(NewsCompany, identity.id)
     
     # Kontrollera om företaget redan bevakas
     if company_obj in current_user.watched_companies:
@@ -379,6 +401,124 @@ def get_company_insights(
     
     return insights
 
+@app.get("/insights/company/{ticker}/prices")
+def get_company_prices(
+    ticker: str,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    days: Optional[int] = None,
+    points: Optional[int] = None,
+    format: str = "columns",
+    dbs: Dict[str, Session] = Depends(get_dbs)
+):
+    """
+    Kursserie för ett företag i kolumnformat eller som Arrow IPC-ström
+    
+    start/end är inklusive datum; days räknas bakåt från idag om start saknas.
+    Med points slås serien ihop till högst så många OHLC-punkter.
+    """
+    if format not in ("columns", "arrow"):
+        raise HTTPException(status_code=400, detail="format måste vara 'columns' eller 'arrow'")
+    if points is not None and points < 1:
+        raise HTTPException(status_code=400, detail="points måste vara minst 1")
+    
+    company = get_company_cache().get("news", dbs["news"], ticker)
+    if not company:
+        raise HTTPException(status_code=404, detail="Företaget hittades inte")
+    
+    if start is None and days is not None:
+        start = date.today() - timedelta(days=days)
+    series = get_price_cache().get(dbs["news"], company.id, start, end)
+    if points is not None:
+        series = series.downsample(points)
+    
+    if format == "arrow":
+        try:
+            return Response(content=series.to_arrow(), media_type=ARROW_MEDIA_TYPE)
+        except ImportError as e:
+            raise HTTPException(status_code=501, detail=str(e))
+    
+    # Listorna är redan JSON-typer; JSONResponse hoppar över den långsamma jsonable_encoder
+    return JSONResponse(content={"ticker": company.ticker, **series.to_columns()})
+
+def parse_windows(value: str, name: str, minimum: int = 1) -> tuple:
+    """
+    Kommaseparerade fönsterlängder ("20,50") som tupel
+    """
+    try:
+        windows = tuple(sorted({int(part) for part in value.split(",") if part.strip()}))
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"{name} måste vara heltal separerade med komma")
+    if any(window < minimum for window in windows):
+        raise HTTPException(status_code=400, detail=f"{name} måste vara minst {minimum}")
+    return windows
+
+@app.get("/insights/company/{ticker}/indicators")
+def get_company_indicators(
+    ticker: str,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    days: Optional[int] = None,
+    sma: str = "20,50",
+    ema: str = "12,26",
+    rsi: int = 14,
+    volatility: int = 20,
+    summary_only: bool = False,
+    dbs: Dict[str, Session] = Depends(get_dbs)
+):
+    """
+    Tekniska indikatorer (avkastning, SMA/EMA, RSI, volatilitet, drawdown) för ett företags kursserie
+    """
+    params = IndicatorParams(
+        sma_windows=parse_windows(sma, "sma"),
+        ema_spans=parse_windows(ema, "ema"),
+        rsi_window=parse_windows(str(rsi), "rsi")[0],
+        volatility_window=parse_windows(str(volatility), "volatility", minimum=2)[0],
+    )
+    
+    company = get_company_cache().get("news", dbs["news"], ticker)
+    if not company:
+        raise HTTPException(status_code=404, detail="Företaget hittades inte")
+    
+    if start is None and days is not None:
+        start = date.today() - timedelta(days=days)
+    series = get_price_cache().get(dbs["news"], company.id, start, end)
+    indicators = get_indicator_cache().get(series, params)
+    
+    content = {"ticker": company.ticker, "company_id": company.id, "count": len(series),
+               "summary": summarize(series, indicators)}
+    if not summary_only:
+        content.update(indicator_columns(series, indicators))
+    return JSONResponse(content=content)
+
+@app.get("/insights/event-study")
+def get_event_study(
+    horizons: str = "1,5,20",
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    days: Optional[int] = None,
+    ticker: Optional[str] = None,
+    dbs: Dict[str, Session] = Depends(get_dbs)
+):
+    """
+    Framtida avkastning efter nyhets- och podcastsentiment, per källa, podcast och rekommendation
+    
+    horizons anges i handelsdagar; utan ticker körs studien över alla företag.
+    """
+    company_id = None
+    if ticker:
+        company = get_company_cache().get("news", dbs["news"], ticker)
+        if not company:
+            raise HTTPException(status_code=404, detail="Företaget hittades inte")
+        company_id = company.id
+    if start is None and days is not None:
+        start = date.today() - timedelta(days=days)
+    
+    result = get_event_study_cache().get(
+        dbs["news"], dbs.get("podcast"), parse_windows(horizons, "horizons"), start, end, company_id
+    )
+    return JSONResponse(content=result)
+
 @app.get("/insights/trending")
 def get_trending_insights(
     days: int = 30,
@@ -396,6 +536,18 @@ def get_trending_insights(
         logger.error(f"Fel vid hämtning av trendande ämnen: {str(e)}")
         raise HTTPException(status_code=500, detail="Kunde inte hämta trendande ämnen")
 
+@app.get("/cache/stats")
+def get_cache_stats(dbs: Dict[str, Session] = Depends(get_dbs)):
+    """
+    Träffstatistik för företagscachen och tickernormaliseringen
+    """
+    return {
+        "company_identity": get_company_cache().stats(),
+        "price_series": get_price_cache().stats(),
+        "indicators": get_indicator_cache().stats(),
+        "ticker_normalizer": get_ticker_normalizer(dbs["news"]).cache_info()
+    }
+
 # Nya endpoints för podcasts
 @app.get("/podcasts", response_model=List[PodcastResponse])
 def get_all_podcasts(podcast_db: Session = Depends(get_podcast_db)):
@@ -816,6 +968,52 @@ def search_content(
         logger.error(f"Fel vid sökning i innehåll: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Kunde inte söka i innehåll: {str(e)}")
 
+@app.get("/content/transcripts/search")
+def search_transcripts(
+    q: str,
+    limit: int = 20,
+    dbs: Dict[str, Session] = Depends(get_dbs)
+):
+    """
+    Sök passager i podcasttranskripten via det inverterade passageindexet
+    """
+    started = datetime.utcnow()
+    try:
+        passages = get_transcript_index().search(q, limit=min(limit, 100))
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    
+    try:
+        # Koppla video-ID:n till episoder med en enda fråga
+        video_ids = list({passage["video_id"] for passage in passages})
+        episodes = {
+            episode.video_id: episode
+            for episode in dbs["podcast"].query(Episode).filter(Episode.video_id.in_(video_ids)).all()
+        } if video_ids else {}
+        
+        results = []
+        for passage in passages:
+            episode = episodes.get(passage["video_id"])
+            results.append({
+                **passage,
+                "episode_id": episode.id if episode else None,
+                "episode_title": episode.title if episode else None,
+                "podcast_name": episode.podcast.name if episode and episode.podcast else None,
+                "published_at": episode.published_at.isoformat() if episode and episode.published_at else None,
+                "video_url": episode.video_url if episode else None
+            })
+        
+        return {
+            "status": "success",
+            "query": q,
+            "results": results,
+            "took_ms": round((datetime.utcnow() - started).total_seconds() * 1000, 1)
+        }
+    
+    except Exception as e:
+        logger.error(f"Fel vid sökning i transkript: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Kunde inte söka i transkript: {str(e)}")
+
 @app.get("/content/topics")
 def get_trending_topics(
     days: int = 30,
@@ -847,7 +1045,8 @@ def get_trending_topics(
             "title": news.title,
             "content": news.content,
             "summary": news.summary,
-            "published_at": news.published_at.isoformat() if news.published_at else None
+            "published_at": news.published_at.isoformat() if news.published_at else None,
+            "sentiment": news.sentiment
         } for news in news_items])
         
         # Hämta podcast-innehåll
@@ -868,6 +1067,22 @@ def get_trending_topics(
             "published_at": episode.published_at.isoformat() if episode.published_at else None
         } for episode in episodes])
         
+        # Sentimentsumma och antal per avsnitt ur de normaliserade kolumnerna, en grupperad fråga
+        episode_sentiment = {}
+        if episodes:
+            episode_sentiment = {
+                row.episode_id: (row.sentiment_sum or 0.0, row.sentiment_n)
+                for row in (
+                    dbs["podcast"].query(
+                        StockMention.episode_id,
+                        func.sum(StockMention.sentiment_value).label("sentiment_sum"),
+                        func.count(StockMention.sentiment_value).label("sentiment_n")
+                    )
+                    .filter(StockMention.episode_id.in_([episode.id for episode in episodes]))
+                    .group_by(StockMention.episode_id)
+                )
+            }
+        
         # Använd AI för att identifiera trendande ämnen
         topic_groups = chatbot.find_related_content(content_items, "mixed")
         
@@ -876,27 +1091,18 @@ def get_trending_topics(
         for topic_id, topic_data in topic_groups.items():
             item_count = len(topic_data.get("items", []))
             
-            # Beräkna medelsentiment
-            sentiment_values = []
+            # Medelsentiment över nyheterna och avsnittens aktieomnämnanden
+            sentiment_sum, sentiment_n = 0.0, 0
             for item in topic_data.get("items", []):
-                if "sentiment" in item:
-                    # För nyheter
-                    sentiment_values.append(item.get("sentiment", 0))
-                elif "stock_mentions" in item:
-                    # För podcasts med aktieomnämnanden, ta medelvärdet av sentiment
-                    mentions = item.get("stock_mentions", [])
-                    for mention in mentions:
-                        if mention.get("sentiment"):
-                            # Konvertera eventuella textbaserade sentiment till nummer
-                            sentiment_text = mention.get("sentiment", "").lower()
-                            if "positiv" in sentiment_text:
-                                sentiment_values.append(0.5)
-                            elif "negativ" in sentiment_text:
-                                sentiment_values.append(-0.5)
-                            elif "neutral" in sentiment_text:
-                                sentiment_values.append(0)
+                if item.get("type") == "news" and item.get("sentiment") is not None:
+                    sentiment_sum += item["sentiment"]
+                    sentiment_n += 1
+                elif item.get("type") == "podcast":
+                    episode_sum, episode_n = episode_sentiment.get(item.get("id"), (0.0, 0))
+                    sentiment_sum += episode_sum
+                    sentiment_n += episode_n
             
-            avg_sentiment = sum(sentiment_values) / len(sentiment_values) if sentiment_values else 0
+            avg_sentiment = sentiment_sum / sentiment_n if sentiment_n else 0
             
             trending_topics.append({
                 "topic_id": topic_id,
@@ -941,8 +1147,15 @@ def get_content_by_ticker(
         # Sätt tidsgräns
         start_date = datetime.utcnow() - timedelta(days=days)
         
-        # Hitta företaget i nyhetsdatabasen
-        news_company = dbs["news"].query(NewsCompany).filter(NewsCompany.ticker == ticker).first()
+        # Normalisera tickern ("ERIC B", "Ericsson", ...) till ett kanoniskt företag
+        match = get_ticker_normalizer(dbs["news"]).resolve(ticker=ticker)
+        news_company = get_company_cache().get_by_id("news", dbs["news"], match.company_id) if match else None
+        
+        # Omnämnanden som redan normaliserats matchas på company_id, övriga på exakt ticker
+        if match:
+            mention_filter = or_(StockMention.company_id == match.company_id, StockMention.ticker == ticker)
+        else:
+            mention_filter = StockMention.ticker == ticker
         
         # Hämta nyheter om företaget finns
         if news_company:
@@ -971,7 +1184,7 @@ def get_content_by_ticker(
         episodes_with_mentions = (
             dbs["podcast"].query(Episode)
             .join(StockMention, StockMention.episode_id == Episode.id)
-            .filter(StockMention.ticker == ticker)
+            .filter(mention_filter)
             .filter(Episode.published_at >= start_date)
             .order_by(Episode.published_at.desc())
             .all()
@@ -985,7 +1198,7 @@ def get_content_by_ticker(
             stock_mentions = (
                 dbs["podcast"].query(StockMention)
                 .filter(StockMention.episode_id == episode.id)
-                .filter(StockMention.ticker == ticker)
+                .filter(mention_filter)
                 .all()
             )
             
@@ -1014,57 +1227,48 @@ def get_content_by_ticker(
         if content_items:
             topic_groups = chatbot.find_related_content(content_items, "mixed")
         
+        # Sentiment- och rekommendationsfördelning räknas i databasen, en grupperad fråga per källa
+        news_counts = None
+        if news_company:
+            news_counts = (
+                dbs["news"].query(
+                    func.count(News.id).label("total"),
+                    func.count(News.id).filter(News.sentiment > 0.2).label("positive"),
+                    func.count(News.id).filter(News.sentiment < -0.2).label("negative")
+                )
+                .join(News.companies)
+                .filter(NewsCompany.id == news_company.id)
+                .filter(News.published_at >= start_date)
+                .one()
+            )
+        mention_counts = (
+            dbs["podcast"].query(*mention_distribution_columns())
+            .select_from(StockMention)
+            .join(Episode, Episode.id == StockMention.episode_id)
+            .filter(mention_filter)
+            .filter(Episode.published_at >= start_date)
+            .one()
+        )
+        
         # Sammanställ statistik om ticker-omnämnanden
+        news_total = news_counts.total if news_counts else 0
+        news_positive = news_counts.positive if news_counts else 0
+        news_negative = news_counts.negative if news_counts else 0
         stats = {
             "total_mentions": len(content_items),
             "news_mentions": sum(1 for item in content_items if item.get("type") == "news"),
             "podcast_mentions": sum(1 for item in content_items if item.get("type") == "podcast"),
             "sentiment_distribution": {
-                "positive": 0,
-                "neutral": 0,
-                "negative": 0
+                "positive": news_positive + mention_counts.positive,
+                "neutral": news_total - news_positive - news_negative + mention_counts.neutral,
+                "negative": news_negative + mention_counts.negative
             },
             "recommendation_distribution": {
-                "buy": 0,
-                "hold": 0,
-                "sell": 0,
-                "none": 0
-            }
+                code: getattr(mention_counts, code) for code in RECOMMENDATION_CODES
+            },
+            "podcast_average_sentiment": mention_counts.average_sentiment
         }
         
-        # Räkna sentiment- och rekommendationsfördelning
-        for item in content_items:
-            if item.get("type") == "news" and "sentiment" in item:
-                sentiment = float(item.get("sentiment", 0))
-                if sentiment > 0.2:
-                    stats["sentiment_distribution"]["positive"] += 1
-                elif sentiment < -0.2:
-                    stats["sentiment_distribution"]["negative"] += 1
-                else:
-                    stats["sentiment_distribution"]["neutral"] += 1
-            
-            elif item.get("type") == "podcast" and "stock_mentions" in item:
-                for mention in item.get("stock_mentions", []):
-                    # Sentiment
-                    sentiment_text = mention.get("sentiment", "").lower()
-                    if "positiv" in sentiment_text:
-                        stats["sentiment_distribution"]["positive"] += 1
-                    elif "negativ" in sentiment_text:
-                        stats["sentiment_distribution"]["negative"] += 1
-                    else:
-                        stats["sentiment_distribution"]["neutral"] += 1
-                    
-                    # Rekommendationer
-                    recommendation = mention.get("recommendation", "").lower()
-                    if "köp" in recommendation or "buy" in recommendation:
-                        stats["recommendation_distribution"]["buy"] += 1
-                    elif "sälj" in recommendation or "sell" in recommendation:
-                        stats["recommendation_distribution"]["sell"] += 1
-                    elif "håll" in recommendation or "hold" in recommendation:
-                        stats["recommendation_distribution"]["hold"] += 1
-                    else:
-                        stats["recommendation_distribution"]["none"] += 1
-        
         # Hämta företagsinfo om den finns
         company_info = None
         if news_company:
@@ -0,0 +1,259 @@
+"""
+Mikrobenchmarks för API-lagret
+
+Användning:
+    python benchmarks.py news-batch [--articles 10000] [--legacy-articles 500] [--latency 0.02]
+                                    [--workers 32] [--db-url URL]
+    python benchmarks.py company-data [--delay 0.02] [--requests 20] [--days 30]
+    python benchmarks.py indicators [--tickers 500] [--years 10]
+"""
+import os
+import time
+import random
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from models import (
+    NewsBase, PodcastBase, NewsCompany, PodcastCompany, NewsStockPrice, News, Podcast, Episode, StockMention
+)
+from data_processor import DataProcessor, COMPANY_FETCH_WORKERS
+from price_series import PriceSeries
+from indicators import IndicatorCache, IndicatorParams, compute_indicators_batch
+from ticker_normalizer import seed_reference_listings, reset_ticker_normalizer
+
+BENCH_COMPANIES = [
+    ("Volvo AB", "VOLV-B"), ("Telefonaktiebolaget LM Ericsson", "ERIC-B"), ("Investor AB", "INVE-B"),
+    ("Hennes & Mauritz", "HM-B"), ("Skandinaviska Enskilda Banken", "SEB-A"), ("ABB Ltd", "ABB"),
+    ("AstraZeneca", "AZN"), ("Sandvik", "SAND"), ("Atlas Copco", "ATCO-A"), ("Evolution", "EVO"),
+]
+
+
+class FakeChatbot:
+    def __init__(self, latency: float, seed: int = 1):
+        """
+        Ersätter LLM:en med en fast fördröjning och slumpade företagsomnämnanden
+        """
+        self.latency = latency
+        self.random = random.Random(seed)
+
+    def analyze_text(self, text):
+        time.sleep(self.latency)
+        entities = []
+        for _ in range(self.random.randint(1, 4)):
+            if self.random.random() < 0.8:
+                name, ticker = self.random.choice(BENCH_COMPANIES)
+                # Samma företag i olika skrivsätt
+                ticker = self.random.choice([ticker, ticker.replace("-", " "), None])
+            else:
+                number = self.random.randint(1, 200)
+                name, ticker = f"Småbolag {number}", f"SMB{number}"
+            entities.append({"type": "COMPANY", "name": name, "ticker": ticker, "confidence": 0.9})
+        return {"summary": text[:100], "sentiment": {"score": 0.1}, "entities": entities}
+
+
+def make_articles(count: int, prefix: str = "bench"):
+    start = datetime(2024, 1, 1)
+    return [{
+        "title": f"Nyhet {i}",
+        "source": "Bench",
+        "url": f"https://example.com/{prefix}/{i}",
+        "published_at": (start + timedelta(minutes=i)).isoformat(),
+        "content": "Marknaden steg under dagen. " * 40,
+    } for i in range(count)]
+
+
+def fresh_session(args, name):
+    if args.db_url:
+        engine = create_engine(args.db_url)
+        NewsBase.metadata.drop_all(engine)
+    else:
+        engine = create_engine(f"sqlite:///{os.path.join(tempfile.mkdtemp(), name)}.db")
+    NewsBase.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    for name, ticker in BENCH_COMPANIES:
+        session.add(NewsCompany(name=name, ticker=ticker, sector="Bench"))
+    session.commit()
+    seed_reference_listings(session)
+    reset_ticker_normalizer()
+    return session
+
+
+def bench_news_batch(args):
+    # Per-artikel-vägen är för långsam för hela mängden; mät en delmängd och räkna per artikel
+    session = fresh_session(args, "legacy")
+    processor = DataProcessor({"news": session, "podcast": None})
+    processor.chatbot = FakeChatbot(args.latency)
+    started = time.perf_counter()
+    for article in make_articles(args.legacy_articles, "legacy"):
+        processor.process_news(article)
+    legacy_elapsed = time.perf_counter() - started
+    legacy_rate = args.legacy_articles / legacy_elapsed
+    session.close()
+
+    session = fresh_session(args, "batch")
+    processor = DataProcessor({"news": session, "podcast": None})
+    processor.chatbot = FakeChatbot(args.latency)
+    articles = make_articles(args.articles, "batch")
+    started = time.perf_counter()
+    totals = {"created": 0, "links": 0, "companies_created": 0}
+    for offset in range(0, len(articles), args.batch_size):
+        stats = processor.process_news_batch(articles[offset:offset + args.batch_size], max_workers=args.workers)
+        for key in totals:
+            totals[key] += stats[key]
+    batch_elapsed = time.perf_counter() - started
+    batch_rate = args.articles / batch_elapsed
+    session.close()
+
+    print(f"LLM latency {args.latency * 1000:.0f} ms per article, {args.workers} workers, "
+          f"batches of {args.batch_size}")
+    print(f"process_news:       {args.legacy_articles:>6} articles in {legacy_elapsed:7.2f}s "
+          f"({legacy_rate:8.1f} articles/s)")
+    print(f"process_news_batch: {args.articles:>6} articles in {batch_elapsed:7.2f}s "
+          f"({batch_rate:8.1f} articles/s), {totals['links']} links, "
+          f"{totals['companies_created']} companies created")
+    print(f"Speedup: {batch_rate / legacy_rate:.1f}x")
+
+
+def seed_company_data(news_session, podcast_session, days: int):
+    now = datetime.utcnow()
+    companies = [NewsCompany(name=name, ticker=ticker, sector="Bench") for name, ticker in BENCH_COMPANIES]
+    news_session.add_all(companies)
+    podcast = Podcast(name="Bench Pod")
+    podcast_session.add(podcast)
+    podcast_session.add_all(PodcastCompany(name=name, ticker=ticker, sector="Bench") for name, ticker in BENCH_COMPANIES)
+    podcast_session.flush()
+    for company in companies:
+        for day in range(days):
+            published = now - timedelta(days=day, hours=1)
+            news_session.add(NewsStockPrice(company=company, date=published, open_price=100.0, high_price=101.0,
+                                            low_price=99.0, close_price=100.5, volume=1000))
+            news_session.add(News(title=f"{company.ticker} {day}", source="Bench", url=f"https://example.com/{company.ticker}/{day}",
+                                  published_at=published, summary="Bench", sentiment=0.1, companies=[company]))
+    for day in range(days):
+        episode = Episode(podcast_id=podcast.id, video_id=f"bench{day}", title=f"Avsnitt {day}",
+                          published_at=now - timedelta(days=day, hours=1), summary="Bench")
+        podcast_session.add(episode)
+        podcast_session.flush()
+        for name, ticker in BENCH_COMPANIES:
+            podcast_session.add(StockMention(episode_id=episode.id, name=name, ticker=ticker,
+                                             sentiment="positiv", sentiment_value=1.0, recommendation_code="buy"))
+    news_session.commit()
+    podcast_session.commit()
+
+
+def bench_company_data(args):
+    directory = tempfile.mkdtemp()
+    engines = {
+        "news": create_engine(f"sqlite:///{os.path.join(directory, 'news.db')}"),
+        "podcast": create_engine(f"sqlite:///{os.path.join(directory, 'podcast.db')}"),
+    }
+    NewsBase.metadata.create_all(engines["news"])
+    PodcastBase.metadata.create_all(engines["podcast"])
+    sessions = {name: sessionmaker(bind=engine)() for name, engine in engines.items()}
+    seed_company_data(sessions["news"], sessions["podcast"], args.days)
+
+    # Simulerad nätverkslatens per fråga (sleep släpper GIL:en precis som en väntande databasdrivrutin)
+    for engine in engines.values():
+        event.listen(engine, "before_cursor_execute", lambda *_: time.sleep(args.delay))
+
+    tickers = [ticker for _, ticker in BENCH_COMPANIES]
+    results = {}
+    # En tråd i poolen ger samma ordning som den tidigare sekventiella hämtningen
+    for label, workers in (("sequential", 1), ("parallel", COMPANY_FETCH_WORKERS)):
+        processor = DataProcessor(sessions)
+        executor = ThreadPoolExecutor(max_workers=workers)
+        processor.fetch_executor = executor
+        processor.get_company_data(tickers[0], days=args.days)
+        started = time.perf_counter()
+        for i in range(args.requests):
+            data = processor.get_company_data(tickers[i % len(tickers)], days=args.days)
+        elapsed = time.perf_counter() - started
+        executor.shutdown()
+        results[label] = elapsed / args.requests
+        print(f"{label:<11} {results[label] * 1000:8.1f} ms per get_company_data "
+              f"({len(data['stock_prices'])} prices, {len(data['news'])} news, {len(data['podcasts'])} episodes)")
+
+    for session in sessions.values():
+        session.close()
+    print(f"Query delay {args.delay * 1000:.0f} ms, speedup: {results['sequential'] / results['parallel']:.1f}x")
+
+
+def random_walk_series(count: int, days: int, seed: int = 1):
+    rng = np.random.default_rng(seed)
+    dates = np.int64(1_262_304_000) + np.arange(days, dtype=np.int64) * 86400
+    series = []
+    for company_id in range(count):
+        # Olika längder som vid nyare noteringar
+        length = days - int(rng.integers(0, days // 10))
+        close = 100 * np.exp(np.cumsum(rng.normal(0, 0.015, length)))
+        spread = np.abs(rng.normal(0, 0.01, length)) * close
+        series.append(PriceSeries(company_id, dates[days - length:], close - spread / 2, close + spread,
+                                  close - spread, close, rng.integers(1000, 100000, length), version=company_id + 1))
+    return series
+
+
+def bench_indicators(args):
+    series = random_walk_series(args.tickers, args.years * 252)
+    params = IndicatorParams()
+    rows = sum(len(item) for item in series)
+
+    started = time.perf_counter()
+    for item in series:
+        compute_indicators_batch([item], params)
+    single_elapsed = time.perf_counter() - started
+
+    started = time.perf_counter()
+    compute_indicators_batch(series, params)
+    batch_elapsed = time.perf_counter() - started
+
+    cache = IndicatorCache(max_entries=args.tickers)
+    cache.get_batch(series, params)
+    started = time.perf_counter()
+    cache.get_batch(series, params)
+    cached_elapsed = time.perf_counter() - started
+
+    print(f"{args.tickers} tickers x {args.years} years ({rows} rows), indicators: {', '.join(compute_indicators_batch(series[:1], params)[0])}")
+    print(f"per ticker: {single_elapsed * 1000:8.1f} ms ({rows / single_elapsed / 1e6:6.2f} M rows/s)")
+    print(f"batch:      {batch_elapsed * 1000:8.1f} ms ({rows / batch_elapsed / 1e6:6.2f} M rows/s)")
+    print(f"cached:     {cached_elapsed * 1000:8.1f} ms")
+    print(f"Batch speedup: {single_elapsed / batch_elapsed:.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks för API-lagret")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    news = subparsers.add_parser("news-batch", help="process_news per artikel mot process_news_batch")
+    news.add_argument("--articles", type=int, default=10000)
+    news.add_argument("--legacy-articles", type=int, default=500,
+                      help="Artiklar för per-artikel-vägen (hastigheten räknas per artikel)")
+    news.add_argument("--batch-size", type=int, default=1000)
+    news.add_argument("--latency", type=float, default=0.02, help="Simulerad LLM-fördröjning i sekunder")
+    news.add_argument("--workers", type=int, default=32, help="Samtidiga LLM-anrop i batchvägen")
+    news.add_argument("--db-url", help="Databas-URL (standard: temporär SQLite-fil). Tabellerna töms!")
+    news.set_defaults(func=bench_news_batch)
+
+    company = subparsers.add_parser("company-data", help="get_company_data sekventiellt mot parallellt")
+    company.add_argument("--delay", type=float, default=0.02, help="Simulerad fördröjning per fråga i sekunder")
+    company.add_argument("--requests", type=int, default=20)
+    company.add_argument("--days", type=int, default=30)
+    company.set_defaults(func=bench_company_data)
+
+    indicators = subparsers.add_parser("indicators", help="Indikatorer per ticker mot en batch för alla")
+    indicators.add_argument("--tickers", type=int, default=500)
+    indicators.add_argument("--years", type=int, default=10)
+    indicators.set_defaults(func=bench_indicators)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+"""
+Processgemensam cache för företagsidentiteter (ticker -> företag)
+
+Samma uppslag `query(NewsCompany).filter(NewsCompany.ticker == ticker).first()`
+görs i flera handlers och i DataProcessor. Cachen håller en ögonblicksbild
+av företagstabellerna i både news- och podcast-databasen, laddad i bulk vid
+start. Tickers som saknas cachas negativt en kort stund. Varje tabell har en
+version: lokalt räknas den upp när företag skapas eller synkas, och ett
+fingeravtryck (antal, senaste updated_at) läses med jämna mellanrum så att
+ändringar från andra processer också slår igenom.
+
+Posterna är fristående namedtuples och kan delas mellan sessioner och
+trådar. Behövs ORM-objektet (t.ex. för relationer) hämtas det med
+session.get(Model, identity.id), som är ett primärnyckeluppslag.
+"""
+import time
+import logging
+import threading
+from collections import namedtuple
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from models import NewsCompany, PodcastCompany
+
+logger = logging.getLogger(__name__)
+
+# Sekunder som en saknad ticker cachas
+NEGATIVE_TTL = 300.0
+# Minsta tid mellan kontroller av tabellens fingeravtryck
+VERSION_CHECK_INTERVAL = 5.0
+
+COMPANY_MODELS = {"news": NewsCompany, "podcast": PodcastCompany}
+
+CompanyIdentity = namedtuple(
+    "CompanyIdentity", ["id", "name", "ticker", "sector", "description", "founded_year"]
+)
+
+
+def _identity_columns(model):
+    return (model.id, model.name, model.ticker, model.sector, model.description, model.founded_year)
+
+
+class _Table:
+    __slots__ = ("by_ticker", "by_id", "missing", "fingerprint", "version", "loaded_version", "checked_at")
+
+    def __init__(self):
+        self.by_ticker: Dict[str, CompanyIdentity] = {}
+        self.by_id: Dict[int, CompanyIdentity] = {}
+        self.missing: Dict[str, float] = {}
+        self.fingerprint: Optional[Tuple[Any, Any]] = None
+        self.version = 0
+        self.loaded_version: Optional[int] = None
+        self.checked_at = 0.0
+
+
+class CompanyIdentityCache:
+    def __init__(self, negative_ttl: float = NEGATIVE_TTL, version_check_interval: float = VERSION_CHECK_INTERVAL,
+                 clock=time.monotonic):
+        """
+        Cache för företagsidentiteter per databas ("news", "podcast")
+
+        :param negative_ttl: Sekunder som en saknad ticker cachas
+        :param version_check_interval: Minsta tid mellan kontroller av databasens fingeravtryck
+        :param clock: Monoton klocka
+        """
+        self.negative_ttl = negative_ttl
+        self.version_check_interval = version_check_interval
+        self.clock = clock
+        self._tables = {db: _Table() for db in COMPANY_MODELS}
+        self._lock = threading.RLock()
+        self._counters = {"hits": 0, "negative_hits": 0, "misses": 0, "loads": 0, "invalidations": 0}
+
+    def _fingerprint(self, db: str, session: Session) -> Tuple[Any, Any]:
+        model = COMPANY_MODELS[db]
+        count, last_updated = session.execute(select(func.count(model.id), func.max(model.updated_at))).one()
+        return count, last_updated
+
+    def _load(self, db: str, session: Session):
+        model = COMPANY_MODELS[db]
+        table = self._tables[db]
+        version = table.version
+        # Fingeravtrycket läses före raderna så att en samtidig ändring ger en ny laddning
+        fingerprint = self._fingerprint(db, session)
+        rows = session.execute(select(*_identity_columns(model))).all()
+        identities = [CompanyIdentity(*row) for row in rows]
+        with self._lock:
+            table.by_ticker = {identity.ticker: identity for identity in identities}
+            table.by_id = {identity.id: identity for identity in identities}
+            table.missing = {}
+            table.fingerprint = fingerprint
+            table.loaded_version = version
+            table.checked_at = self.clock()
+            self._counters["loads"] += 1
+        logger.info(f"Laddade {len(identities)} företag från {db}-databasen till identitetscachen")
+
+    def _ensure_fresh(self, db: str, session: Session) -> _Table:
+        table = self._tables[db]
+        if table.loaded_version != table.version:
+            self._load(db, session)
+        elif self.clock() - table.checked_at >= self.version_check_interval:
+            fingerprint = self._fingerprint(db, session)
+            if fingerprint != table.fingerprint:
+                logger.info(f"Företagstabellen i {db}-databasen har ändrats, laddar om identitetscachen")
+                self._load(db, session)
+            else:
+                table.checked_at = self.clock()
+        return table
+
+    def warmup(self, dbs: Dict[str, Session]):
+        """
+        Ladda alla företag i bulk (körs vid start)
+
+        :param dbs: Sessioner per databas; databaser som saknas hoppas över
+        """
+        for db in COMPANY_MODELS:
+            if dbs.get(db) is not None:
+                self._load(db, dbs[db])
+
+    def get(self, db: str, session: Session, ticker: Optional[str]) -> Optional[CompanyIdentity]:
+        """
+        Slå upp ett företag på exakt ticker
+
+        :param db: "news" eller "podcast"
+        :param session: Session mot samma databas (används vid laddning och missar)
+        :param ticker: Ticker-symbol
+        :return: CompanyIdentity eller None
+        """
+        if not ticker:
+            return None
+        table = self._ensure_fresh(db, session)
+        identity = table.by_ticker.get(ticker)
+        if identity is not None:
+            with self._lock:
+                self._counters["hits"] += 1
+            return identity
+
+        now = self.clock()
+        expires = table.missing.get(ticker)
+        if expires is not None and expires > now:
+            with self._lock:
+                self._counters["negative_hits"] += 1
+            return None
+
+        # Miss: fråga databasen direkt och cacha svaret åt båda hållen
+        model = COMPANY_MODELS[db]
+        row = session.execute(select(*_identity_columns(model)).where(model.ticker == ticker)).first()
+        with self._lock:
+            self._counters["misses"] += 1
+            if row is None:
+                table.missing[ticker] = now + self.negative_ttl
+                return None
+            identity = CompanyIdentity(*row)
+            table.by_ticker[identity.ticker] = identity
+            table.by_id[identity.id] = identity
+            table.missing.pop(ticker, None)
+        return identity
+
+    def get_by_id(self, db: str, session: Session, company_id: Optional[int]) -> Optional[CompanyIdentity]:
+        """
+        Slå upp ett företag på ID (t.ex. efter tickernormalisering)
+        """
+        if company_id is None:
+            return None
+        table = self._ensure_fresh(db, session)
+        identity = table.by_id.get(company_id)
+        if identity is not None:
+            with self._lock:
+                self._counters["hits"] += 1
+            return identity
+
+        model = COMPANY_MODELS[db]
+        row = session.execute(select(*_identity_columns(model)).where(model.id == company_id)).first()
+        with self._lock:
+            self._counters["misses"] += 1
+            if row is None:
+                return None
+            identity = CompanyIdentity(*row)
+            table.by_ticker[identity.ticker] = identity
+            table.by_id[identity.id] = identity
+        return identity
+
+    def invalidate(self, db: Optional[str] = None):
+        """
+        Räkna upp versionen så att nästa uppslag laddar om tabellen
+
+        :param db: "news", "podcast" eller None för båda
+        """
+        with self._lock:
+            for name in ([db] if db else list(COMPANY_MODELS)):
+                self._tables[name].version += 1
+            self._counters["invalidations"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Träffstatistik och storlek per databas
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            tables = {
+                db: {
+                    "companies": len(table.by_ticker),
+                    "negative_entries": len(table.missing),
+                    "version": table.version,
+                    "loaded": table.loaded_version is not None,
+                }
+                for db, table in self._tables.items()
+            }
+        lookups = counters["hits"] + counters["negative_hits"] + counters["misses"]
+        counters["lookups"] = lookups
+        counters["hit_rate"] = round((counters["hits"] + counters["negative_hits"]) / lookups, 3) if lookups else 0.0
+        counters["databases"] = tables
+        return counters
+
+
+_company_cache = CompanyIdentityCache()
+
+
+def get_company_cache() -> CompanyIdentityCache:
+    """
+    Delad identitetscache för processen
+    """
+    return _company_cache
@@ -1,18 +1,58 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import func, desc
+from sqlalchemy import func, desc, insert, select, update, or_, and_
 from models import (
-    NewsCompany, PodcastCompany, NewsStockPrice, News, Podcast, 
-    Episode, StockMention, User, Notification
+    NewsCompany, PodcastCompany, News, Podcast, 
+    Episode, StockMention, User, Notification, ReferenceListing, company_news,
+    NewsSyncWatermark, PodcastSyncWatermark
 )
 from datetime import datetime, timedelta
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
 from open_ai import get_chatbot_api
+from ticker_normalizer import get_ticker_normalizer, reset_ticker_normalizer, ticker_key
+from company_cache import get_company_cache
+from price_series import get_price_cache
+from event_study import get_event_study_cache
+from mention_rollups import SOURCE_NEWS, SOURCE_PODCAST, apply_rollup_deltas, news_deltas, trending_companies
 import logging
 import requests
-from typing import Dict, Any, List
+from typing import Callable, Dict, Any, List, Optional, Tuple
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Antal samtidiga LLM-anrop vid batchbearbetning
+NEWS_BATCH_WORKERS = 8
+
+# Källrader per sida (och transaktion) vid inkrementell företagssynk
+COMPANY_SYNC_PAGE_SIZE = 1000
+# Fält som följer med när ett befintligt företag uppdateras i den andra databasen
+SYNCED_COMPANY_FIELDS = ("name", "sector", "description", "founded_year")
+
+# Gemensam, begränsad trådpool för oberoende frågor mot news- och podcast-databasen
+COMPANY_FETCH_WORKERS = 8
+COMPANY_FETCH_EXECUTOR = ThreadPoolExecutor(max_workers=COMPANY_FETCH_WORKERS, thread_name_prefix="company-fetch")
+
+def dialect_insert(session: Session):
+    """
+    INSERT-konstruktion med ON CONFLICT-stöd för sessionens databas
+    """
+    if session.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as pg_insert
+        return pg_insert
+    from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+    return sqlite_insert
+
+def company_entities(analysis: Dict[str, Any]) -> List[Tuple[Optional[str], Optional[str]]]:
+    """
+    Företagsomnämnanden i en analys som (ticker, namn)
+    """
+    return [
+        (entity.get('ticker'), entity.get('name'))
+        for entity in analysis.get('entities', [])
+        if entity.get('type') == 'COMPANY' and (entity.get('ticker') or entity.get('name'))
+    ]
+
 class DataProcessor:
     def __init__(self, dbs: Dict[str, Session]):
         """
@@ -24,6 +64,44 @@ class DataProcessor:
         self.podcast_db = dbs["podcast"]
         self.user_db = dbs.get("user")
         self.chatbot = get_chatbot_api()
+        self.fetch_executor = COMPANY_FETCH_EXECUTOR
+    
+    @contextmanager
+    def _task_sessions(self):
+        """
+        Egna sessioner mot samma databaser för en uppgift i trådpoolen (sessioner kan inte delas mellan trådar)
+        """
+        sessions = {
+            name: Session(bind=db.get_bind())
+            for name, db in (("news", self.news_db), ("podcast", self.podcast_db)) if db is not None
+        }
+        try:
+            yield sessions
+        finally:
+            for session in sessions.values():
+                session.close()
+    
+    def submit_task(self, task: Callable[[Dict[str, Session]], Any]) -> Future:
+        """
+        Kör en uppgift i trådpoolen med egna sessioner
+        
+        :param task: Funktion som får {'news': session, 'podcast': session} och returnerar färdiga data
+                     (inga ORM-objekt, sessionerna stängs efteråt)
+        """
+        def run():
+            with self._task_sessions() as sessions:
+                return task(sessions)
+        return self.fetch_executor.submit(run)
+    
+    def run_parallel(self, tasks: Dict[str, Callable[[Dict[str, Session]], Any]]) -> Dict[str, Any]:
+        """
+        Kör oberoende uppgifter samtidigt och vänta in alla
+        
+        :param tasks: Namn -> uppgift (se submit_task)
+        :return: Namn -> resultat
+        """
+        futures = {name: self.submit_task(task) for name, task in tasks.items()}
+        return {name: future.result() for name, future in futures.items()}
     
     def process_news(self, news_data):
         """
@@ -36,12 +114,8 @@ class DataProcessor:
             # Använd chatbot API för att analysera nyhetsinnehållet
             analysis = self.chatbot.analyze_text(news_data['content'])
             
-            # Extrahera nämnda företag
-            company_tickers = []
-            if 'entities' in analysis:
-                for entity in analysis['entities']:
-                    if entity['type'] == 'COMPANY' and 'ticker' in entity:
-                        company_tickers.append(entity['ticker'])
+            # Extrahera nämnda företag som (ticker, namn); tickern saknas ofta eller är fritext
+            mentioned = company_entities(analysis)
             
             # Skapa nyhetspost
             news = News(
@@ -54,33 +128,187 @@ class DataProcessor:
                 sentiment=analysis.get('sentiment', {}).get('score', 0)
             )
             
-            # Länka till nämnda företag
-            for ticker in company_tickers:
-                company = self.news_db.query(NewsCompany).filter(NewsCompany.ticker == ticker).first()
-                if company:
-                    news.companies.append(company)
-                else:
-                    logger.warning(f"Företag med ticker {ticker} hittades inte i nyhetsdatabasen")
-                    # Skapa företaget om det inte finns
-                    try:
-                        new_company = NewsCompany(
-                            name=ticker,  # Använd ticker som namn tills mer information finns
-                            ticker=ticker,
-                            sector="Unknown"
-                        )
-                        self.news_db.add(new_company)
-                        self.news_db.commit()
-                        news.companies.append(new_company)
-                    except Exception as e:
-                        logger.error(f"Kunde inte skapa nytt företag: {str(e)}")
+            # Länka till kanoniska företag; samma regel för nya företag som i batchvägen
+            resolved, companies_created = self._resolve_companies(mentioned)
+            
+            linked_ids = {company_id for company_id in resolved.values() if company_id is not None}
+            if linked_ids:
+                news.companies.extend(
+                    self.news_db.query(NewsCompany).filter(NewsCompany.id.in_(linked_ids)).all()
+                )
             
             self.news_db.add(news)
+            apply_rollup_deltas(self.news_db, news_deltas(
+                [(news.published_at, news.sentiment, [(company.ticker, company.name) for company in news.companies])]
+            ))
             self.news_db.commit()
-            return news
         except Exception as e:
             self.news_db.rollback()
             logger.error(f"Fel vid bearbetning av nyheter: {str(e)}")
             raise
+        
+        if companies_created:
+            self._companies_changed()
+        return news
+    
+    def _resolve_companies(self, pairs: List[Tuple[Optional[str], Optional[str]]]
+                           ) -> Tuple[Dict[Tuple[Optional[str], Optional[str]], Optional[int]], int]:
+        """
+        Mappa (ticker, namn)-par till kanoniska företags-ID:n och skapa saknade företag
+        
+        Nya företag skapas bara när omnämnandet har både ticker och ett riktigt namn
+        (mer än tickern), så inga platshållare. De skrivs med en enda INSERT ... ON
+        CONFLICT tillsammans med en referenslistning och slås sedan upp med en IN-fråga.
+        Körs i anroparens transaktion; efter commit ska _companies_changed anropas om
+        något företag skapades.
+        
+        :param pairs: (ticker, namn)-par, dubbletter går bra
+        :return: (par -> företags-ID eller None, antal skapade företag)
+        """
+        unique_pairs = list(dict.fromkeys(pairs))
+        resolved = dict(zip(unique_pairs, get_ticker_normalizer(self.news_db).resolve_many(unique_pairs)))
+        
+        new_companies = {}
+        for (ticker, name), company_id in resolved.items():
+            if company_id is None and ticker and name and ticker_key(name) != ticker_key(ticker):
+                symbol = ticker.strip().upper()
+                if len(symbol) <= NewsCompany.ticker.type.length:
+                    # Namnet kommer från språkmodellen och kan vara längre än kolumnen
+                    new_companies.setdefault(symbol, name.strip()[:NewsCompany.name.type.length].rstrip())
+        
+        created = 0
+        if new_companies:
+            insert_for_dialect = dialect_insert(self.news_db)
+            now = datetime.utcnow()
+            result = self.news_db.execute(
+                insert_for_dialect(NewsCompany.__table__).on_conflict_do_nothing(index_elements=['ticker']),
+                [{"name": name, "ticker": symbol, "sector": "Unknown", "created_at": now, "updated_at": now}
+                 for symbol, name in new_companies.items()]
+            )
+            # rowcount är -1 när drivrutinen inte kan räkna rader vid executemany
+            created = result.rowcount if result.rowcount >= 0 else len(new_companies)
+            company_ids = dict(self.news_db.execute(
+                select(NewsCompany.ticker, NewsCompany.id).where(NewsCompany.ticker.in_(list(new_companies)))
+            ).all())
+            self.news_db.execute(
+                insert_for_dialect(ReferenceListing.__table__).on_conflict_do_nothing(index_elements=['ticker']),
+                [{"company_id": company_ids[symbol], "ticker": symbol, "name": name, "exchange": None,
+                  "created_at": now}
+                 for symbol, name in new_companies.items() if symbol in company_ids]
+            )
+            for (ticker, name), company_id in resolved.items():
+                if company_id is None and ticker:
+                    resolved[(ticker, name)] = company_ids.get(ticker.strip().upper())
+        
+        for (ticker, name), company_id in resolved.items():
+            if company_id is None:
+                logger.warning(f"Kunde inte normalisera företaget {name or ticker} ({ticker or 'ingen ticker'})")
+        return resolved, created
+    
+    @staticmethod
+    def _companies_changed():
+        """
+        Låt normaliseringen och identitetscachen se nyskapade företag
+        """
+        reset_ticker_normalizer()
+        get_company_cache().invalidate("news")
+    
+    def process_news_batch(self, items: List[Dict[str, Any]], max_workers: int = NEWS_BATCH_WORKERS) -> Dict[str, Any]:
+        """
+        Bearbeta många nyheter på en gång
+        
+        LLM-analyserna körs parallellt. Företag mappas och skapas med samma regel som i
+        process_news (se _resolve_companies), en gång för hela batchen. Artiklar och
+        company_news-länkar skrivs i en och samma transaktion.
+        
+        :param items: Lista med nyhetsdata (samma format som process_news)
+        :param max_workers: Antal samtidiga LLM-anrop
+        :return: Ordbok med news_ids, created, failed, companies_created och links
+        """
+        stats = {"news_ids": [], "created": 0, "failed": 0, "companies_created": 0, "links": 0}
+        if not items:
+            return stats
+        
+        analyses = self._analyze_many([item['content'] for item in items], max_workers)
+        analyzed = [(item, analysis) for item, analysis in zip(items, analyses) if analysis is not None]
+        stats["failed"] = len(items) - len(analyzed)
+        if not analyzed:
+            # En tom flerradig INSERT blir en enda rad utan värden, så inget skrivs alls
+            logger.warning(f"Alla {stats['failed']} analyser i batchen misslyckades, inga nyheter sparades")
+            return stats
+        
+        mentioned = [company_entities(analysis) for _, analysis in analyzed]
+        
+        try:
+            resolved, stats["companies_created"] = self._resolve_companies(
+                [pair for pairs in mentioned for pair in pairs]
+            )
+            
+            # Flerradig INSERT med RETURNING; ID:n kommer i samma ordning som raderna
+            news_rows = [{
+                "title": item['title'],
+                "source": item['source'],
+                "url": item['url'],
+                "published_at": datetime.fromisoformat(item['published_at']),
+                "content": item['content'],
+                "summary": analysis.get('summary', ''),
+                "sentiment": analysis.get('sentiment', {}).get('score', 0)
+            } for item, analysis in analyzed]
+            news_ids = list(self.news_db.execute(
+                insert(News).returning(News.id, sort_by_parameter_order=True), news_rows
+            ).scalars())
+            
+            article_company_ids = [
+                {resolved[pair] for pair in pairs_in_article} - {None} for pairs_in_article in mentioned
+            ]
+            links = [
+                {"company_id": company_id, "news_id": news_id}
+                for news_id, company_ids_in_article in zip(news_ids, article_company_ids)
+                for company_id in company_ids_in_article
+            ]
+            if links:
+                self.news_db.execute(company_news.insert(), links)
+                
+                # Dagliga omnämnanden uppdateras i samma transaktion
+                linked = {link["company_id"] for link in links}
+                companies = {
+                    row.id: (row.ticker, row.name)
+                    for row in self.news_db.execute(
+                        select(NewsCompany.id, NewsCompany.ticker, NewsCompany.name).where(NewsCompany.id.in_(linked))
+                    )
+                }
+                apply_rollup_deltas(self.news_db, news_deltas(
+                    (row["published_at"], row["sentiment"], [companies[company_id] for company_id in company_ids_in_article])
+                    for row, company_ids_in_article in zip(news_rows, article_company_ids)
+                ))
+            
+            self.news_db.commit()
+        except Exception as e:
+            self.news_db.rollback()
+            logger.error(f"Fel vid batchbearbetning av nyheter: {str(e)}")
+            raise
+        
+        if stats["companies_created"]:
+            self._companies_changed()
+        
+        stats.update(news_ids=news_ids, created=len(news_ids), links=len(links))
+        logger.info(f"Sparade {len(news_ids)} nyheter med {len(links)} företagslänkar "
+                    f"({stats['companies_created']} nya företag, {stats['failed']} misslyckade analyser)")
+        return stats
+    
+    def _analyze_many(self, texts: List[str], max_workers: int) -> List[Optional[Dict[str, Any]]]:
+        """
+        Kör LLM-analyser parallellt; misslyckade analyser blir None
+        """
+        def analyze(text):
+            try:
+                return self.chatbot.analyze_text(text)
+            except Exception as e:
+                logger.error(f"Fel vid analys av nyhet: {str(e)}")
+                return None
+        
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            return list(executor.map(analyze, texts))
     
     def process_podcast(self, podcast_data):
         """
@@ -115,16 +343,17 @@ class DataProcessor:
             )
             
             # Länka till nämnda företag
+            company_cache = get_company_cache()
             for ticker in company_tickers:
-                company = self.podcast_db.query(PodcastCompany).filter(PodcastCompany.ticker == ticker).first()
-                if company:
-                    podcast.companies.append(company)
+                identity = company_cache.get("podcast", self.podcast_db, ticker)
+                if identity:
+                    podcast.companies.append(self.podcast_db.get(PodcastCompany, identity.id))
                 else:
                     logger.warning(f"Företag med ticker {ticker} hittades inte i podcast-databasen")
                     # Skapa företaget om det inte finns
                     try:
                         # Kolla först om företaget finns i nyhetsdatabasen
-                        news_company = self.news_db.query(NewsCompany).filter(NewsCompany.ticker == ticker).first()
+                        news_company = company_cache.get("news", self.news_db, ticker)
                         
                         if news_company:
                             # Skapa företaget i podcast-databasen baserat på information från nyhetsdatabasen
@@ -145,6 +374,7 @@ class DataProcessor:
                         
                         self.podcast_db.add(new_company)
                         self.podcast_db.commit()
+                        company_cache.invalidate("podcast")
                         podcast.companies.append(new_company)
                     except Exception as e:
                         logger.error(f"Kunde inte skapa nytt företag: {str(e)}")
@@ -166,8 +396,9 @@ class DataProcessor:
         :return: Ordbok med företagsdata
         """
         # Hämta företagsinformation från båda databaserna
-        news_company = self.news_db.query(NewsCompany).filter(NewsCompany.ticker == ticker).first()
-        podcast_company = self.podcast_db.query(PodcastCompany).filter(PodcastCompany.ticker == ticker).first()
+        company_cache = get_company_cache()
+        news_company = company_cache.get("news", self.news_db, ticker)
+        podcast_company = company_cache.get("podcast", self.podcast_db, ticker)
         
         if not news_company and not podcast_company:
             return None
@@ -201,57 +432,14 @@ class DataProcessor:
             else:
                 company_info["podcast_db_id"] = podcast_company.id
         
-        # Hämta aktuella aktiekurser (om företaget finns i nyhetsdatabasen)
         start_date = datetime.utcnow() - timedelta(days=days)
-        stock_prices = []
-        
-        if news_company:
-            stock_prices = (
-                self.news_db.query(NewsStockPrice)
-                .filter(NewsStockPrice.company_id == news_company.id)
-                .filter(NewsStockPrice.date >= start_date)
-                .order_by(NewsStockPrice.date)
-                .all()
-            )
         
-        # Hämta senaste nyheter (om företaget finns i nyhetsdatabasen)
-        news_items = []
-        if news_company:
-            news_items = (
-                self.news_db.query(News)
-                .join(News.companies)
-                .filter(NewsCompany.id == news_company.id)
-                .filter(News.published_at >= start_date)
-                .order_by(desc(News.published_at))
-                .all()
-            )
+        def fetch_stock_prices(sessions):
+            # Kolumnbaserad serie ur kurscachen; intervallet räknas i hela dagar så att cachenyckeln är stabil
+            return get_price_cache().get(sessions["news"], news_company.id, start_date.date()).to_records()
         
-        # Hämta senaste podcasts (om företaget finns i podcast-databasen)
-        podcasts = []
-        if podcast_company:
-            podcasts = (
-                self.podcast_db.query(Podcast)
-                .join(Podcast.companies)
-                .filter(PodcastCompany.id == podcast_company.id)
-                .filter(Podcast.published_at >= start_date)
-                .order_by(desc(Podcast.published_at))
-                .all()
-            )
-        
-        return {
-            "company": company_info,
-            "stock_prices": [
-                {
-                    "date": stock.date.isoformat(),
-                    "open": stock.open_price,
-                    "high": stock.high_price,
-                    "low": stock.low_price,
-                    "close": stock.close_price,
-                    "volume": stock.volume
-                }
-                for stock in stock_prices
-            ],
-            "news": [
+        def fetch_news(sessions):
+            return [
                 {
                     "id": news_item.id,
                     "title": news_item.title,
@@ -261,63 +449,81 @@ class DataProcessor:
                     "summary": news_item.summary,
                     "sentiment": news_item.sentiment
                 }
-                for news_item in news_items
-            ],
-            "podcasts": [
+                for news_item in (
+                    sessions["news"].query(News)
+                    .join(News.companies)
+                    .filter(NewsCompany.id == news_company.id)
+                    .filter(News.published_at >= start_date)
+                    .order_by(desc(News.published_at))
+                )
+            ]
+        
+        def fetch_episodes(sessions):
+            # Avsnitt med omnämnanden av företaget; normaliserade omnämnanden matchas på company_id
+            mention_filter = StockMention.ticker == ticker
+            if news_company:
+                mention_filter = or_(StockMention.company_id == news_company.id, mention_filter)
+            rows = (
+                sessions["podcast"].query(
+                    Episode, Podcast.name.label("podcast_name"),
+                    func.avg(StockMention.sentiment_value).label("sentiment")
+                )
+                .join(StockMention, StockMention.episode_id == Episode.id)
+                .outerjoin(Podcast, Podcast.id == Episode.podcast_id)
+                .filter(mention_filter)
+                .filter(Episode.published_at >= start_date)
+                .group_by(Episode.id, Podcast.name)
+                .order_by(desc(Episode.published_at))
+            )
+            return [
                 {
-                    "id": podcast.id,
-                    "title": podcast.title,
-                    "show_name": podcast.show_name,
-                    "url": podcast.url,
-                    "published_at": podcast.published_at.isoformat(),
-                    "duration": podcast.duration,
-                    "summary": podcast.summary,
-                    "sentiment": podcast.sentiment,
-                    "spotify_id": podcast.spotify_id,
-                    "youtube_id": podcast.youtube_id
+                    "id": episode.id,
+                    "title": episode.title,
+                    "show_name": podcast_name,
+                    "url": episode.video_url,
+                    "published_at": episode.published_at.isoformat(),
+                    "duration": None,
+                    "summary": episode.summary,
+                    "sentiment": sentiment,
+                    "spotify_id": None,
+                    "youtube_id": episode.video_id
                 }
-                for podcast in podcasts
+                for episode, podcast_name, sentiment in rows
             ]
+        
+        # Databaserna är oberoende; frågorna körs samtidigt med en session per uppgift
+        tasks = {"podcasts": fetch_episodes}
+        if news_company:
+            tasks.update(stock_prices=fetch_stock_prices, news=fetch_news)
+        results = self.run_parallel(tasks)
+        
+        return {
+            "company": company_info,
+            "stock_prices": results.get("stock_prices", []),
+            "news": results.get("news", []),
+            "podcasts": results["podcasts"]
         }
     
-    def get_trending_topics(self, days: int = 30) -> Dict[str, Any]:
+    def get_trending_topics(self, days: int = 30, news_db: Session = None, podcast_db: Session = None) -> Dict[str, Any]:
         """
         Identifiera trendande ämnen, mest omnämnda företag och sentiment
         
         :param days: Antal dagar bakåt att analysera
+        :param news_db: Session att använda i stället för processorns (t.ex. i trådpoolen)
+        :param podcast_db: Session att använda i stället för processorns
         :return: Ordbok med trendande ämnen
         """
+        news_db = news_db or self.news_db
+        podcast_db = podcast_db or self.podcast_db
         start_date = datetime.utcnow() - timedelta(days=days)
         
-        # Aggregera företagsomtal från nyheter
-        news_company_mentions = (
-            self.news_db.query(NewsCompany.name, NewsCompany.ticker, func.count(News.id).label('mention_count'))
-            .join(News.companies)
-            .filter(News.published_at >= start_date)
-            .group_by(NewsCompany.name, NewsCompany.ticker)
-            .order_by(desc('mention_count'))
-            .limit(10)
-            .all()
-        )
-        
-        # Aggregera företagsomtal från podcasts
-        podcast_company_mentions = (
-            self.podcast_db.query(
-                StockMention.name, 
-                StockMention.ticker, 
-                func.count(Episode.id).label('mention_count')
-            )
-            .join(Episode.stock_mentions)
-            .filter(Episode.published_at >= start_date)
-            .group_by(StockMention.name, StockMention.ticker)
-            .order_by(desc('mention_count'))
-            .limit(10)
-            .all()
-        )
+        # Företagsomtal summeras ur de dagliga rollup-tabellerna (se mention_rollups.py)
+        news_company_mentions = trending_companies(news_db, SOURCE_NEWS, start_date.date())
+        podcast_company_mentions = trending_companies(podcast_db, SOURCE_PODCAST, start_date.date())
         
         # Analysera övergripande sentimenttrender
         news_sentiment = (
-            self.news_db.query(
+            news_db.query(
                 func.avg(News.sentiment).label('avg_sentiment'),
                 func.count(News.id).label('total_news')
             )
@@ -327,22 +533,8 @@ class DataProcessor:
         
         return {
             "trending_companies": {
-                "from_news": [
-                    {
-                        "name": company.name,
-                        "ticker": company.ticker,
-                        "mention_count": company.mention_count
-                    }
-                    for company in news_company_mentions
-                ],
-                "from_podcasts": [
-                    {
-                        "name": company.name,
-                        "ticker": company.ticker,
-                        "mention_count": company.mention_count
-                    }
-                    for company in podcast_company_mentions
-                ]
+                "from_news": news_company_mentions,
+                "from_podcasts": podcast_company_mentions
             },
             "sentiment_trends": {
                 "news": {
@@ -352,55 +544,26 @@ class DataProcessor:
             }
         }
     
-    def sync_companies(self):
+    def sync_companies(self, page_size: int = COMPANY_SYNC_PAGE_SIZE):
         """
-        Synkronisera företagsinformation mellan databaserna
+        Synkronisera företagsinformation mellan databaserna inkrementellt
+        
+        Varje riktning läser bara källrader som ändrats efter sitt vattenmärke
+        (updated_at, id), sida för sida, och upsertar dem på ticker i måldatabasen.
+        En befintlig målrad skrivs bara över om källraden är nyare. updated_at
+        kopieras från källan, så en synkad rad studsar inte tillbaka.
+        
+        :param page_size: Antal källrader per sida och transaktion
         """
         try:
-            # Hämta alla företag från nyhetsdatabasen
-            news_companies = self.news_db.query(NewsCompany).all()
-            
-            # Hämta alla företag från podcast-databasen
-            podcast_companies = self.podcast_db.query(PodcastCompany).all()
-            
-            # Skapa uppslagstabeller baserade på ticker
-            news_company_dict = {company.ticker: company for company in news_companies}
-            podcast_company_dict = {company.ticker: company for company in podcast_companies}
-            
-            # Synkronisera företag från nyhets- till podcast-databasen
-            for ticker, news_company in news_company_dict.items():
-                if ticker not in podcast_company_dict:
-                    # Skapa företaget i podcast-databasen
-                    new_podcast_company = PodcastCompany(
-                        name=news_company.name,
-                        ticker=news_company.ticker,
-                        sector=news_company.sector,
-                        description=news_company.description,
-                        founded_year=news_company.founded_year
-                    )
-                    self.podcast_db.add(new_podcast_company)
-            
-            # Synkronisera företag från podcast- till nyhets-databasen
-            for ticker, podcast_company in podcast_company_dict.items():
-                if ticker not in news_company_dict:
-                    # Skapa företaget i nyhetsdatabasen
-                    new_news_company = NewsCompany(
-                        name=podcast_company.name,
-                        ticker=podcast_company.ticker,
-                        sector=podcast_company.sector,
-                        description=podcast_company.description,
-                        founded_year=podcast_company.founded_year
-                    )
-                    self.news_db.add(new_news_company)
-            
-            # Commit ändringar
-            self.podcast_db.commit()
-            self.news_db.commit()
-            
-            return {
-                "success": True,
-                "message": f"Synkroniserade {len(news_company_dict)} företag från nyhets-databasen och {len(podcast_company_dict)} från podcast-databasen"
-            }
+            news_to_podcast = self._sync_company_direction(
+                self.news_db, NewsCompany, self.podcast_db, PodcastCompany, PodcastSyncWatermark,
+                "companies:news->podcast", page_size
+            )
+            podcast_to_news = self._sync_company_direction(
+                self.podcast_db, PodcastCompany, self.news_db, NewsCompany, NewsSyncWatermark,
+                "companies:podcast->news", page_size
+            )
         except Exception as e:
             self.podcast_db.rollback()
             self.news_db.rollback()
@@ -409,6 +572,94 @@ class DataProcessor:
                 "success": False,
                 "message": f"Fel vid synkronisering: {str(e)}"
             }
+        
+        company_cache = get_company_cache()
+        if news_to_podcast["upserted"]:
+            company_cache.invalidate("podcast")
+        if podcast_to_news["upserted"]:
+            company_cache.invalidate("news")
+            reset_ticker_normalizer()
+        
+        return {
+            "success": True,
+            "message": f"Synkroniserade {news_to_podcast['upserted']} av {news_to_podcast['scanned']} ändrade företag "
+                       f"från nyhets-databasen och {podcast_to_news['upserted']} av {podcast_to_news['scanned']} "
+                       f"från podcast-databasen",
+            "news_to_podcast": news_to_podcast,
+            "podcast_to_news": podcast_to_news
+        }
+    
+    def _sync_company_direction(self, source: Session, source_model, target: Session, target_model,
+                                watermark_model, name: str, page_size: int) -> Dict[str, int]:
+        """
+        Synka ändrade företag i en riktning och flytta fram vattenmärket per sida
+        
+        :return: {'scanned': lästa källrader, 'upserted': skapade/uppdaterade målrader, 'pages': sidor}
+        """
+        stats = {"scanned": 0, "upserted": 0, "pages": 0}
+        
+        # Rader utan updated_at skulle aldrig passera vattenmärket; ge dem created_at
+        source.execute(
+            update(source_model)
+            .where(source_model.updated_at.is_(None))
+            .values(updated_at=func.coalesce(source_model.created_at, datetime.utcnow()))
+        )
+        source.commit()
+        
+        watermark = target.get(watermark_model, name) or watermark_model(name=name, rows_synced=0)
+        target_table = target_model.__table__
+        upsert = dialect_insert(target)(target_table)
+        upsert = upsert.on_conflict_do_update(
+            index_elements=["ticker"],
+            set_={field: upsert.excluded[field] for field in SYNCED_COMPANY_FIELDS + ("updated_at",)},
+            where=or_(target_table.c.updated_at.is_(None), target_table.c.updated_at < upsert.excluded.updated_at)
+        ).returning(target_table.c.id)
+        
+        while True:
+            # Nyckelbaserad paginering på (updated_at, id) via indexet på updated_at
+            query = (
+                select(source_model.id, source_model.ticker, source_model.created_at, source_model.updated_at,
+                       *[getattr(source_model, field) for field in SYNCED_COMPANY_FIELDS])
+                .order_by(source_model.updated_at, source_model.id)
+                .limit(page_size)
+            )
+            if watermark.last_updated_at is not None:
+                # Det första villkoret låter databasen använda indexet även med OR-villkoret
+                query = query.where(source_model.updated_at >= watermark.last_updated_at).where(or_(
+                    source_model.updated_at > watermark.last_updated_at,
+                    and_(source_model.updated_at == watermark.last_updated_at, source_model.id > watermark.last_id)
+                ))
+            rows = source.execute(query).all()
+            if not rows:
+                break
+            
+            try:
+                result = target.execute(upsert, [{
+                    "ticker": row.ticker,
+                    "created_at": row.created_at,
+                    "updated_at": row.updated_at,
+                    **{field: getattr(row, field) for field in SYNCED_COMPANY_FIELDS}
+                } for row in rows])
+                upserted = len(result.all())
+                
+                # Vattenmärket committas i samma transaktion som sidan
+                watermark.last_updated_at = rows[-1].updated_at
+                watermark.last_id = rows[-1].id
+                watermark.rows_synced = (watermark.rows_synced or 0) + upserted
+                target.add(watermark)
+                target.commit()
+            except Exception:
+                target.rollback()
+                raise
+            
+            stats["scanned"] += len(rows)
+            stats["upserted"] += upserted
+            stats["pages"] += 1
+        
+        if stats["scanned"]:
+            logger.info(f"Företagssynk {name}: {stats['upserted']} av {stats['scanned']} ändrade rader "
+                        f"upsertade på {stats['pages']} sidor")
+        return stats
     
     def create_notification_for_users(self, company_ticker: str, content: str, content_type: str, content_id: int):
         """
@@ -421,11 +672,12 @@ class DataProcessor:
         """
         try:
             # Hitta företaget
-            company = self.news_db.query(NewsCompany).filter(NewsCompany.ticker == company_ticker).first()
+            identity = get_company_cache().get("news", self.news_db, company_ticker)
             
-            if not company:
+            if not identity:
                 logger.warning(f"Kunde inte hitta företag med ticker {company_ticker}")
                 return
+            company = self.news_db.get(NewsCompany, identity.id)
             
             # Hitta användare som bevakar detta företag
             watching_users = company.watching_users
@@ -488,23 +740,36 @@ def fetch_company_insights(ticker: str, dbs: Dict[str, Session]) -> Dict[str, An
     """
     processor = DataProcessor(dbs)
     
+    # Trendande ämnen hämtas i trådpoolen medan företagsdatan hämtas
+    trending_future = processor.submit_task(
+        lambda sessions: processor.get_trending_topics(news_db=sessions.get("news"), podcast_db=sessions.get("podcast"))
+    )
+    
     # Hämta grundläggande företagsdata
     company_data = processor.get_company_data(ticker)
     
     if not company_data:
+        trending_future.cancel()
         return None
     
-    # Hämta trendande ämnen
-    trending_topics = processor.get_trending_topics()
+    # Händelsestudien för företaget (sentiment mot framtida avkastning) körs också i trådpoolen
+    company_id = company_data['company'].get('news_db_id')
+    study_future = processor.submit_task(
+        lambda sessions: get_event_study_cache().get(sessions["news"], sessions.get("podcast"), company_id=company_id)
+    ) if company_id else None
+    
+    trending_topics = trending_future.result()
     
     # Analysera nyheter och podcasts för ytterligare insikter
+    podcast_sentiments = [podcast['sentiment'] for podcast in company_data.get('podcasts', []) if podcast.get('sentiment') is not None]
     detailed_insights = {
         "news_sentiment": sum(news.get('sentiment', 0) for news in company_data.get('news', [])) / len(company_data.get('news', [1])) if company_data.get('news') else 0,
-        "podcast_sentiment": sum(podcast.get('sentiment', 0) for podcast in company_data.get('podcasts', [])) / len(company_data.get('podcasts', [1])) if company_data.get('podcasts') else 0,
+        "podcast_sentiment": sum(podcast_sentiments) / len(podcast_sentiments) if podcast_sentiments else 0,
         "total_mentions": {
             "news": len(company_data.get('news', [])),
             "podcasts": len(company_data.get('podcasts', []))
-        }
+        },
+        "sentiment_event_study": study_future.result()["groups"]["kind"] if study_future else []
     }
     
     return {
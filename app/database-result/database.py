@@ -5,6 +5,7 @@ from config import (
     PODCAST_DB_NAME, NEWS_DB_NAME
 )
 from models import PodcastBase, NewsBase, UserBase
+from migrations import run_migrations
 from contextlib import contextmanager
 
 # Konstruera databas-URLs
@@ -42,6 +43,9 @@ def init_db():
             connection.execute(text("SET session_replication_role = 'replica'"))
             UserBase.metadata.create_all(bind=connection)
             connection.execute(text("SET session_replication_role = 'origin'"))
+        
+        # Nya kolumner i befintliga tabeller
+        run_migrations({"podcast": podcast_engine, "news": news_engine})
             
         print("Databaser initialiserade framgångsrikt")
         
@@ -0,0 +1,383 @@
+"""
+Händelsestudie: förutsäger sentiment i nyheter och podcasts kursrörelser?
+
+Varje nyhet per länkat företag och varje StockMention med känt företag är
+en händelse med tid, sentiment och etiketter (nyhetskälla, podcast,
+rekommendation). Alla stängningskurser läses i en omgång sorterade på
+(företag, tid). Händelserna placeras i kursserien med en enda searchsorted
+över en sammansatt nyckel (företag, tid). Ingångskursen är första kursen
+vid eller efter händelsen, så ingen framtida information används. Därifrån
+räknas avkastningen N handelsdagar (rader) framåt.
+
+Aggregeringen görs med bincount per grupp: antal, medelsentiment och per
+horisont medelavkastning, träffsäkerhet (sentimentets tecken lika med
+avkastningens) och korrelationen mellan sentiment och avkastning.
+
+Podcastomnämnanden utan company_id kopplas via exakt ticker mot
+företagen i news-databasen. Resultaten cachas per parametrar i
+EVENT_STUDY_TTL sekunder.
+
+Användning:
+    python event_study.py [--horizons 1,5,20] [--days 365] [--ticker VOLV-B]
+"""
+import json
+import time
+import logging
+import argparse
+import threading
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import or_, select
+from sqlalchemy.orm import Session
+
+from models import News, NewsCompany, Episode, Podcast, StockMention, company_news
+from price_series import epoch_seconds, load_closes
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HORIZONS = (1, 5, 20)
+# Händelser utan kurs inom så här många sekunder efter händelsen hoppas över
+MAX_ENTRY_GAP = 5 * 86400
+# Sekunder som ett resultat cachas och max antal cachade resultat
+EVENT_STUDY_TTL = 600.0
+EVENT_STUDY_CACHE_SIZE = 64
+
+KIND_NEWS = "news"
+KIND_PODCAST = "podcast"
+GROUP_DIMENSIONS = ("kind", "source", "podcast", "recommendation", "sentiment")
+
+# Sammansatt söknyckel: företags-ID i de höga bitarna, tid (förskjuten till positiv) i de låga
+_TIME_BITS = 34
+_TIME_OFFSET = 1 << 33
+
+
+class Events:
+    __slots__ = ("company_ids", "times", "sentiment", "labels")
+
+    def __init__(self, company_ids: np.ndarray, times: np.ndarray, sentiment: np.ndarray,
+                 labels: Dict[str, np.ndarray]):
+        """
+        Händelser som kolumnarrayer
+
+        :param company_ids: Företags-ID i news-databasen
+        :param times: Tider i epoksekunder
+        :param sentiment: Sentiment som tal (NaN om okänt)
+        :param labels: Dimension -> objektarray med etikett per händelse (None om den inte gäller)
+        """
+        self.company_ids = company_ids
+        self.times = times
+        self.sentiment = sentiment
+        self.labels = labels
+
+    def __len__(self):
+        return len(self.times)
+
+    @staticmethod
+    def concatenate(parts: Sequence["Events"]) -> "Events":
+        return Events(
+            np.concatenate([part.company_ids for part in parts]),
+            np.concatenate([part.times for part in parts]),
+            np.concatenate([part.sentiment for part in parts]),
+            {dimension: np.concatenate([part.labels[dimension] for part in parts]) for dimension in GROUP_DIMENSIONS},
+        )
+
+
+def _sentiment_labels(kind: str, sentiment: np.ndarray) -> np.ndarray:
+    labels = np.full(len(sentiment), None, dtype=object)
+    labels[sentiment > 0] = f"{kind}:positive"
+    labels[sentiment == 0] = f"{kind}:neutral"
+    labels[sentiment < 0] = f"{kind}:negative"
+    return labels
+
+
+def _make_events(kind: str, rows: List[Tuple], labels: Dict[str, int]) -> Events:
+    """
+    :param rows: (company_id, tid, sentiment, ...etiketter)
+    :param labels: Dimension -> kolumnindex i raderna
+    """
+    count = len(rows)
+    columns = list(zip(*rows)) if rows else [()] * (3 + len(labels))
+    sentiment = np.array(columns[2], dtype=np.float64).reshape(count)
+    events = Events(
+        np.array(columns[0], dtype=np.int64).reshape(count),
+        np.array(columns[1], dtype=np.int64).reshape(count),
+        sentiment,
+        {dimension: np.full(count, None, dtype=object) for dimension in GROUP_DIMENSIONS},
+    )
+    events.labels["kind"][:] = kind
+    events.labels["sentiment"] = _sentiment_labels(kind, sentiment)
+    for dimension, index in labels.items():
+        events.labels[dimension][:] = columns[index]
+    return events
+
+
+def load_news_events(news_db: Session, start: Optional[date] = None, end: Optional[date] = None,
+                     company_id: Optional[int] = None) -> Events:
+    """
+    En händelse per (nyhet, länkat företag) med nyhetens sentiment och källa
+    """
+    published = epoch_seconds(News.published_at, news_db.get_bind().dialect.name)
+    query = (
+        select(company_news.c.company_id, published, News.sentiment, News.source)
+        .select_from(News)
+        .join(company_news, company_news.c.news_id == News.id)
+    )
+    query = _filter_range(query, News.published_at, start, end)
+    if company_id is not None:
+        query = query.where(company_news.c.company_id == company_id)
+    return _make_events(KIND_NEWS, news_db.execute(query).all(), {"source": 3})
+
+
+def load_podcast_events(podcast_db: Session, news_db: Session, start: Optional[date] = None,
+                        end: Optional[date] = None, company_id: Optional[int] = None) -> Events:
+    """
+    En händelse per StockMention med numeriskt sentiment, podcast och rekommendationskod
+    """
+    published = epoch_seconds(Episode.published_at, podcast_db.get_bind().dialect.name)
+    query = (
+        select(StockMention.company_id, StockMention.ticker, published, StockMention.sentiment_value,
+               Podcast.name, StockMention.recommendation_code)
+        .select_from(StockMention)
+        .join(Episode, Episode.id == StockMention.episode_id)
+        .outerjoin(Podcast, Podcast.id == Episode.podcast_id)
+    )
+    query = _filter_range(query, Episode.published_at, start, end)
+
+    # Omnämnanden utan kanoniskt företag kopplas på exakt ticker
+    if company_id is not None:
+        # Ett enskilt företag: filtrera i SQL och slå bara upp dess egen ticker
+        ticker = news_db.scalar(select(NewsCompany.ticker).where(NewsCompany.id == company_id))
+        match = StockMention.company_id == company_id
+        if ticker:
+            match = or_(match, (StockMention.company_id.is_(None)) & (StockMention.ticker == ticker))
+        query = query.where(match)
+        ticker_ids = {ticker: company_id} if ticker else {}
+    else:
+        ticker_ids = dict(news_db.execute(select(NewsCompany.ticker, NewsCompany.id)).all())
+    resolved = []
+    for mention_company, ticker, published_at, sentiment, podcast, recommendation in podcast_db.execute(query):
+        mention_company = mention_company if mention_company is not None else ticker_ids.get(ticker)
+        if mention_company is None:
+            continue
+        resolved.append((mention_company, published_at, sentiment, podcast, recommendation))
+    return _make_events(KIND_PODCAST, resolved, {"podcast": 3, "recommendation": 4})
+
+
+def _filter_range(query, column, start: Optional[date], end: Optional[date]):
+    query = query.where(column.isnot(None))
+    if start:
+        query = query.where(column >= datetime.combine(start, datetime.min.time()))
+    if end:
+        query = query.where(column < datetime.combine(end + timedelta(days=1), datetime.min.time()))
+    return query
+
+
+def _composite_key(company_ids: np.ndarray, times: np.ndarray) -> np.ndarray:
+    return (company_ids << _TIME_BITS) + (times + _TIME_OFFSET)
+
+
+def forward_returns(events: Events, price_companies: np.ndarray, price_times: np.ndarray,
+                    closes: np.ndarray, horizons: Sequence[int]) -> np.ndarray:
+    """
+    Avkastning från första kursen vid eller efter varje händelse till N rader senare
+
+    :param price_companies: Företags-ID per kurs, sorterat på (företag, tid)
+    :param price_times: Tider i epoksekunder
+    :param closes: Stängningskurser
+    :return: Matris (händelser x horisonter), NaN där kurs saknas
+    """
+    result = np.full((len(events), len(horizons)), np.nan)
+    if not len(events) or not len(closes):
+        return result
+    entry = np.searchsorted(_composite_key(price_companies, price_times),
+                            _composite_key(events.company_ids, events.times), side="left")
+    last = len(closes) - 1
+    entry_clipped = np.minimum(entry, last)
+    has_entry = (
+        (entry <= last)
+        & (price_companies[entry_clipped] == events.company_ids)
+        & (price_times[entry_clipped] - events.times <= MAX_ENTRY_GAP)
+    )
+    for column, horizon in enumerate(horizons):
+        target = np.minimum(entry_clipped + horizon, last)
+        valid = has_entry & (entry + horizon <= last) & (price_companies[target] == events.company_ids)
+        result[valid, column] = closes[target[valid]] / closes[entry_clipped[valid]] - 1.0
+    return result
+
+
+def _ratio(numerator: np.ndarray, denominator: np.ndarray) -> np.ndarray:
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(denominator > 0, numerator / np.where(denominator > 0, denominator, 1), np.nan)
+
+
+def _value(number) -> Optional[float]:
+    return None if number is None or np.isnan(number) else round(float(number), 6)
+
+
+def aggregate(labels: np.ndarray, sentiment: np.ndarray, returns: np.ndarray,
+              horizons: Sequence[int]) -> List[Dict[str, Any]]:
+    """
+    Statistik per etikett (händelser utan etikett räknas inte)
+    """
+    present = np.array([label is not None for label in labels], dtype=bool)
+    if not present.any():
+        return []
+    names, inverse = np.unique(labels[present].astype(str), return_inverse=True)
+    sentiment = sentiment[present]
+    returns = returns[present]
+    groups = len(names)
+
+    def total(weights):
+        return np.bincount(inverse, weights=weights, minlength=groups)
+
+    known = ~np.isnan(sentiment)
+    sentiment_zeroed = np.where(known, sentiment, 0.0)
+    statistics = {
+        "events": total(None),
+        "average_sentiment": _ratio(total(sentiment_zeroed), total(known)),
+    }
+    for column, horizon in enumerate(horizons):
+        forward = returns[:, column]
+        has_return = ~np.isnan(forward)
+        forward_zeroed = np.where(has_return, forward, 0.0)
+        both = (known & has_return).astype(np.float64)
+        x, y = sentiment_zeroed * both, forward_zeroed * both
+        n, sx, sy = total(both), total(x), total(y)
+        covariance = n * total(x * y) - sx * sy
+        spread = np.sqrt(np.maximum(n * total(x * x) - sx * sx, 0.0) * np.maximum(n * total(y * y) - sy * sy, 0.0))
+        directional = both.astype(bool) & (sentiment_zeroed != 0)
+        hits = directional & (np.sign(sentiment_zeroed) == np.sign(forward_zeroed))
+        statistics[horizon] = {
+            "n": total(has_return),
+            "mean_return": _ratio(total(forward_zeroed), total(has_return)),
+            "hit_rate": _ratio(total(hits), total(directional)),
+            "correlation": _ratio(covariance, spread),
+        }
+
+    result = []
+    for group, name in enumerate(names):
+        result.append({
+            "key": str(name),
+            "events": int(statistics["events"][group]),
+            "average_sentiment": _value(statistics["average_sentiment"][group]),
+            "horizons": {
+                str(horizon): {
+                    "n": int(statistics[horizon]["n"][group]),
+                    "mean_return": _value(statistics[horizon]["mean_return"][group]),
+                    "hit_rate": _value(statistics[horizon]["hit_rate"][group]),
+                    "correlation": _value(statistics[horizon]["correlation"][group]),
+                }
+                for horizon in horizons
+            },
+        })
+    return sorted(result, key=lambda item: -item["events"])
+
+
+def run_event_study(news_db: Session, podcast_db: Optional[Session], horizons: Sequence[int] = DEFAULT_HORIZONS,
+                    start: Optional[date] = None, end: Optional[date] = None,
+                    company_id: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Kör händelsestudien över alla företag (eller ett) i en omgång
+
+    :param horizons: Horisonter i handelsdagar
+    :param start: Första dag för händelser (None = från början)
+    :param end: Sista dag för händelser (None = till slutet)
+    :param company_id: Begränsa till ett företag (ID i news-databasen)
+    """
+    started = time.perf_counter()
+    horizons = tuple(sorted(set(horizons)))
+    parts = [load_news_events(news_db, start, end, company_id)]
+    if podcast_db is not None:
+        parts.append(load_podcast_events(podcast_db, news_db, start, end, company_id))
+    events = Events.concatenate(parts)
+
+    price_companies, price_times, closes = load_closes(news_db, company_id)
+    returns = forward_returns(events, price_companies, price_times, closes, horizons)
+
+    return {
+        "horizons": list(horizons),
+        "start": start.isoformat() if start else None,
+        "end": end.isoformat() if end else None,
+        "events": len(events),
+        "events_with_prices": int((~np.isnan(returns[:, 0])).sum()) if len(horizons) else 0,
+        "price_rows": len(closes),
+        "groups": {
+            dimension: aggregate(events.labels[dimension], events.sentiment, returns, horizons)
+            for dimension in GROUP_DIMENSIONS
+        },
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
+
+
+class EventStudyCache:
+    def __init__(self, ttl: float = EVENT_STUDY_TTL, max_entries: int = EVENT_STUDY_CACHE_SIZE,
+                 clock=time.monotonic):
+        """
+        Tidsbegränsad cache för händelsestudier per parametrar
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        self._entries: Dict[Tuple, Tuple[float, Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, news_db: Session, podcast_db: Optional[Session], horizons: Sequence[int] = DEFAULT_HORIZONS,
+            start: Optional[date] = None, end: Optional[date] = None,
+            company_id: Optional[int] = None) -> Dict[str, Any]:
+        key = (tuple(sorted(set(horizons))), start, end, company_id, podcast_db is not None)
+        now = self.clock()
+        with self._lock:
+            cached = self._entries.get(key)
+        if cached is not None and now - cached[0] < self.ttl:
+            return cached[1]
+
+        result = run_event_study(news_db, podcast_db, horizons, start, end, company_id)
+        with self._lock:
+            self._entries[key] = (now, result)
+            if len(self._entries) > self.max_entries:
+                oldest = min(self._entries, key=lambda entry: self._entries[entry][0])
+                del self._entries[oldest]
+        return result
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_event_study_cache = EventStudyCache()
+
+
+def get_event_study_cache() -> EventStudyCache:
+    """
+    Delad cache för händelsestudier i processen
+    """
+    return _event_study_cache
+
+
+def main():
+    from database import get_news_db, get_podcast_db
+
+    parser = argparse.ArgumentParser(description="Sentiment mot framtida avkastning")
+    parser.add_argument("--horizons", default="1,5,20", help="Horisonter i handelsdagar, kommaseparerade")
+    parser.add_argument("--days", type=int, help="Bara händelser de senaste N dagarna")
+    parser.add_argument("--ticker", help="Begränsa till ett företag")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    horizons = [int(part) for part in args.horizons.split(",") if part.strip()]
+    start = date.today() - timedelta(days=args.days) if args.days else None
+
+    with get_news_db() as news_db, get_podcast_db() as podcast_db:
+        company_id = None
+        if args.ticker:
+            company_id = news_db.execute(select(NewsCompany.id).where(NewsCompany.ticker == args.ticker)).scalar()
+            if company_id is None:
+                parser.error(f"Okänd ticker: {args.ticker}")
+        print(json.dumps(run_event_study(news_db, podcast_db, horizons, start, company_id=company_id),
+                         indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+"""
+Vektoriserade tekniska indikatorer över kolumnbaserade kursserier
+
+Indikatorerna räknas med NumPy på hela matriser: serierna för flera
+företag läggs i en matris (ett företag per rad, vänsterutfylld med NaN så
+att senaste kursen hamnar i sista kolumnen) och varje indikator räknas för
+alla rader samtidigt. Glidande fönster (SMA, volatilitet) räknas som
+differenser av kumulativa summor, O(n) oavsett fönsterlängd; fönster som
+når in i utfyllnaden blir NaN. EMA och RSI är rekursiva och löses i sluten
+form per block (se _ewm).
+
+- returns / log_returns: enkel och logaritmisk dagsavkastning
+- sma_<n>: glidande medelvärde av stängningskursen
+- ema_<n>: exponentiellt medelvärde, alpha = 2 / (n + 1), startar på första kursen
+- rsi: Wilders RSI (alpha = 1 / n), NaN under de första n förändringarna
+- volatility: rullande standardavvikelse av log-avkastningen, årstakt (252 dagar)
+- drawdown: avstånd från högsta stängningskurs hittills
+
+Resultaten cachas per (seriens version, parametrar); en omladdad serie får
+ny version (se price_series.py) och räknas om.
+"""
+import threading
+from collections import OrderedDict, namedtuple
+from typing import Any, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from price_series import PriceSeries
+
+TRADING_DAYS = 252
+INDICATOR_CACHE_SIZE = 1024
+
+IndicatorParams = namedtuple(
+    "IndicatorParams", ["sma_windows", "ema_spans", "rsi_window", "volatility_window"],
+    defaults=[(20, 50), (12, 26), 14, 20]
+)
+
+
+def stack_closes(series_list: Sequence[PriceSeries]) -> np.ndarray:
+    """
+    Stängningskurser som matris (företag x tid), vänsterutfylld med NaN
+    """
+    width = max((len(series) for series in series_list), default=0)
+    matrix = np.full((len(series_list), width), np.nan)
+    for row, series in enumerate(series_list):
+        if len(series):
+            matrix[row, width - len(series):] = series.close
+    return matrix
+
+
+def returns(close: np.ndarray) -> np.ndarray:
+    result = np.full_like(close, np.nan)
+    result[..., 1:] = close[..., 1:] / close[..., :-1] - 1.0
+    return result
+
+
+def log_returns(close: np.ndarray) -> np.ndarray:
+    result = np.full_like(close, np.nan)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        result[..., 1:] = np.log(close[..., 1:] / close[..., :-1])
+    return result
+
+
+def _window_sums(values: np.ndarray, window: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Glidande summor längs sista axeln via kumulativ summa (O(n) oavsett fönster)
+
+    :return: (summor, antal giltiga värden i fönstret), båda med samma form som values
+    """
+    valid = ~np.isnan(values)
+    sums = np.full_like(values, np.nan)
+    counts = np.zeros(values.shape)
+    if values.shape[-1] >= window:
+        padding = [(0, 0)] * (values.ndim - 1) + [(1, 0)]
+        cumulative = np.pad(np.cumsum(np.where(valid, values, 0.0), axis=-1), padding)
+        cumulative_valid = np.pad(np.cumsum(valid, axis=-1), padding)
+        sums[..., window - 1:] = cumulative[..., window:] - cumulative[..., :-window]
+        counts[..., window - 1:] = cumulative_valid[..., window:] - cumulative_valid[..., :-window]
+    return sums, counts
+
+
+def sma(close: np.ndarray, window: int) -> np.ndarray:
+    sums, counts = _window_sums(close, window)
+    # Fönster som når in i utfyllnaden blir NaN
+    return np.where(counts == window, sums / window, np.nan)
+
+
+def rolling_volatility(close: np.ndarray, window: int) -> np.ndarray:
+    """
+    Rullande standardavvikelse (ddof=1) av log-avkastningen i årstakt
+    """
+    log_return = log_returns(close)
+    # Centrera per rad innan kvadratsummorna så att E[x²] - E[x]² inte tappar precision
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.nansum(log_return, axis=-1, keepdims=True) / np.sum(~np.isnan(log_return), axis=-1, keepdims=True)
+    centered = log_return - mean
+    sums, counts = _window_sums(centered, window)
+    squares, _ = _window_sums(centered * centered, window)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        variance = np.maximum(squares - sums * sums / window, 0.0) / (window - 1)
+    return np.where(counts == window, np.sqrt(variance) * np.sqrt(TRADING_DAYS), np.nan)
+
+
+def _ewm(values: np.ndarray, alpha: float) -> np.ndarray:
+    """
+    Rekursivt exponentiellt medelvärde längs sista axeln, y[t] = (1 - alpha) * y[t-1] + alpha * x[t]
+
+    Varje rad startar på sitt första värde som inte är NaN (NaN får bara
+    förekomma som utfyllnad i början). Rekursionen löses i sluten form per
+    block: inom ett block är y = d^j * (carry * d + cumsum(u * d^-i)), och
+    blocken görs så korta att d^-i inte kan svämma över.
+    """
+    values = np.atleast_2d(values)
+    if alpha >= 1.0 or not values.size:
+        return values.copy()
+    decay = 1.0 - alpha
+    padding = np.isnan(values)
+    first = np.argmax(~padding, axis=1)
+    # Första värdet tas med helt (y = x), resten viktas med alpha
+    inputs = np.where(padding, 0.0, alpha * values)
+    rows = np.arange(values.shape[0])
+    inputs[rows, first] = np.where(padding[rows, first], 0.0, values[rows, first])
+
+    block = max(1, int(250.0 / -np.log(decay)))
+    result = np.empty_like(values)
+    carry = np.zeros(values.shape[0])
+    for start in range(0, values.shape[1], block):
+        chunk = inputs[:, start:start + block]
+        powers = decay ** np.arange(chunk.shape[1])
+        result[:, start:start + block] = powers * (carry[:, None] * decay + np.cumsum(chunk / powers, axis=1))
+        carry = result[:, start + chunk.shape[1] - 1]
+    result[padding] = np.nan
+    return result
+
+
+def ema(close: np.ndarray, span: int) -> np.ndarray:
+    return _ewm(close, 2.0 / (span + 1)).reshape(close.shape)
+
+
+def rsi(close: np.ndarray, window: int = 14) -> np.ndarray:
+    """
+    Wilders RSI; NaN tills `window` förändringar finns
+    """
+    close2d = np.atleast_2d(close)
+    change = np.full_like(close2d, np.nan)
+    change[:, 1:] = np.diff(close2d, axis=1)
+    average_gain = _ewm(np.where(np.isnan(change), np.nan, np.maximum(change, 0.0)), 1.0 / window)
+    average_loss = _ewm(np.where(np.isnan(change), np.nan, np.maximum(-change, 0.0)), 1.0 / window)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        result = np.where(average_loss == 0.0, 100.0, 100.0 - 100.0 / (1.0 + average_gain / average_loss))
+    # Antal förändringar hittills per position (utfyllnaden räknas inte)
+    seen = np.cumsum(~np.isnan(change), axis=1)
+    result[(seen < window) | np.isnan(average_gain)] = np.nan
+    return result.reshape(close.shape)
+
+
+def drawdown(close: np.ndarray) -> np.ndarray:
+    """
+    Andel under högsta stängningskurs hittills (0 vid ny topp, negativt annars)
+    """
+    return close / np.fmax.accumulate(close, axis=-1) - 1.0
+
+
+def compute_indicators_batch(series_list: Sequence[PriceSeries],
+                             params: IndicatorParams = IndicatorParams()) -> List[Dict[str, np.ndarray]]:
+    """
+    Räkna alla indikatorer för flera serier på en gång
+
+    :param series_list: Kursserier (olika längd går bra)
+    :param params: Fönster och spann
+    :return: En ordbok per serie med indikatornamn -> array (samma längd som serien)
+    """
+    close = stack_closes(series_list)
+    columns = {
+        "returns": returns(close),
+        "log_returns": log_returns(close),
+        "rsi": rsi(close, params.rsi_window),
+        "volatility": rolling_volatility(close, params.volatility_window),
+        "drawdown": drawdown(close),
+    }
+    for window in params.sma_windows:
+        columns[f"sma_{window}"] = sma(close, window)
+    for span in params.ema_spans:
+        columns[f"ema_{span}"] = ema(close, span)
+
+    width = close.shape[1]
+    results = []
+    for row, series in enumerate(series_list):
+        offset = width - len(series)
+        result = {}
+        for name, matrix in columns.items():
+            values = np.ascontiguousarray(matrix[row, offset:])
+            values.flags.writeable = False
+            result[name] = values
+        results.append(result)
+    return results
+
+
+def summarize(series: PriceSeries, indicators: Dict[str, np.ndarray]) -> Dict[str, Any]:
+    """
+    Senaste värdet per indikator samt största nedgång och total avkastning
+    """
+    def latest(values):
+        return None if not len(values) or np.isnan(values[-1]) else float(values[-1])
+
+    summary = {name: latest(values) for name, values in indicators.items()}
+    summary["max_drawdown"] = float(np.nanmin(indicators["drawdown"])) if len(series) else None
+    summary["total_return"] = float(series.close[-1] / series.close[0] - 1.0) if len(series) else None
+    return summary
+
+
+def indicator_columns(series: PriceSeries, indicators: Dict[str, np.ndarray]) -> Dict[str, Any]:
+    """
+    Kolumnformat för JSON: tider i epoksekunder och NaN som null
+    """
+    columns = {"date_unit": "s", "date": series.dates.tolist(), "close": series.close.tolist()}
+    for name, values in indicators.items():
+        columns[name] = np.where(np.isnan(values), None, values).tolist()
+    return columns
+
+
+class IndicatorCache:
+    def __init__(self, max_entries: int = INDICATOR_CACHE_SIZE):
+        """
+        LRU-cache för indikatorer per (seriens version, parametrar)
+        """
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Any, Dict[str, np.ndarray]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0}
+
+    def get_batch(self, series_list: Sequence[PriceSeries],
+                  params: IndicatorParams = IndicatorParams()) -> List[Dict[str, np.ndarray]]:
+        """
+        Indikatorer för flera serier; serier som saknas i cachen räknas tillsammans i en batch
+
+        Serier utan version (t.ex. nedsamplade) cachas inte.
+        """
+        results: List[Any] = [None] * len(series_list)
+        missing = []
+        with self._lock:
+            for index, series in enumerate(series_list):
+                cached = self._entries.get((series.version, params)) if series.version is not None else None
+                if cached is not None:
+                    self._entries.move_to_end((series.version, params))
+                    results[index] = cached
+                    self._counters["hits"] += 1
+                else:
+                    missing.append(index)
+                    self._counters["misses"] += 1
+
+        if missing:
+            computed = compute_indicators_batch([series_list[index] for index in missing], params)
+            with self._lock:
+                for index, indicators in zip(missing, computed):
+                    results[index] = indicators
+                    if series_list[index].version is not None:
+                        self._entries[(series_list[index].version, params)] = indicators
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return results
+
+    def get(self, series: PriceSeries, params: IndicatorParams = IndicatorParams()) -> Dict[str, np.ndarray]:
+        return self.get_batch([series], params)[0]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+            counters["entries"] = len(self._entries)
+        lookups = counters["hits"] + counters["misses"]
+        counters["hit_rate"] = round(counters["hits"] / lookups, 3) if lookups else 0.0
+        return counters
+
+
+_indicator_cache = IndicatorCache()
+
+
+def get_indicator_cache() -> IndicatorCache:
+    """
+    Delad indikatorcache för processen
+    """
+    return _indicator_cache
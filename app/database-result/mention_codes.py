@@ -0,0 +1,100 @@
+"""
+Normaliserade sentiment- och rekommendationskoder för aktieomnämnanden
+
+Podcastanalyserna sparar sentiment och rekommendation som fritext
+("positive", "Positivt", "köp", "Buy", ...). Texten tolkas en gång när raden
+skrivs och lagras i StockMention.sentiment_value (1, 0, -1 eller NULL) och
+StockMention.recommendation_code ("buy", "hold", "sell" eller "none"), så att
+fördelningar och medelvärden kan räknas med AVG och COUNT(...) FILTER i SQL.
+Befintliga rader fylls i av migreringen i migrations.py.
+"""
+from typing import List, Optional
+
+from sqlalchemy import case, func, or_, update
+
+from models import StockMention
+
+# Delsträngar i den gemena texten, i den ordning de prövas
+SENTIMENT_PATTERNS = (("positiv", 1.0), ("negativ", -1.0), ("neutral", 0.0))
+RECOMMENDATION_PATTERNS = (("buy", ("köp", "buy")), ("sell", ("sälj", "sell")), ("hold", ("håll", "hold")))
+RECOMMENDATION_NONE = "none"
+RECOMMENDATION_CODES = ("buy", "hold", "sell", RECOMMENDATION_NONE)
+
+
+def sentiment_value(text: Optional[str]) -> Optional[float]:
+    """
+    Sentimenttext som tal: 1 positivt, 0 neutralt, -1 negativt, None okänt
+    """
+    lowered = (text or "").lower()
+    for pattern, value in SENTIMENT_PATTERNS:
+        if pattern in lowered:
+            return value
+    return None
+
+
+def recommendation_code(text: Optional[str]) -> str:
+    """
+    Rekommendationstext som kod: "buy", "sell", "hold" eller "none"
+    """
+    lowered = (text or "").lower()
+    for code, patterns in RECOMMENDATION_PATTERNS:
+        if any(pattern in lowered for pattern in patterns):
+            return code
+    return RECOMMENDATION_NONE
+
+
+def sentiment_value_sql(column):
+    """
+    SQL-motsvarigheten till sentiment_value för en textkolumn
+    """
+    lowered = func.lower(column)
+    return case(*[(lowered.like(f"%{pattern}%"), value) for pattern, value in SENTIMENT_PATTERNS])
+
+
+def recommendation_code_sql(column):
+    """
+    SQL-motsvarigheten till recommendation_code för en textkolumn
+    """
+    lowered = func.lower(column)
+    return case(
+        *[(or_(*[lowered.like(f"%{pattern}%") for pattern in patterns]), code)
+          for code, patterns in RECOMMENDATION_PATTERNS],
+        else_=RECOMMENDATION_NONE
+    )
+
+
+def backfill_mention_codes(connection) -> int:
+    """
+    Fyll i koderna för omnämnanden som saknar dem (recommendation_code är aldrig NULL efter tolkning)
+
+    :param connection: Anslutning i en öppen transaktion mot podcast-databasen
+    :return: Antal uppdaterade rader
+    """
+    result = connection.execute(
+        update(StockMention.__table__)
+        .where(StockMention.__table__.c.recommendation_code.is_(None))
+        .values(
+            sentiment_value=sentiment_value_sql(StockMention.__table__.c.sentiment),
+            recommendation_code=recommendation_code_sql(StockMention.__table__.c.recommendation)
+        )
+    )
+    return max(result.rowcount, 0)
+
+
+def mention_distribution_columns() -> List:
+    """
+    Kolumner för sentiment- och rekommendationsfördelning i en och samma grupperade fråga
+
+    Omnämnanden utan känt sentiment räknas som neutrala.
+    """
+    value = StockMention.sentiment_value
+    code = StockMention.recommendation_code
+    return [
+        func.count(StockMention.id).label("mentions"),
+        func.count(StockMention.id).filter(value > 0).label("positive"),
+        func.count(StockMention.id).filter(or_(value == 0, value.is_(None))).label("neutral"),
+        func.count(StockMention.id).filter(value < 0).label("negative"),
+        func.avg(value).label("average_sentiment"),
+        *[func.count(StockMention.id).filter(code == recommendation).label(recommendation)
+          for recommendation in RECOMMENDATION_CODES],
+    ]
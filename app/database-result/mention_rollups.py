@@ -0,0 +1,323 @@
+"""
+Dagliga omnämnanden per ticker och källa för trendberäkningar
+
+Tabellen mention_daily_rollups har en rad per (datum, ticker, källa) med
+antal omnämnanden samt summa och antal för de kända sentimentvärdena.
+Nyhetsvägen i DataProcessor och podcastskrivaren lägger till sina
+omnämnanden i samma transaktion som raderna själva. En trendfråga över
+valfritt fönster blir då en intervallsökning på datum och en summering
+över några hundra rader i stället för en join över alla nyheter och
+omnämnanden.
+
+Nyheter räknas per (artikel, länkat företag) med artikelns sentiment.
+Podcastomnämnanden räknas per StockMention-rad på avsnittets
+publiceringsdag med sentiment_value; saknas tickern används namnet som nyckel.
+
+Användning:
+    python mention_rollups.py backfill [--source news|podcast|all] [--start 2024-01-01] [--end 2024-12-31]
+    python mention_rollups.py trending [--days 30] [--limit 10]
+"""
+import logging
+import argparse
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, desc, func, literal, literal_column, select
+from sqlalchemy.orm import Session
+
+from models import News, NewsCompany, Episode, StockMention, NewsMentionRollup, PodcastMentionRollup, company_news
+
+logger = logging.getLogger(__name__)
+
+SOURCE_NEWS = "news"
+SOURCE_PODCAST = "podcast"
+ROLLUP_MODELS = {SOURCE_NEWS: NewsMentionRollup, SOURCE_PODCAST: PodcastMentionRollup}
+
+# Rader per INSERT-sats
+ROLLUP_CHUNK_SIZE = 500
+
+
+def mention_key(ticker: Optional[str], name: Optional[str]) -> str:
+    """
+    Rollup-nyckel för ett omnämnande: tickern, eller namnet när tickern saknas
+    """
+    return (ticker or name or "")[:50]
+
+
+class RollupDeltas:
+    def __init__(self, source: str):
+        """
+        Samlar ändringar per (datum, ticker) innan de skrivs i bulk
+
+        :param source: "news" eller "podcast"
+        """
+        self.source = source
+        self._rows: Dict[Tuple[date, str], List[Any]] = {}
+
+    def add(self, day: date, ticker: str, name: Optional[str], sentiment: Optional[float], count: int = 1):
+        """
+        Lägg till (eller med count=-1 ta bort) ett omnämnande
+
+        :param day: Publiceringsdag
+        :param ticker: Rollup-nyckel (se mention_key)
+        :param name: Visningsnamn
+        :param sentiment: Sentiment som tal, None om okänt
+        """
+        if not ticker:
+            return
+        row = self._rows.setdefault((day, ticker), [name, 0, 0.0, 0])
+        row[0] = name or row[0]
+        row[1] += count
+        if sentiment is not None:
+            row[2] += sentiment * count
+            row[3] += count
+
+    def __len__(self):
+        return len(self._rows)
+
+    def rows(self) -> List[Dict[str, Any]]:
+        # Sorterade nycklar så att samtidiga skrivare låser rader i samma ordning
+        return [
+            {"date": day, "ticker": ticker, "source": self.source, "name": name,
+             "mention_count": count, "sentiment_sum": sentiment_sum, "sentiment_n": sentiment_n}
+            for (day, ticker), (name, count, sentiment_sum, sentiment_n) in sorted(self._rows.items())
+        ]
+
+
+def apply_rollup_deltas(session: Session, deltas: RollupDeltas) -> int:
+    """
+    Addera ändringarna till rollup-tabellen (ingen commit; körs i anroparens transaktion)
+
+    :return: Antal berörda (datum, ticker)-rader
+    """
+    if not deltas:
+        return 0
+    table = ROLLUP_MODELS[deltas.source].__table__
+    if session.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    statement = dialect_insert(table)
+    statement = statement.on_conflict_do_update(
+        index_elements=["date", "ticker", "source"],
+        set_={
+            "name": func.coalesce(statement.excluded.name, table.c.name),
+            "mention_count": table.c.mention_count + statement.excluded.mention_count,
+            "sentiment_sum": table.c.sentiment_sum + statement.excluded.sentiment_sum,
+            "sentiment_n": table.c.sentiment_n + statement.excluded.sentiment_n,
+        }
+    )
+    rows = deltas.rows()
+    for start in range(0, len(rows), ROLLUP_CHUNK_SIZE):
+        session.execute(statement, rows[start:start + ROLLUP_CHUNK_SIZE])
+    return len(rows)
+
+
+def news_deltas(articles) -> RollupDeltas:
+    """
+    Rollup-ändringar för nya nyheter
+
+    :param articles: Iterable med (published_at, sentiment, [(ticker, namn), ...]) per artikel,
+                     där listan innehåller artikelns länkade företag
+    """
+    deltas = RollupDeltas(SOURCE_NEWS)
+    for published_at, sentiment, companies in articles:
+        if published_at is None:
+            continue
+        for ticker, name in companies:
+            deltas.add(published_at.date(), mention_key(ticker, name), name, sentiment)
+    return deltas
+
+
+def _day_bounds(model_column, start: Optional[date], end: Optional[date]):
+    conditions = [model_column.isnot(None)]
+    if start:
+        conditions.append(model_column >= datetime.combine(start, datetime.min.time()))
+    if end:
+        conditions.append(model_column < datetime.combine(end + timedelta(days=1), datetime.min.time()))
+    return conditions
+
+
+def _insert_aggregate(executor, source: str, aggregate) -> int:
+    # executor är en Session eller en Connection; anroparen äger transaktionen
+    model = ROLLUP_MODELS[source]
+    result = executor.execute(
+        model.__table__.insert().from_select(
+            ["date", "ticker", "source", "name", "mention_count", "sentiment_sum", "sentiment_n"], aggregate
+        )
+    )
+    return max(result.rowcount, 0)
+
+
+def _replace_range(session: Session, source: str, aggregate, start: Optional[date], end: Optional[date]) -> int:
+    model = ROLLUP_MODELS[source]
+    cleanup = delete(model).where(model.source == source)
+    if start:
+        cleanup = cleanup.where(model.date >= start)
+    if end:
+        cleanup = cleanup.where(model.date <= end)
+    session.execute(cleanup)
+    written = _insert_aggregate(session, source, aggregate)
+    session.commit()
+    return written
+
+
+def _news_aggregate(start: Optional[date], end: Optional[date]):
+    day = func.date(News.published_at)
+    aggregate = (
+        select(
+            day, NewsCompany.ticker, literal(SOURCE_NEWS), func.max(NewsCompany.name), func.count(),
+            func.coalesce(func.sum(News.sentiment), 0.0), func.count(News.sentiment)
+        )
+        .select_from(News)
+        .join(company_news, company_news.c.news_id == News.id)
+        .join(NewsCompany, NewsCompany.id == company_news.c.company_id)
+        .where(*_day_bounds(News.published_at, start, end))
+        .group_by(day, NewsCompany.ticker)
+    )
+    return aggregate
+
+
+def _podcast_aggregate(start: Optional[date], end: Optional[date]):
+    day = func.date(Episode.published_at)
+    # Samma nyckel som mention_key; literal_column så att GROUP BY-uttrycket blir identiskt i PostgreSQL
+    key = func.coalesce(
+        func.nullif(StockMention.ticker, literal_column("''")),
+        func.substr(StockMention.name, literal_column("1"), literal_column("50"))
+    )
+    sentiment = StockMention.sentiment_value
+    aggregate = (
+        select(
+            day, key, literal(SOURCE_PODCAST), func.max(StockMention.name), func.count(),
+            func.coalesce(func.sum(sentiment), 0.0), func.count(sentiment)
+        )
+        .select_from(StockMention)
+        .join(Episode, Episode.id == StockMention.episode_id)
+        .where(*_day_bounds(Episode.published_at, start, end))
+        .group_by(day, key)
+    )
+    return aggregate
+
+
+AGGREGATES = {SOURCE_NEWS: _news_aggregate, SOURCE_PODCAST: _podcast_aggregate}
+
+
+def backfill_news(news_db: Session, start: Optional[date] = None, end: Optional[date] = None) -> int:
+    """
+    Bygg om nyhetsrollups för ett datumintervall från news × company_news
+
+    :param start: Första dag (None = från början)
+    :param end: Sista dag (None = till slutet)
+    :return: Antal skrivna rollup-rader
+    """
+    return _replace_range(news_db, SOURCE_NEWS, _news_aggregate(start, end), start, end)
+
+
+def backfill_podcasts(podcast_db: Session, start: Optional[date] = None, end: Optional[date] = None) -> int:
+    """
+    Bygg om podcastrollups för ett datumintervall från stock_mentions × episodes
+
+    :param start: Första dag (None = från början)
+    :param end: Sista dag (None = till slutet)
+    :return: Antal skrivna rollup-rader
+    """
+    return _replace_range(podcast_db, SOURCE_PODCAST, _podcast_aggregate(start, end), start, end)
+
+
+def _backfill_if_empty(connection, source: str) -> int:
+    model = ROLLUP_MODELS[source]
+    if connection.execute(select(model.date).where(model.source == source).limit(1)).first() is not None:
+        return 0
+    return _insert_aggregate(connection, source, AGGREGATES[source](None, None))
+
+
+def backfill_news_if_empty(connection) -> int:
+    """
+    Engångsbackfill av nyhetsrollups när tabellen är tom (körs vid init_db)
+
+    Tabellen skapas tom i en befintlig databas; utan detta steg skulle
+    trendfrågorna inte hitta något förrän backfill körts för hand.
+
+    :param connection: Anslutning i en öppen transaktion mot news-databasen
+    :return: Antal skrivna rollup-rader
+    """
+    return _backfill_if_empty(connection, SOURCE_NEWS)
+
+
+def backfill_podcasts_if_empty(connection) -> int:
+    """
+    Engångsbackfill av podcastrollups när tabellen är tom (körs vid init_db)
+
+    :param connection: Anslutning i en öppen transaktion mot podcast-databasen
+    :return: Antal skrivna rollup-rader
+    """
+    return _backfill_if_empty(connection, SOURCE_PODCAST)
+
+
+def trending_companies(session: Session, source: str, start: date, end: Optional[date] = None,
+                       limit: int = 10) -> List[Dict[str, Any]]:
+    """
+    Mest omnämnda tickers i ett datumintervall, summerat ur rollup-tabellen
+
+    :param session: Session mot databasen som äger källans rollups
+    :param source: "news" eller "podcast"
+    :param start: Första dag
+    :param end: Sista dag (None = till idag)
+    :param limit: Max antal företag
+    """
+    model = ROLLUP_MODELS[source]
+    mention_count = func.sum(model.mention_count).label("mention_count")
+    query = (
+        select(model.ticker, func.max(model.name).label("name"), mention_count,
+               func.sum(model.sentiment_sum).label("sentiment_sum"), func.sum(model.sentiment_n).label("sentiment_n"))
+        .where(model.source == source, model.date >= start)
+        .group_by(model.ticker)
+        .having(mention_count > 0)
+        .order_by(desc("mention_count"), model.ticker)
+        .limit(limit)
+    )
+    if end:
+        query = query.where(model.date <= end)
+    return [
+        {
+            "name": row.name,
+            "ticker": row.ticker,
+            "mention_count": row.mention_count,
+            "average_sentiment": row.sentiment_sum / row.sentiment_n if row.sentiment_n else None
+        }
+        for row in session.execute(query)
+    ]
+
+
+def main():
+    from database import get_news_db, get_podcast_db
+
+    parser = argparse.ArgumentParser(description="Dagliga omnämnanden per ticker för trendberäkningar")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    backfill_parser = subparsers.add_parser("backfill", help="Bygg om rollups från källtabellerna")
+    backfill_parser.add_argument("--source", choices=[SOURCE_NEWS, SOURCE_PODCAST, "all"], default="all")
+    backfill_parser.add_argument("--start", type=date.fromisoformat, help="Första dag (YYYY-MM-DD)")
+    backfill_parser.add_argument("--end", type=date.fromisoformat, help="Sista dag (YYYY-MM-DD)")
+    trending_parser = subparsers.add_parser("trending", help="Visa mest omnämnda tickers")
+    trending_parser.add_argument("--days", type=int, default=30)
+    trending_parser.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    with get_news_db() as news_db, get_podcast_db() as podcast_db:
+        if args.command == "backfill":
+            if args.source in (SOURCE_NEWS, "all"):
+                print(f"news: {backfill_news(news_db, args.start, args.end)} rader")
+            if args.source in (SOURCE_PODCAST, "all"):
+                print(f"podcast: {backfill_podcasts(podcast_db, args.start, args.end)} rader")
+        elif args.command == "trending":
+            start = date.today() - timedelta(days=args.days)
+            for source, session in ((SOURCE_NEWS, news_db), (SOURCE_PODCAST, podcast_db)):
+                print(source)
+                for company in trending_companies(session, source, start, limit=args.limit):
+                    print(f"  {company['ticker']:<12}{company['mention_count']:>6}  {company['name']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Additiva schemamigreringar som create_all inte hanterar
+
+create_all skapar bara tabeller som saknas; nya kolumner i befintliga
+tabeller läggs till här, och befintliga rader fylls i för kolumner som
+beräknas vid skrivning. Varje steg är idempotent och körs vid init_db.
+"""
+import logging
+from typing import Dict, List
+
+from sqlalchemy import inspect, text
+
+from mention_codes import backfill_mention_codes
+from mention_rollups import backfill_news_if_empty, backfill_podcasts_if_empty
+from price_loader import dedupe_stock_prices
+
+logger = logging.getLogger(__name__)
+
+# Databas -> kolumner (tabell, kolumn, SQL-typ) som ska finnas
+COLUMN_MIGRATIONS = {
+    "podcast": [
+        ("stock_mentions", "company_id", "INTEGER"),
+        ("stock_mentions", "sentiment_value", "FLOAT"),
+        ("stock_mentions", "recommendation_code", "VARCHAR(10)"),
+    ],
+}
+
+# Databas -> index (namn, tabell, kolumn)
+INDEX_MIGRATIONS = {
+    "podcast": [
+        ("ix_stock_mentions_company_id", "stock_mentions", "company_id"),
+        ("ix_companies_updated_at", "companies", "updated_at"),
+    ],
+    "news": [
+        ("ix_companies_updated_at", "companies", "updated_at"),
+        ("ix_news_published_at", "news", "published_at"),
+    ],
+}
+
+
+# Databas -> (tabell, funktion(anslutning) -> antal rader) för rader som ska fyllas i
+DATA_MIGRATIONS = {
+    "podcast": [
+        ("stock_mentions", backfill_mention_codes),
+        # Efter koderna, eftersom rollupen summerar sentiment_value
+        ("mention_daily_rollups", backfill_podcasts_if_empty),
+    ],
+    "news": [
+        ("stock_prices", dedupe_stock_prices),
+        ("mention_daily_rollups", backfill_news_if_empty),
+    ],
+}
+
+
+def migrate_engine(engine, columns, indexes, backfills=()) -> List[str]:
+    """
+    Lägg till saknade kolumner och index i en databas och fyll i beräknade kolumner
+    
+    :param engine: SQLAlchemy-motor
+    :param columns: Lista med (tabell, kolumn, SQL-typ)
+    :param indexes: Lista med (indexnamn, tabell, kolumn)
+    :param backfills: Lista med (tabell, funktion); funktionen får anslutningen och returnerar antal rader
+    :return: Lista med tillagda kolumner som "tabell.kolumn"
+    """
+    inspector = inspect(engine)
+    tables = set(inspector.get_table_names())
+    added = []
+    
+    with engine.begin() as connection:
+        for table, column, sql_type in columns:
+            if table not in tables:
+                continue
+            existing = {col["name"] for col in inspector.get_columns(table)}
+            if column not in existing:
+                connection.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {sql_type}"))
+                added.append(f"{table}.{column}")
+        
+        for name, table, column in indexes:
+            if table in tables:
+                connection.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({column})"))
+        
+        for table, backfill in backfills:
+            if table in tables:
+                count = backfill(connection)
+                if count:
+                    logger.info(f"Fyllde i {count} rader i {table} ({backfill.__name__})")
+    
+    return added
+
+
+def run_migrations(engines: Dict[str, object]) -> List[str]:
+    """
+    Kör alla migreringar för de angivna databaserna
+    
+    :param engines: Ordbok {'podcast': motor, 'news': motor, ...}
+    :return: Lista med tillagda kolumner
+    """
+    added = []
+    for name, engine in engines.items():
+        added.extend(migrate_engine(engine, COLUMN_MIGRATIONS.get(name, []), INDEX_MIGRATIONS.get(name, []),
+                                    DATA_MIGRATIONS.get(name, [])))
+    
+    if added:
+        logger.info(f"Lade till kolumner: {', '.join(added)}")
+    return added
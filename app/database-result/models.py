@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Table, Text, Boolean
+from sqlalchemy import Column, Integer, String, Float, Date, DateTime, ForeignKey, Table, Text, Boolean, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 import datetime
@@ -47,7 +47,7 @@ class NewsCompany(NewsBase):
     description = Column(Text)
     founded_year = Column(Integer)
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow, index=True)
     
     stocks = relationship("NewsStockPrice", back_populates="company")
     news = relationship("News", secondary=company_news, back_populates="companies")
@@ -66,13 +66,100 @@ class PodcastCompany(PodcastBase):
     description = Column(Text)
     founded_year = Column(Integer)
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow, index=True)
     
     podcasts = relationship("Podcast", secondary=company_podcasts, back_populates="companies")
     
     def __repr__(self):
         return f"<PodcastCompany(name='{self.name}', ticker='{self.ticker}')>"
 
+# Referenslistning: kanonisk notering (ticker) för ett företag i news-databasen
+class ReferenceListing(NewsBase):
+    __tablename__ = 'reference_listings'
+    
+    id = Column(Integer, primary_key=True)
+    company_id = Column(Integer, ForeignKey('companies.id'), nullable=False, index=True)
+    ticker = Column(String(20), nullable=False, unique=True)
+    name = Column(String(200), nullable=False)
+    exchange = Column(String(20))
+    isin = Column(String(12))
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    
+    company = relationship("NewsCompany")
+    
+    def __repr__(self):
+        return f"<ReferenceListing(ticker='{self.ticker}', company_id='{self.company_id}')>"
+
+# Alias: alternativa namn/tickers som pekar på ett kanoniskt företag
+class CompanyAlias(NewsBase):
+    __tablename__ = 'company_aliases'
+    
+    id = Column(Integer, primary_key=True)
+    company_id = Column(Integer, ForeignKey('companies.id'), nullable=False, index=True)
+    alias = Column(String(200), nullable=False)
+    alias_key = Column(String(200), nullable=False, unique=True)  # Normaliserad form för uppslag
+    source = Column(String(50))  # 'listing', 'manual', 'learned'
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    
+    def __repr__(self):
+        return f"<CompanyAlias(alias='{self.alias}', company_id='{self.company_id}')>"
+
+# Vattenmärken för inkrementell företagssynk; lagras i måldatabasen så att
+# sidan och vattenmärket committas i samma transaktion
+class NewsSyncWatermark(NewsBase):
+    __tablename__ = 'sync_watermarks'
+    
+    name = Column(String(50), primary_key=True)  # Synkriktning, t.ex. 'companies:podcast->news'
+    last_updated_at = Column(DateTime)  # updated_at för senast synkade källrad
+    last_id = Column(Integer)  # ID för senast synkade källrad (bryter lika updated_at)
+    rows_synced = Column(Integer, default=0)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+    
+    def __repr__(self):
+        return f"<NewsSyncWatermark(name='{self.name}', last_updated_at='{self.last_updated_at}')>"
+
+class PodcastSyncWatermark(PodcastBase):
+    __tablename__ = 'sync_watermarks'
+    
+    name = Column(String(50), primary_key=True)
+    last_updated_at = Column(DateTime)
+    last_id = Column(Integer)
+    rows_synced = Column(Integer, default=0)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+    
+    def __repr__(self):
+        return f"<PodcastSyncWatermark(name='{self.name}', last_updated_at='{self.last_updated_at}')>"
+
+# Dagliga omnämnanden per ticker och källa; underhålls vid inläsning och
+# med backfill i mention_rollups.py
+class NewsMentionRollup(NewsBase):
+    __tablename__ = 'mention_daily_rollups'
+    
+    date = Column(Date, primary_key=True)
+    ticker = Column(String(50), primary_key=True)
+    source = Column(String(20), primary_key=True)  # 'news' eller 'podcast'
+    name = Column(String(255))
+    mention_count = Column(Integer, nullable=False, default=0)
+    sentiment_sum = Column(Float, nullable=False, default=0.0)
+    sentiment_n = Column(Integer, nullable=False, default=0)  # Omnämnanden med känt sentiment
+    
+    def __repr__(self):
+        return f"<NewsMentionRollup(date='{self.date}', ticker='{self.ticker}', count='{self.mention_count}')>"
+
+class PodcastMentionRollup(PodcastBase):
+    __tablename__ = 'mention_daily_rollups'
+    
+    date = Column(Date, primary_key=True)
+    ticker = Column(String(50), primary_key=True)
+    source = Column(String(20), primary_key=True)
+    name = Column(String(255))
+    mention_count = Column(Integer, nullable=False, default=0)
+    sentiment_sum = Column(Float, nullable=False, default=0.0)
+    sentiment_n = Column(Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f"<PodcastMentionRollup(date='{self.date}', ticker='{self.ticker}', count='{self.mention_count}')>"
+
 # StockPrice-klassen för news-databasen
 class NewsStockPrice(NewsBase):
     __tablename__ = 'stock_prices'
@@ -88,6 +175,9 @@ class NewsStockPrice(NewsBase):
     
     company = relationship("NewsCompany", back_populates="stocks")
     
+    # En kurs per företag och tidpunkt; indexet används också för kursserier per intervall (se price_series.py)
+    __table_args__ = (Index("ux_stock_prices_company_date", "company_id", "date", unique=True),)
+    
     def __repr__(self):
         return f"<NewsStockPrice(company_id='{self.company_id}', date='{self.date}', close='{self.close_price}')>"
 
@@ -99,7 +189,7 @@ class News(NewsBase):
     title = Column(String(200), nullable=False)
     source = Column(String(100))
     url = Column(String(500))
-    published_at = Column(DateTime, nullable=False)
+    published_at = Column(DateTime, nullable=False, index=True)
     content = Column(Text)
     summary = Column(Text)
     sentiment = Column(Float)  # -1 to 1 scale
@@ -155,8 +245,11 @@ class StockMention(PodcastBase):
     context = Column(Text)
     sentiment = Column(String(50))
     recommendation = Column(String(50))
+    sentiment_value = Column(Float)  # 1 positivt, 0 neutralt, -1 negativt, NULL okänt (se mention_codes.py)
+    recommendation_code = Column(String(10))  # 'buy', 'hold', 'sell' eller 'none'
     price_info = Column(String(255))
     mention_reason = Column(String(255))
+    company_id = Column(Integer, index=True)  # Kanoniskt företag (companies.id i news-databasen)
     episode_id = Column(Integer, ForeignKey('episodes.id'))
     
     episode = relationship("Episode", back_populates="stock_mentions")
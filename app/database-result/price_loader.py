@@ -0,0 +1,308 @@
+"""
+Bulkladdning av historiska kurser till stock_prices
+
+Filerna (CSV eller Parquet) läses strömmande i batcher. Tickers slås upp i
+en karta som laddas en gång från företag och referenslistningar i
+news-databasen (exakt ticker och normaliserad form, "ERIC B" = "ERIC-B").
+Rader med okänd ticker eller ogiltiga värden hoppas över och räknas.
+
+I PostgreSQL skrivs varje batch med COPY till en temporär staging-tabell
+och flyttas sedan med en enda INSERT ... SELECT DISTINCT ON ... ON CONFLICT.
+Andra databaser (SQLite) får en executemany med samma ON CONFLICT. Raderna
+är unika på (company_id, date): en ny laddning av samma dag skriver över
+värdena, och rader som inte ändrats skrivs inte om.
+
+Förväntade kolumner (skiftlägesokänsligt): ticker, date, open, high, low,
+close, volume. För filer med ett enda företag kan ticker anges med --ticker.
+
+Användning:
+    python price_loader.py load prices/*.csv [--batch-size 50000] [--db-url URL]
+    python price_loader.py load volvo.parquet --ticker VOLV-B
+"""
+import io
+import csv
+import time
+import logging
+import argparse
+from collections import Counter
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from sqlalchemy import inspect, select, text
+from sqlalchemy.orm import Session
+
+from models import NewsCompany, NewsStockPrice, ReferenceListing
+from ticker_normalizer import ticker_key
+
+logger = logging.getLogger(__name__)
+
+PRICE_LOAD_BATCH_SIZE = 50000
+PRICE_COLUMNS = ("company_id", "date", "open_price", "high_price", "low_price", "close_price", "volume")
+UNIQUE_INDEX = "ux_stock_prices_company_date"
+# Icke-unikt index från tidigare version som ersätts av det unika
+_OLD_INDEX = "ix_stock_prices_company_date"
+_STAGING_TABLE = "stock_prices_staging"
+
+PriceRow = Tuple[int, datetime, float, float, float, float, int]
+
+
+def dedupe_stock_prices(connection) -> int:
+    """
+    Ta bort dubbletter på (company_id, date) och skapa det unika indexet (körs vid init_db)
+
+    Den senast inlagda raden (högst id) behålls. Görs bara en gång; finns
+    indexet redan returneras 0 direkt.
+
+    :param connection: Anslutning i en öppen transaktion mot news-databasen
+    :return: Antal borttagna rader
+    """
+    table = NewsStockPrice.__tablename__
+    if any(index["name"] == UNIQUE_INDEX for index in inspect(connection).get_indexes(table)):
+        return 0
+    result = connection.execute(text(
+        f"DELETE FROM {table} WHERE id NOT IN (SELECT MAX(id) FROM {table} GROUP BY company_id, date)"
+    ))
+    connection.execute(text(f"CREATE UNIQUE INDEX IF NOT EXISTS {UNIQUE_INDEX} ON {table} (company_id, date)"))
+    connection.execute(text(f"DROP INDEX IF EXISTS {_OLD_INDEX}"))
+    return max(result.rowcount, 0)
+
+
+def load_ticker_map(news_db: Session) -> Dict[str, int]:
+    """
+    Ticker -> företags-ID för alla företag och referenslistningar, både exakt och normaliserad
+    """
+    listings = news_db.execute(select(ReferenceListing.ticker, ReferenceListing.company_id)).all()
+    companies = news_db.execute(select(NewsCompany.ticker, NewsCompany.id)).all()
+    ticker_map: Dict[str, int] = {}
+    for ticker, company_id in listings + companies:
+        if ticker:
+            ticker_map.setdefault(ticker_key(ticker), company_id)
+    # Exakta tickers går före normaliserade kollisioner
+    for ticker, company_id in listings + companies:
+        if ticker:
+            ticker_map[ticker] = company_id
+    return ticker_map
+
+
+def _parse_date(value: Any) -> datetime:
+    if isinstance(value, datetime):
+        return value.replace(tzinfo=None)
+    if isinstance(value, date):
+        return datetime.combine(value, datetime.min.time())
+    return datetime.fromisoformat(str(value).strip())
+
+
+def read_csv_batches(path: str, batch_size: int) -> Iterator[List[Dict[str, Any]]]:
+    with open(path, newline="", encoding="utf-8") as handle:
+        reader = csv.DictReader(handle)
+        reader.fieldnames = [field.strip().lower() for field in reader.fieldnames or []]
+        batch = []
+        for row in reader:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+
+def read_parquet_batches(path: str, batch_size: int) -> Iterator[List[Dict[str, Any]]]:
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("Parquet-import kräver pyarrow (pip install pyarrow)")
+
+    parquet_file = pq.ParquetFile(path)
+    for record_batch in parquet_file.iter_batches(batch_size=batch_size):
+        columns = {name.lower(): record_batch.column(index).to_pylist()
+                   for index, name in enumerate(record_batch.schema.names)}
+        yield [dict(zip(columns, values)) for values in zip(*columns.values())]
+
+
+def read_batches(path: str, batch_size: int) -> Iterator[List[Dict[str, Any]]]:
+    if path.lower().endswith((".parquet", ".pq")):
+        return read_parquet_batches(path, batch_size)
+    return read_csv_batches(path, batch_size)
+
+
+class LoadStats:
+    def __init__(self):
+        self.read = 0
+        self.written = 0
+        self.invalid = 0
+        self.unknown = Counter()
+        self.started = time.perf_counter()
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def as_dict(self) -> Dict[str, Any]:
+        elapsed = self.elapsed
+        return {
+            "rows_read": self.read,
+            "rows_written": self.written,
+            "invalid_rows": self.invalid,
+            "unknown_ticker_rows": sum(self.unknown.values()),
+            "unknown_tickers": [ticker for ticker, _ in self.unknown.most_common(20)],
+            "seconds": round(elapsed, 2),
+            "rows_per_second": round(self.read / elapsed) if elapsed else 0,
+        }
+
+
+def resolve_rows(rows: Iterable[Dict[str, Any]], ticker_map: Dict[str, int], stats: LoadStats,
+                 default_ticker: Optional[str] = None) -> List[PriceRow]:
+    """
+    Filrader -> tupler för stock_prices, deduplicerade på (company_id, date) (sista raden vinner)
+    """
+    resolved: Dict[Tuple[int, datetime], PriceRow] = {}
+    for row in rows:
+        stats.read += 1
+        ticker = row.get("ticker") or default_ticker
+        company_id = ticker_map.get(ticker) if ticker else None
+        if company_id is None and ticker:
+            # Normaliserade träffar sparas i kartan så att varje skrivsätt bara normaliseras en gång
+            company_id = ticker_map.get(ticker_key(ticker))
+            if company_id is not None:
+                ticker_map[ticker] = company_id
+        if company_id is None:
+            stats.unknown[ticker or ""] += 1
+            continue
+        try:
+            day = _parse_date(row["date"])
+            resolved[(company_id, day)] = (
+                company_id, day, float(row["open"]), float(row["high"]), float(row["low"]), float(row["close"]),
+                int(float(row["volume"] or 0)),
+            )
+        except (KeyError, TypeError, ValueError):
+            stats.invalid += 1
+    return list(resolved.values())
+
+
+def _upsert_sql(source: str, distinct: str) -> str:
+    """
+    INSERT ... ON CONFLICT som bara skriver rader vars värden ändrats
+
+    :param source: VALUES- eller SELECT-del
+    :param distinct: Dialektens "är skild från"-operator
+    """
+    table = NewsStockPrice.__tablename__
+    updates = ", ".join(f"{column} = excluded.{column}" for column in PRICE_COLUMNS[2:])
+    changed = " OR ".join(f"{table}.{column} {distinct} excluded.{column}" for column in PRICE_COLUMNS[2:])
+    return (
+        f"INSERT INTO {table} ({', '.join(PRICE_COLUMNS)}) {source} "
+        f"ON CONFLICT (company_id, date) DO UPDATE SET {updates} WHERE {changed}"
+    )
+
+
+def _write_copy(news_db: Session, rows: List[PriceRow]) -> int:
+    """
+    PostgreSQL: COPY till staging-tabellen och en INSERT ... ON CONFLICT därifrån
+    """
+    columns = ", ".join(PRICE_COLUMNS)
+    news_db.execute(text(
+        f"CREATE TEMPORARY TABLE IF NOT EXISTS {_STAGING_TABLE} (company_id INTEGER, date TIMESTAMP, "
+        f"open_price DOUBLE PRECISION, high_price DOUBLE PRECISION, low_price DOUBLE PRECISION, "
+        f"close_price DOUBLE PRECISION, volume BIGINT) ON COMMIT DELETE ROWS"
+    ))
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for company_id, day, open_price, high, low, close, volume in rows:
+        writer.writerow((company_id, day.isoformat(sep=" "), repr(open_price), repr(high), repr(low), repr(close), volume))
+    buffer.seek(0)
+
+    cursor = news_db.connection().connection.cursor()
+    try:
+        cursor.copy_expert(f"COPY {_STAGING_TABLE} ({columns}) FROM STDIN WITH (FORMAT csv)", buffer)
+    finally:
+        cursor.close()
+
+    result = news_db.execute(text(_upsert_sql(
+        f"SELECT DISTINCT ON (company_id, date) {columns} FROM {_STAGING_TABLE} ORDER BY company_id, date",
+        "IS DISTINCT FROM"
+    )))
+    return max(result.rowcount, 0)
+
+
+def _write_executemany(news_db: Session, rows: List[PriceRow]) -> int:
+    """
+    SQLite: executemany på den råa markören med samma ON CONFLICT som COPY-vägen
+    """
+    sql = _upsert_sql(f"VALUES ({', '.join('?' * len(PRICE_COLUMNS))})", "IS NOT")
+    # Samma textformat som SQLAlchemys DateTime i SQLite, så att unikheten och intervallfrågorna stämmer
+    params = [
+        (company_id, day.isoformat(sep=" ", timespec="microseconds"), open_price, high, low, close, volume)
+        for company_id, day, open_price, high, low, close, volume in rows
+    ]
+    cursor = news_db.connection().connection.cursor()
+    try:
+        cursor.executemany(sql, params)
+        return max(cursor.rowcount, 0)
+    finally:
+        cursor.close()
+
+
+def load_files(news_db: Session, paths: List[str], batch_size: int = PRICE_LOAD_BATCH_SIZE,
+               default_ticker: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Ladda kursfiler till stock_prices, en transaktion per batch
+
+    :param paths: CSV- eller Parquet-filer
+    :param default_ticker: Ticker för filer utan ticker-kolumn
+    :return: Statistik (lästa/skrivna rader, okända tickers, rader per sekund)
+    """
+    use_copy = news_db.get_bind().dialect.name == "postgresql"
+    write = _write_copy if use_copy else _write_executemany
+    ticker_map = load_ticker_map(news_db)
+    logger.info(f"{len(ticker_map)} tickers i kartan, skriver med {'COPY' if use_copy else 'executemany'}")
+
+    stats = LoadStats()
+    for path in paths:
+        for batch in read_batches(path, batch_size):
+            rows = resolve_rows(batch, ticker_map, stats, default_ticker)
+            if rows:
+                try:
+                    stats.written += write(news_db, rows)
+                    news_db.commit()
+                except Exception:
+                    news_db.rollback()
+                    raise
+            logger.info(f"{path}: {stats.read} rader lästa, {stats.written} skrivna "
+                        f"({stats.read / max(stats.elapsed, 1e-9):.0f} rader/s)")
+    return stats.as_dict()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulkladdning av historiska kurser")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    load_parser = subparsers.add_parser("load", help="Ladda CSV- eller Parquet-filer till stock_prices")
+    load_parser.add_argument("paths", nargs="+", help="Filer att ladda")
+    load_parser.add_argument("--ticker", help="Ticker för filer utan ticker-kolumn")
+    load_parser.add_argument("--batch-size", type=int, default=PRICE_LOAD_BATCH_SIZE)
+    load_parser.add_argument("--db-url", help="Databas-URL (standard: news-databasen i config)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    if args.db_url:
+        from sqlalchemy import create_engine
+        from sqlalchemy.orm import sessionmaker
+        from models import NewsBase
+        from migrations import run_migrations
+
+        engine = create_engine(args.db_url)
+        NewsBase.metadata.create_all(engine)
+        run_migrations({"news": engine})
+        news_db = sessionmaker(bind=engine)()
+    else:
+        from database import NewsSessionLocal
+        news_db = NewsSessionLocal()
+
+    with news_db:
+        stats = load_files(news_db, args.paths, args.batch_size, args.ticker)
+    for key, value in stats.items():
+        print(f"{key}: {value}")
+
+
+if __name__ == "__main__":
+    main()
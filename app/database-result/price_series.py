@@ -0,0 +1,380 @@
+"""
+Kolumnbaserade kursserier (NumPy) för NewsStockPrice
+
+En serie för ett företag och ett datumintervall läses med en rå databas-
+markör direkt till arrayer: tid (epoksekunder), open, high, low, close och
+volym. Inga ORM-objekt skapas. Serierna hålls i en LRU-cache per
+(företag, start, slut) med ett tak för antal serier och totalt antal rader.
+Ett fingeravtryck (antal rader, högsta id) för intervallet kontrolleras med
+jämna mellanrum så att nya kurser slår igenom, och poster äldre än
+PRICE_CACHE_MAX_AGE läses alltid om (fångar rättade värden i befintliga rader).
+
+Varje laddad serie får ett nytt versionsnummer som kan användas som nyckel
+för härledda resultat. Arrayerna är skrivskyddade eftersom de delas mellan
+anrop och trådar.
+
+Svarsformat: kolumner (listor per fält, tider i epoksekunder), poster
+(samma format som tidigare i get_company_data) eller Arrow IPC-ström
+(kräver pyarrow). downsample() slår ihop serien till högst ett givet antal
+OHLC-punkter.
+"""
+import time
+import logging
+import itertools
+import threading
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import BigInteger, Integer, cast, func, select
+from sqlalchemy.orm import Session
+
+from models import NewsStockPrice
+
+logger = logging.getLogger(__name__)
+
+PRICE_FIELDS = ("date", "open", "high", "low", "close", "volume")
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
+# Max antal serier och totalt antal rader i cachen
+PRICE_CACHE_SIZE = 256
+PRICE_CACHE_MAX_ROWS = 5_000_000
+# Minsta tid mellan kontroller av intervallets fingeravtryck
+PRICE_CHECK_INTERVAL = 5.0
+# Poster äldre än så här läses om oavsett fingeravtryck
+PRICE_CACHE_MAX_AGE = 300.0
+
+# Dialekt -> (tid som epoksekunder, parametermarkör)
+_DIALECT_SQL = {
+    "sqlite": ("CAST(strftime('%s', date) AS INTEGER)", "?"),
+    "postgresql": ("CAST(EXTRACT(EPOCH FROM date) AS BIGINT)", "%s"),
+}
+
+_versions = itertools.count(1)
+
+
+def _readonly(array: np.ndarray) -> np.ndarray:
+    array.flags.writeable = False
+    return array
+
+
+class PriceSeries:
+    __slots__ = ("company_id", "dates", "open", "high", "low", "close", "volume", "version")
+
+    def __init__(self, company_id: int, dates: np.ndarray, open_: np.ndarray, high: np.ndarray, low: np.ndarray,
+                 close: np.ndarray, volume: np.ndarray, version: Optional[int] = None):
+        """
+        Kursserie som kolumnarrayer sorterade på tid
+
+        :param dates: Tider i epoksekunder (int64)
+        :param version: Unikt nummer per laddning (None för härledda serier)
+        """
+        self.company_id = company_id
+        self.dates = _readonly(dates)
+        self.open = _readonly(open_)
+        self.high = _readonly(high)
+        self.low = _readonly(low)
+        self.close = _readonly(close)
+        self.volume = _readonly(volume)
+        self.version = version
+
+    def __len__(self):
+        return len(self.dates)
+
+    def downsample(self, points: int) -> "PriceSeries":
+        """
+        Slå ihop serien till högst `points` OHLC-punkter i lika långa tidsintervall
+
+        Varje punkt får första tiden och öppningskursen i intervallet, högsta
+        high, lägsta low, sista stängningskursen och summerad volym. Tomma
+        intervall (helger, luckor) hoppas över.
+        """
+        if points < 1:
+            raise ValueError("points måste vara minst 1")
+        if len(self) <= points:
+            return self
+        edges = np.linspace(self.dates[0], self.dates[-1], points + 1)
+        buckets = np.minimum(np.searchsorted(edges, self.dates, side="right") - 1, points - 1)
+        starts = np.flatnonzero(np.diff(buckets, prepend=-1))
+        ends = np.append(starts[1:], len(self)) - 1
+        return PriceSeries(
+            self.company_id,
+            self.dates[starts],
+            self.open[starts],
+            np.maximum.reduceat(self.high, starts),
+            np.minimum.reduceat(self.low, starts),
+            self.close[ends],
+            np.add.reduceat(self.volume, starts),
+        )
+
+    def to_columns(self) -> Dict[str, Any]:
+        """
+        Kompakt JSON-format: en lista per fält, tider i epoksekunder
+        """
+        return {
+            "company_id": self.company_id,
+            "count": len(self),
+            "date_unit": "s",
+            "date": self.dates.tolist(),
+            "open": self.open.tolist(),
+            "high": self.high.tolist(),
+            "low": self.low.tolist(),
+            "close": self.close.tolist(),
+            "volume": self.volume.tolist(),
+        }
+
+    def to_records(self) -> List[Dict[str, Any]]:
+        """
+        En ordbok per rad med ISO-datum (tidigare format i get_company_data)
+        """
+        dates = np.datetime_as_string(self.dates.astype("datetime64[s]")).tolist()
+        return [
+            {"date": day, "open": open_, "high": high, "low": low, "close": close, "volume": volume}
+            for day, open_, high, low, close, volume in zip(
+                dates, self.open.tolist(), self.high.tolist(), self.low.tolist(), self.close.tolist(),
+                self.volume.tolist()
+            )
+        ]
+
+    def to_arrow(self) -> bytes:
+        """
+        Serien som Arrow IPC-ström (kräver pyarrow)
+        """
+        try:
+            import pyarrow as pa
+        except ImportError:
+            raise ImportError("Arrow-format kräver pyarrow (pip install pyarrow)")
+
+        table = pa.table({
+            "date": pa.array(self.dates.astype("datetime64[s]")),
+            "open": self.open, "high": self.high, "low": self.low, "close": self.close, "volume": self.volume,
+        })
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes()
+
+
+def _bounds(start: Optional[date], end: Optional[date]) -> Tuple[Optional[datetime], Optional[datetime]]:
+    """
+    Datumintervall (inklusive) som [start, slut) i tid
+    """
+    lower = datetime.combine(start, datetime.min.time()) if start else None
+    upper = datetime.combine(end + timedelta(days=1), datetime.min.time()) if end else None
+    return lower, upper
+
+
+def load_price_series(session: Session, company_id: int, start: Optional[date] = None,
+                      end: Optional[date] = None, version: Optional[int] = None) -> PriceSeries:
+    """
+    Läs kurserna för ett företag direkt till arrayer via en rå markör
+
+    :param session: Session mot news-databasen (markören körs i dess transaktion)
+    :param start: Första dag (None = från början)
+    :param end: Sista dag (None = till slutet)
+    """
+    connection = session.connection()
+    epoch, marker = _DIALECT_SQL.get(connection.dialect.name, _DIALECT_SQL["postgresql"])
+    conditions, params = [f"company_id = {marker}"], [company_id]
+    for operator, bound in zip((">=", "<"), _bounds(start, end)):
+        if bound is not None:
+            conditions.append(f"date {operator} {marker}")
+            # SQLite lagrar tider som text; strängjämförelsen stämmer med det formatet
+            params.append(bound.strftime("%Y-%m-%d %H:%M:%S") if connection.dialect.name == "sqlite" else bound)
+    sql = (
+        f"SELECT {epoch}, open_price, high_price, low_price, close_price, volume "
+        f"FROM {NewsStockPrice.__tablename__} WHERE {' AND '.join(conditions)} ORDER BY date"
+    )
+
+    cursor = connection.connection.cursor()
+    try:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+
+    data = np.array(rows, dtype=np.float64).reshape(len(rows), len(PRICE_FIELDS))
+    return PriceSeries(
+        company_id,
+        data[:, 0].astype(np.int64),
+        np.ascontiguousarray(data[:, 1]),
+        np.ascontiguousarray(data[:, 2]),
+        np.ascontiguousarray(data[:, 3]),
+        np.ascontiguousarray(data[:, 4]),
+        data[:, 5].astype(np.int64),
+        version if version is not None else next(_versions),
+    )
+
+
+def epoch_seconds(column, dialect_name: str):
+    """
+    SQL-uttryck för en tidskolumn som epoksekunder (samma tolkning som kursserierna)
+    """
+    if dialect_name == "sqlite":
+        return cast(func.strftime("%s", column), Integer)
+    return cast(func.extract("epoch", column), BigInteger)
+
+
+def load_closes(session: Session, company_id: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Stängningskurser för alla företag (eller ett) i en läsning, sorterade på (företag, tid)
+
+    :return: (företags-ID, tider i epoksekunder, stängningskurser)
+    """
+    connection = session.connection()
+    epoch, marker = _DIALECT_SQL.get(connection.dialect.name, _DIALECT_SQL["postgresql"])
+    sql = f"SELECT company_id, {epoch}, close_price FROM {NewsStockPrice.__tablename__}"
+    params = []
+    if company_id is not None:
+        sql += f" WHERE company_id = {marker}"
+        params.append(company_id)
+    sql += " ORDER BY company_id, date"
+
+    cursor = connection.connection.cursor()
+    try:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+
+    data = np.array(rows, dtype=np.float64).reshape(len(rows), 3)
+    return data[:, 0].astype(np.int64), data[:, 1].astype(np.int64), np.ascontiguousarray(data[:, 2])
+
+
+def _fingerprint(session: Session, company_id: int, start: Optional[date], end: Optional[date]) -> Tuple[Any, Any]:
+    query = select(func.count(NewsStockPrice.id), func.max(NewsStockPrice.id)).where(
+        NewsStockPrice.company_id == company_id
+    )
+    lower, upper = _bounds(start, end)
+    if lower is not None:
+        query = query.where(NewsStockPrice.date >= lower)
+    if upper is not None:
+        query = query.where(NewsStockPrice.date < upper)
+    count, last_id = session.execute(query).one()
+    return count, last_id
+
+
+class _Entry:
+    __slots__ = ("series", "fingerprint", "generation", "loaded_at", "checked_at")
+
+    def __init__(self, series: PriceSeries, fingerprint, generation: int, now: float):
+        self.series = series
+        self.fingerprint = fingerprint
+        self.generation = generation
+        self.loaded_at = now
+        self.checked_at = now
+
+
+class PriceSeriesCache:
+    def __init__(self, max_entries: int = PRICE_CACHE_SIZE, max_rows: int = PRICE_CACHE_MAX_ROWS,
+                 check_interval: float = PRICE_CHECK_INTERVAL, max_age: float = PRICE_CACHE_MAX_AGE,
+                 clock=time.monotonic):
+        """
+        LRU-cache för kursserier per (företag, start, slut)
+
+        :param max_entries: Max antal serier
+        :param max_rows: Max antal rader totalt över alla serier
+        :param check_interval: Minsta tid mellan kontroller av fingeravtrycket
+        :param max_age: Sekunder innan en serie alltid läses om
+        :param clock: Monoton klocka
+        """
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        self.check_interval = check_interval
+        self.max_age = max_age
+        self.clock = clock
+        self._entries: "OrderedDict[Tuple[int, Optional[date], Optional[date]], _Entry]" = OrderedDict()
+        self._rows = 0
+        self._generations: Dict[int, int] = {}
+        self._lock = threading.RLock()
+        self._counters = {"hits": 0, "misses": 0, "reloads": 0, "evictions": 0, "invalidations": 0}
+
+    def _is_fresh(self, session: Session, key, entry: _Entry, now: float) -> bool:
+        company_id, start, end = key
+        if entry.generation != self._generations.get(company_id, 0) or now - entry.loaded_at >= self.max_age:
+            return False
+        if now - entry.checked_at < self.check_interval:
+            return True
+        if _fingerprint(session, company_id, start, end) != entry.fingerprint:
+            return False
+        entry.checked_at = now
+        return True
+
+    def _store(self, key, entry: _Entry):
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._rows -= len(previous.series)
+            self._entries[key] = entry
+            self._rows += len(entry.series)
+            while len(self._entries) > 1 and (len(self._entries) > self.max_entries or self._rows > self.max_rows):
+                _, evicted = self._entries.popitem(last=False)
+                self._rows -= len(evicted.series)
+                self._counters["evictions"] += 1
+
+    def get(self, session: Session, company_id: int, start: Optional[date] = None,
+            end: Optional[date] = None) -> PriceSeries:
+        """
+        Kursserie för ett företag, från cachen eller databasen
+
+        :param session: Session mot news-databasen
+        :param start: Första dag (None = från början)
+        :param end: Sista dag (None = till slutet)
+        """
+        key = (company_id, start, end)
+        now = self.clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is not None and self._is_fresh(session, key, entry, now):
+            with self._lock:
+                self._counters["hits"] += 1
+            return entry.series
+
+        generation = self._generations.get(company_id, 0)
+        # Fingeravtrycket läses före raderna så att en samtidig ändring ger en ny laddning
+        fingerprint = _fingerprint(session, company_id, start, end)
+        series = load_price_series(session, company_id, start, end)
+        self._store(key, _Entry(series, fingerprint, generation, now))
+        with self._lock:
+            self._counters["reloads" if entry is not None else "misses"] += 1
+        return series
+
+    def invalidate(self, company_id: Optional[int] = None):
+        """
+        Markera ett företags serier (eller alla) som inaktuella
+
+        :param company_id: Företags-ID i news-databasen, None för alla
+        """
+        with self._lock:
+            if company_id is None:
+                self._entries.clear()
+                self._rows = 0
+            else:
+                self._generations[company_id] = self._generations.get(company_id, 0) + 1
+            self._counters["invalidations"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Träffstatistik och storlek
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            counters["series"] = len(self._entries)
+            counters["rows"] = self._rows
+        lookups = counters["hits"] + counters["misses"] + counters["reloads"]
+        counters["lookups"] = lookups
+        counters["hit_rate"] = round(counters["hits"] / lookups, 3) if lookups else 0.0
+        return counters
+
+
+_price_cache = PriceSeriesCache()
+
+
+def get_price_cache() -> PriceSeriesCache:
+    """
+    Delad kursseriecache för processen
+    """
+    return _price_cache
@@ -0,0 +1,479 @@
+"""
+Normalisering av aktieomnämnanden till kanoniska företags-ID:n
+
+Omnämnanden från språkmodellerna kommer som fritext ("ERIC B", "Ericsson",
+"Telefonaktiebolaget LM Ericsson" eller bara ett namn utan ticker). Motorn
+slår upp dem mot referenslistningar och alias i news-databasen: först exakt
+på normaliserad ticker och namn, sedan på tickerroten (ERIC -> ERIC-A/ERIC-B
+om båda hör till samma företag) och sist med ett trigramindex vars kandidater
+verifieras med redigeringsavstånd. Heta namn hålls i en LRU-cache.
+
+Den processgemensamma motorn (get_ticker_normalizer) läser med jämna
+mellanrum ett fingeravtryck av företag, listningar och alias och byggs om
+när det har ändrats, så att ändringar från andra processer också slår igenom.
+
+Användning:
+    python ticker_normalizer.py seed
+    python ticker_normalizer.py resolve "ERIC B" [--name "Ericsson"]
+    python ticker_normalizer.py alias "Telia" TELIA
+    python ticker_normalizer.py renormalize [--all] [--batch-size 1000]
+"""
+import re
+import time
+import logging
+import argparse
+import threading
+import unicodedata
+from collections import defaultdict, namedtuple
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import bindparam, func, select, update
+from sqlalchemy.orm import Session
+
+from models import NewsCompany, ReferenceListing, CompanyAlias, StockMention
+
+logger = logging.getLogger(__name__)
+
+# Minsta likhet (1 - redigeringsavstånd / längd) för en fuzzy-träff
+FUZZY_MIN_RATIO = 0.8
+# Minsta trigramöverlapp (Dice) för att en kandidat ska verifieras
+TRIGRAM_MIN_DICE = 0.3
+MAX_FUZZY_CANDIDATES = 20
+LRU_SIZE = 10000
+# Minsta tid mellan kontroller av referenstabellernas fingeravtryck
+VERSION_CHECK_INTERVAL = 5.0
+
+# Bolagsformer och brus som inte skiljer företag åt
+_NAME_NOISE = {
+    "ab", "publ", "aktiebolag", "asa", "as", "oyj", "plc", "inc", "corp", "corporation",
+    "ltd", "group", "holding", "holdings", "ser", "serie", "class", "aktie", "aktien", "aktier", "och", "and",
+}
+_SHARE_CLASS = re.compile(r"\b(?:ser\.?|serie|class)?\s*([ab])$")
+_EXCHANGE_SUFFIX = re.compile(r"\.(ST|OL|CO|HE|US)$")
+_NON_ALNUM = re.compile(r"[^0-9a-z]+")
+
+TickerMatch = namedtuple("TickerMatch", ["company_id", "method", "score"])
+
+
+def fold(text: str) -> str:
+    """
+    Gemener utan diakritiska tecken (å -> a, ö -> o)
+    """
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+def ticker_key(ticker: Optional[str]) -> str:
+    """
+    Normaliserad ticker: "ERIC B", "ERIC-B", "eric_b.ST" -> "ERICB"
+    """
+    if not ticker:
+        return ""
+    key = _EXCHANGE_SUFFIX.sub("", ticker.strip().upper())
+    return _NON_ALNUM.sub("", fold(key)).upper()
+
+
+def ticker_root(ticker: Optional[str]) -> str:
+    """
+    Ticker utan aktieslag: "ERIC-B" -> "ERIC"
+    """
+    if not ticker:
+        return ""
+    cleaned = _EXCHANGE_SUFFIX.sub("", ticker.strip().upper())
+    parts = re.split(r"[\s\-_.]+", cleaned)
+    if len(parts) > 1 and len(parts[-1]) == 1:
+        parts = parts[:-1]
+    return ticker_key("".join(parts))
+
+
+def name_key(name: Optional[str]) -> str:
+    """
+    Normaliserat företagsnamn utan bolagsform och aktieslag
+    """
+    if not name:
+        return ""
+    folded = _NON_ALNUM.sub(" ", fold(name)).strip()
+    folded = _SHARE_CLASS.sub("", folded).strip() if len(folded) > 2 else folded
+    words = [word for word in folded.split() if word not in _NAME_NOISE]
+    return " ".join(words)
+
+
+def levenshtein(a: str, b: str) -> int:
+    """
+    Redigeringsavstånd mellan två strängar
+    """
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        previous = current
+    return previous[-1]
+
+
+def similarity(a: str, b: str) -> float:
+    longest = max(len(a), len(b))
+    return 1.0 - levenshtein(a, b) / longest if longest else 0.0
+
+
+def trigrams(key: str) -> Set[str]:
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class TrigramIndex:
+    def __init__(self):
+        """
+        Index från trigram till namnnycklar, med kandidatverifiering via redigeringsavstånd
+        """
+        self._postings: Dict[str, Set[str]] = defaultdict(set)
+        self._grams: Dict[str, Set[str]] = {}
+
+    def add(self, key: str):
+        if not key or key in self._grams:
+            return
+        grams = trigrams(key)
+        self._grams[key] = grams
+        for gram in grams:
+            self._postings[gram].add(key)
+
+    def __len__(self):
+        return len(self._grams)
+
+    def search(self, key: str, min_ratio: float = FUZZY_MIN_RATIO) -> Optional[Tuple[str, float]]:
+        """
+        Hitta den mest lika nyckeln
+
+        :param key: Normaliserad namnnyckel
+        :param min_ratio: Minsta likhet efter redigeringsavstånd
+        :return: (nyckel, likhet) eller None
+        """
+        grams = trigrams(key)
+        overlap: Dict[str, int] = defaultdict(int)
+        for gram in grams:
+            for candidate in self._postings.get(gram, ()):
+                overlap[candidate] += 1
+
+        scored = []
+        for candidate, shared in overlap.items():
+            dice = 2.0 * shared / (len(grams) + len(self._grams[candidate]))
+            if dice >= TRIGRAM_MIN_DICE:
+                scored.append((dice, candidate))
+        scored.sort(reverse=True)
+
+        best = None
+        for _, candidate in scored[:MAX_FUZZY_CANDIDATES]:
+            ratio = similarity(key, candidate)
+            if ratio >= min_ratio and (best is None or ratio > best[1]):
+                best = (candidate, ratio)
+        return best
+
+
+class TickerNormalizer:
+    def __init__(self, entries: Iterable[Tuple[int, Optional[str], Optional[str]]],
+                 aliases: Iterable[Tuple[int, str]] = (), cache_size: int = LRU_SIZE):
+        """
+        Bygg uppslagsindex
+
+        :param entries: (företags-ID, ticker, namn) för varje listning/företag
+        :param aliases: (företags-ID, alias) – namn eller tickers
+        :param cache_size: Antal råa omnämnanden som hålls i LRU-cachen
+        """
+        self._by_ticker: Dict[str, Set[int]] = defaultdict(set)
+        self._by_root: Dict[str, Set[int]] = defaultdict(set)
+        self._by_name: Dict[str, Set[int]] = defaultdict(set)
+        self._index = TrigramIndex()
+        self.canonical_ticker: Dict[int, str] = {}
+
+        for company_id, ticker, name in entries:
+            if ticker:
+                self._by_ticker[ticker_key(ticker)].add(company_id)
+                self._by_root[ticker_root(ticker)].add(company_id)
+                self.canonical_ticker.setdefault(company_id, ticker)
+            self._add_name(company_id, name)
+
+        for company_id, alias in aliases:
+            self._add_name(company_id, alias)
+            # Ett alias som ser ut som en ticker räknas också som ticker
+            if alias and re.fullmatch(r"[A-Za-z0-9][A-Za-z0-9 .\-_]{0,11}", alias) and alias.upper() == alias:
+                self._by_ticker[ticker_key(alias)].add(company_id)
+
+        self._resolve_cached = lru_cache(maxsize=cache_size)(self._resolve)
+
+    def _add_name(self, company_id: int, name: Optional[str]):
+        key = name_key(name)
+        if key:
+            self._by_name[key].add(company_id)
+            self._index.add(key)
+
+    @classmethod
+    def from_session(cls, news_db: Session, cache_size: int = LRU_SIZE) -> "TickerNormalizer":
+        """
+        Läs listningar, alias och företag från news-databasen
+        """
+        entries = [(row.company_id, row.ticker, row.name)
+                   for row in news_db.query(ReferenceListing.company_id, ReferenceListing.ticker,
+                                            ReferenceListing.name)]
+        entries.extend((row.id, row.ticker, row.name)
+                       for row in news_db.query(NewsCompany.id, NewsCompany.ticker, NewsCompany.name))
+        aliases = [(row.company_id, row.alias)
+                   for row in news_db.query(CompanyAlias.company_id, CompanyAlias.alias)]
+        normalizer = cls(entries, aliases, cache_size)
+        logger.info(f"Tickernormalisering laddad: {len(normalizer.canonical_ticker)} företag, "
+                    f"{len(normalizer._index)} namnnycklar")
+        return normalizer
+
+    @staticmethod
+    def _unique(ids: Set[int]) -> Optional[int]:
+        return next(iter(ids)) if len(ids) == 1 else None
+
+    def _resolve(self, ticker: Optional[str], name: Optional[str]) -> Optional[TickerMatch]:
+        t_key = ticker_key(ticker)
+        n_key = name_key(name)
+        # Modellen lägger ibland namnet i tickerfältet och tvärtom
+        t_as_name = name_key(ticker)
+        n_as_ticker = ticker_key(name) if name and len(name) <= 12 else ""
+
+        for key, table, method in (
+            (t_key, self._by_ticker, "ticker"),
+            (n_key, self._by_name, "name"),
+            (t_as_name, self._by_name, "ticker_as_name"),
+            (n_as_ticker, self._by_ticker, "name_as_ticker"),
+            (ticker_root(ticker), self._by_root, "ticker_root"),
+        ):
+            if key and key in table:
+                company_id = self._unique(table[key])
+                if company_id is not None:
+                    return TickerMatch(company_id, method, 1.0)
+
+        for key, method in ((n_key, "fuzzy_name"), (t_as_name, "fuzzy_ticker_as_name")):
+            if len(key) >= 4:
+                found = self._index.search(key)
+                if found:
+                    company_id = self._unique(self._by_name[found[0]])
+                    if company_id is not None:
+                        return TickerMatch(company_id, method, round(found[1], 3))
+        return None
+
+    def resolve(self, ticker: Optional[str] = None, name: Optional[str] = None) -> Optional[TickerMatch]:
+        """
+        Mappa ett råt omnämnande till ett kanoniskt företag
+
+        :param ticker: Ticker från omnämnandet (valfritt format)
+        :param name: Företagsnamn från omnämnandet
+        :return: TickerMatch(company_id, method, score) eller None
+        """
+        return self._resolve_cached((ticker or "").strip() or None, (name or "").strip() or None)
+
+    def resolve_many(self, mentions: Iterable[Tuple[Optional[str], Optional[str]]]) -> List[Optional[int]]:
+        """
+        Mappa många (ticker, namn)-par till företags-ID:n; dubbletter slås upp en gång
+        """
+        mentions = list(mentions)
+        resolved = {pair: self.resolve(*pair) for pair in set(mentions)}
+        return [match.company_id if match else None for match in (resolved[pair] for pair in mentions)]
+
+    def cache_info(self) -> Dict[str, Any]:
+        info = self._resolve_cached.cache_info()
+        lookups = info.hits + info.misses
+        return {
+            "hits": info.hits,
+            "misses": info.misses,
+            "size": info.currsize,
+            "hit_rate": round(info.hits / lookups, 3) if lookups else 0.0,
+        }
+
+
+_normalizer: Optional[TickerNormalizer] = None
+_normalizer_fingerprint: Optional[Tuple[Any, ...]] = None
+_normalizer_checked_at = 0.0
+_normalizer_lock = threading.Lock()
+
+
+def _reference_fingerprint(news_db: Session) -> Tuple[Any, ...]:
+    """
+    (antal, senaste ändring) för företag, listningar och alias
+
+    Listningar och alias saknar updated_at men skrivs bara till eller tas
+    bort, så högsta ID:t räcker där.
+    """
+    companies = news_db.execute(select(func.count(NewsCompany.id), func.max(NewsCompany.updated_at))).one()
+    listings = news_db.execute(select(func.count(ReferenceListing.id), func.max(ReferenceListing.id))).one()
+    aliases = news_db.execute(select(func.count(CompanyAlias.id), func.max(CompanyAlias.id))).one()
+    return tuple(companies), tuple(listings), tuple(aliases)
+
+
+def get_ticker_normalizer(news_db: Session) -> TickerNormalizer:
+    """
+    Delad normaliserare för processen (byggs vid första anropet)
+
+    Fingeravtrycket kontrolleras högst var VERSION_CHECK_INTERVAL sekund och
+    motorn byggs om när referenstabellerna har ändrats.
+    """
+    global _normalizer, _normalizer_fingerprint, _normalizer_checked_at
+    if _normalizer is not None and time.monotonic() - _normalizer_checked_at < VERSION_CHECK_INTERVAL:
+        return _normalizer
+    with _normalizer_lock:
+        if _normalizer is not None and time.monotonic() - _normalizer_checked_at < VERSION_CHECK_INTERVAL:
+            return _normalizer
+        # Fingeravtrycket läses före tabellerna så att en samtidig ändring ger en ny laddning
+        fingerprint = _reference_fingerprint(news_db)
+        if _normalizer is None or fingerprint != _normalizer_fingerprint:
+            if _normalizer is not None:
+                logger.info("Referenslistningar eller alias har ändrats, laddar om tickernormaliseringen")
+            _normalizer = TickerNormalizer.from_session(news_db)
+            _normalizer_fingerprint = fingerprint
+        _normalizer_checked_at = time.monotonic()
+        return _normalizer
+
+
+def reset_ticker_normalizer():
+    """
+    Tvinga omladdning efter ändrade listningar eller alias
+    """
+    global _normalizer, _normalizer_fingerprint
+    with _normalizer_lock:
+        _normalizer = None
+        _normalizer_fingerprint = None
+
+
+def seed_reference_listings(news_db: Session) -> Dict[str, int]:
+    """
+    Skapa referenslistningar och namnalias för företag som saknar dem
+
+    :return: Antal skapade listningar och alias
+    """
+    listed = {row.company_id for row in news_db.query(ReferenceListing.company_id)}
+    known_keys = {row.alias_key for row in news_db.query(CompanyAlias.alias_key)}
+    listings = aliases = 0
+
+    for company in news_db.query(NewsCompany).all():
+        if company.id not in listed:
+            news_db.add(ReferenceListing(company_id=company.id, ticker=company.ticker, name=company.name,
+                                         exchange="XSTO"))
+            listings += 1
+        key = name_key(company.name)
+        # Platshållare där namnet bara är tickern ger inget nytt alias
+        if key and key not in known_keys and ticker_key(company.name) != ticker_key(company.ticker):
+            news_db.add(CompanyAlias(company_id=company.id, alias=company.name, alias_key=key, source="listing"))
+            known_keys.add(key)
+            aliases += 1
+
+    news_db.commit()
+    reset_ticker_normalizer()
+    return {"listings": listings, "aliases": aliases}
+
+
+def add_alias(news_db: Session, alias: str, ticker: str, source: str = "manual") -> CompanyAlias:
+    """
+    Koppla ett alias till företaget med given ticker
+
+    :raises ValueError: Om tickern inte matchar något företag
+    """
+    match = get_ticker_normalizer(news_db).resolve(ticker=ticker)
+    if not match:
+        raise ValueError(f"Ingen listning hittades för ticker {ticker}")
+    entry = CompanyAlias(company_id=match.company_id, alias=alias, alias_key=name_key(alias) or ticker_key(alias),
+                         source=source)
+    news_db.add(entry)
+    news_db.commit()
+    reset_ticker_normalizer()
+    return entry
+
+
+def renormalize_mentions(podcast_db: Session, normalizer: TickerNormalizer, only_missing: bool = True,
+                         batch_size: int = 1000) -> Dict[str, int]:
+    """
+    Sätt company_id på historiska aktieomnämnanden i batchar
+
+    Raderna läses med keyset-paginering på id och uppdateras med en
+    executemany per batch, så jobbet kan avbrytas och köras om.
+
+    :param podcast_db: Session mot podcast-databasen
+    :param normalizer: TickerNormalizer
+    :param only_missing: Hoppa över omnämnanden som redan har company_id
+    :param batch_size: Antal rader per batch
+    :return: Statistik över genomsökta, matchade och ändrade rader
+    """
+    stats = {"scanned": 0, "matched": 0, "updated": 0}
+    statement = (
+        update(StockMention.__table__)
+        .where(StockMention.__table__.c.id == bindparam("mention_id"))
+        .values(company_id=bindparam("new_company_id"))
+    )
+    last_id = 0
+
+    while True:
+        query = (
+            podcast_db.query(StockMention.id, StockMention.ticker, StockMention.name, StockMention.company_id)
+            .filter(StockMention.id > last_id)
+        )
+        if only_missing:
+            query = query.filter(StockMention.company_id.is_(None))
+        rows = query.order_by(StockMention.id).limit(batch_size).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+
+        company_ids = normalizer.resolve_many((row.ticker, row.name) for row in rows)
+        changes = [
+            {"mention_id": row.id, "new_company_id": company_id}
+            for row, company_id in zip(rows, company_ids)
+            if company_id != row.company_id
+        ]
+        if changes:
+            podcast_db.connection().execute(statement, changes)
+            podcast_db.commit()
+
+        stats["scanned"] += len(rows)
+        stats["matched"] += sum(1 for company_id in company_ids if company_id is not None)
+        stats["updated"] += len(changes)
+        logger.info(f"Omnormaliserade {stats['scanned']} omnämnanden ({stats['matched']} matchade)")
+
+    return stats
+
+
+def main():
+    from database import get_news_db, get_podcast_db
+
+    parser = argparse.ArgumentParser(description="Normalisera aktieomnämnanden till kanoniska företag")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("seed", help="Skapa referenslistningar från företagstabellen")
+    resolve_parser = subparsers.add_parser("resolve", help="Slå upp ett omnämnande")
+    resolve_parser.add_argument("ticker", nargs="?")
+    resolve_parser.add_argument("--name")
+    alias_parser = subparsers.add_parser("alias", help="Lägg till ett alias")
+    alias_parser.add_argument("alias")
+    alias_parser.add_argument("ticker")
+    renormalize_parser = subparsers.add_parser("renormalize", help="Sätt company_id på historiska omnämnanden")
+    renormalize_parser.add_argument("--all", action="store_true", help="Även omnämnanden som redan har company_id")
+    renormalize_parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    with get_news_db() as news_db:
+        if args.command == "seed":
+            print(seed_reference_listings(news_db))
+        elif args.command == "alias":
+            entry = add_alias(news_db, args.alias, args.ticker)
+            print(f"{entry.alias} -> företag {entry.company_id}")
+        elif args.command == "resolve":
+            normalizer = get_ticker_normalizer(news_db)
+            match = normalizer.resolve(args.ticker, args.name)
+            if match:
+                print(f"{match.company_id} ({normalizer.canonical_ticker.get(match.company_id)}) "
+                      f"via {match.method}, likhet {match.score}")
+            else:
+                print("Ingen träff")
+        elif args.command == "renormalize":
+            normalizer = get_ticker_normalizer(news_db)
+            with get_podcast_db() as podcast_db:
+                print(renormalize_mentions(podcast_db, normalizer, not args.all, args.batch_size))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,419 @@
+"""
+Inverterat passageindex över cachade podcasttranskript
+
+Transkripten (podcast_data/transcripts/<video_id>.txt) delas i passager om
+PASSAGE_WORDS ord. Termer fördelas på shards via en hash av termen; varje
+shard har en termtabell (term -> offset, antal) och en binär postingsfil med
+(dokument, passage, termfrekvens) som läses via mmap vid sökning.
+
+Indexet byggs inkrementellt i segment: en byggkörning jämför storlek och
+ändringstid mot manifestet, indexerar bara nya/ändrade transkript i ett nytt
+segment och markerar gamla versioner som borttagna. När segmenten blir för
+många görs en full ombyggnad.
+
+Användning:
+    python transcript_index.py build --transcripts-dir ../podcast/podcast_scraper/podcast_data/transcripts
+    python transcript_index.py build --full
+    python transcript_index.py search "volvo lastbilar"
+"""
+import os
+import re
+import json
+import math
+import mmap
+import time
+import shutil
+import struct
+import zlib
+import logging
+import argparse
+import threading
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 1
+NUM_SHARDS = 16
+PASSAGE_WORDS = 60
+MAX_SEGMENTS = 8
+TRANSCRIPT_INDEX_DIR = os.getenv("TRANSCRIPT_INDEX_DIR", "transcript_index")
+TRANSCRIPTS_DIR = os.getenv("TRANSCRIPTS_DIR", "podcast_data/transcripts")
+
+# Posting: dokument-ID, passagenummer, termfrekvens
+_POSTING = struct.Struct("<IHH")
+POSTING_DTYPE = np.dtype([("doc", "<u4"), ("passage", "<u2"), ("tf", "<u2")])
+_NO_POSTINGS = np.zeros(0, dtype=POSTING_DTYPE)
+# Passagerad: byteoffset och bytelängd i passages.txt
+_PASSAGE = struct.Struct("<QI")
+
+_WORD = re.compile(r"\S+")
+_TERM = re.compile(r"\w+", re.UNICODE)
+_STOPWORDS = {
+    "och", "att", "det", "som", "en", "ett", "på", "är", "av", "för", "med", "till", "den", "har",
+    "de", "inte", "om", "så", "jag", "vi", "du", "man", "men", "var", "kan", "the", "and", "of", "to",
+}
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Termer i gemener, utan stoppord och entecken-termer
+    """
+    return [term for term in _TERM.findall(text.lower()) if len(term) > 1 and term not in _STOPWORDS]
+
+
+def shard_of(term: str, num_shards: int = NUM_SHARDS) -> int:
+    return zlib.crc32(term.encode("utf-8")) % num_shards
+
+
+def split_passages(text: str, words: int = PASSAGE_WORDS) -> List[Tuple[int, int]]:
+    """
+    Dela en text i passager om `words` ord
+
+    :return: Lista med (startoffset, slutoffset) i tecken
+    """
+    spans = [match.span() for match in _WORD.finditer(text)]
+    return [(spans[i][0], spans[min(i + words, len(spans)) - 1][1]) for i in range(0, len(spans), words)]
+
+
+def _write_json(path: str, data: Any):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+class SegmentWriter:
+    def __init__(self, path: str, num_shards: int = NUM_SHARDS):
+        """
+        Samla postings för ett nytt segment i minnet och skriv dem vid close()
+        """
+        self.path = path
+        self.num_shards = num_shards
+        self.postings: List[Dict[str, List[Tuple[int, int, int]]]] = [defaultdict(list) for _ in range(num_shards)]
+        os.makedirs(path, exist_ok=True)
+        self._passages = open(os.path.join(path, "passages.txt"), "wb")
+        self._passage_rows = open(os.path.join(path, "passages.idx"), "wb")
+        self.rows = 0
+
+    def add_document(self, doc_id: int, text: str) -> Tuple[int, int]:
+        """
+        Indexera ett transkript
+
+        :return: (första passagerad i segmentet, antal passager)
+        """
+        first_row = self.rows
+        passages = split_passages(text)
+        for number, (start, end) in enumerate(passages):
+            encoded = text[start:end].encode("utf-8")
+            self._passage_rows.write(_PASSAGE.pack(self._passages.tell(), len(encoded)))
+            self._passages.write(encoded)
+            for term, tf in Counter(tokenize(text[start:end])).items():
+                self.postings[shard_of(term, self.num_shards)][term].append((doc_id, number, min(tf, 65535)))
+        self.rows += len(passages)
+        return first_row, len(passages)
+
+    def close(self):
+        self._passages.close()
+        self._passage_rows.close()
+        for shard, terms in enumerate(self.postings):
+            table = {}
+            with open(os.path.join(self.path, f"shard_{shard:02d}.post"), "wb") as f:
+                for term in sorted(terms):
+                    entries = terms[term]
+                    table[term] = [f.tell(), len(entries)]
+                    f.write(b"".join(_POSTING.pack(*entry) for entry in entries))
+            _write_json(os.path.join(self.path, f"shard_{shard:02d}.terms"), table)
+
+
+class TranscriptIndexBuilder:
+    def __init__(self, index_dir: str = TRANSCRIPT_INDEX_DIR, transcripts_dir: str = TRANSCRIPTS_DIR):
+        """
+        Bygg och uppdatera indexet
+
+        :param index_dir: Katalog för manifest och segment
+        :param transcripts_dir: Katalog med <video_id>.txt
+        """
+        self.index_dir = index_dir
+        self.transcripts_dir = transcripts_dir
+        self.manifest_path = os.path.join(index_dir, "manifest.json")
+
+    def _load_manifest(self) -> Dict[str, Any]:
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            if manifest.get("version") == INDEX_VERSION:
+                return manifest
+        return {"version": INDEX_VERSION, "num_shards": NUM_SHARDS, "next_doc_id": 1, "next_segment": 1,
+                "segments": [], "docs": {}, "deleted": []}
+
+    def _scan(self) -> Dict[str, Tuple[int, int]]:
+        found = {}
+        for entry in os.scandir(self.transcripts_dir):
+            if entry.is_file() and entry.name.endswith(".txt"):
+                stat = entry.stat()
+                found[entry.name[:-4]] = (stat.st_size, int(stat.st_mtime))
+        return found
+
+    def build(self, full: bool = False) -> Dict[str, int]:
+        """
+        Indexera nya och ändrade transkript (eller allt vid full ombyggnad)
+
+        :param full: Bygg om alla segment från början
+        :return: Statistik: indexed, removed, unchanged, passages, segments
+        """
+        os.makedirs(self.index_dir, exist_ok=True)
+        manifest = self._load_manifest()
+        # Många segment eller fler borttagna än levande dokument: bygg om allt
+        if full or len(manifest["segments"]) >= MAX_SEGMENTS or len(manifest["deleted"]) > len(manifest["docs"]):
+            old_segments = manifest["segments"]
+            manifest.update(segments=[], docs={}, deleted=[], next_doc_id=1)
+        else:
+            old_segments = []
+
+        files = self._scan()
+        docs = manifest["docs"]
+        deleted = set(manifest["deleted"])
+        changed = [video_id for video_id, (size, mtime) in files.items()
+                   if video_id not in docs or (docs[video_id]["size"], docs[video_id]["mtime"]) != (size, mtime)]
+        removed = [video_id for video_id in docs if video_id not in files]
+
+        for video_id in removed + [video_id for video_id in changed if video_id in docs]:
+            deleted.add(docs.pop(video_id)["doc_id"])
+
+        passages = 0
+        if changed:
+            segment = f"seg_{manifest['next_segment']:05d}"
+            writer = SegmentWriter(os.path.join(self.index_dir, segment), manifest["num_shards"])
+            for video_id in sorted(changed):
+                with open(os.path.join(self.transcripts_dir, f"{video_id}.txt"), "r", encoding="utf-8") as f:
+                    text = f.read()
+                doc_id = manifest["next_doc_id"]
+                manifest["next_doc_id"] += 1
+                first_row, count = writer.add_document(doc_id, text)
+                passages += count
+                size, mtime = files[video_id]
+                docs[video_id] = {"doc_id": doc_id, "segment": segment, "first_row": first_row,
+                                  "passages": count, "size": size, "mtime": mtime}
+            writer.close()
+            manifest["segments"].append(segment)
+            manifest["next_segment"] += 1
+
+        manifest["deleted"] = sorted(deleted)
+        # Antal levande passager används för idf vid sökning
+        manifest["total_passages"] = sum(doc["passages"] for doc in docs.values())
+        _write_json(self.manifest_path, manifest)
+
+        # Segment som inte längre refereras tas bort efter att manifestet bytts ut
+        for segment in old_segments:
+            shutil.rmtree(os.path.join(self.index_dir, segment), ignore_errors=True)
+
+        return {"indexed": len(changed), "removed": len(removed), "unchanged": len(files) - len(changed),
+                "passages": passages, "segments": len(manifest["segments"])}
+
+
+class _Segment:
+    def __init__(self, path: str, num_shards: int):
+        self.path = path
+        self.num_shards = num_shards
+        self._terms: Dict[int, Dict[str, List[int]]] = {}
+        self._maps: Dict[str, mmap.mmap] = {}
+        self._files = []
+        self._lock = threading.Lock()
+
+    def _mmap(self, name: str) -> Optional[mmap.mmap]:
+        if name not in self._maps:
+            path = os.path.join(self.path, name)
+            if not os.path.getsize(path):
+                self._maps[name] = None
+            else:
+                f = open(path, "rb")
+                self._files.append(f)
+                self._maps[name] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._maps[name]
+
+    def postings(self, term: str) -> np.ndarray:
+        """
+        Postings för en term som en vy direkt över den mmappade filen
+        """
+        shard = shard_of(term, self.num_shards)
+        with self._lock:
+            if shard not in self._terms:
+                with open(os.path.join(self.path, f"shard_{shard:02d}.terms"), "r", encoding="utf-8") as f:
+                    self._terms[shard] = json.load(f)
+            entry = self._terms[shard].get(term)
+            if not entry:
+                return _NO_POSTINGS
+            data = self._mmap(f"shard_{shard:02d}.post")
+        offset, count = entry
+        return np.frombuffer(data, dtype=POSTING_DTYPE, count=count, offset=offset)
+
+    def passage(self, row: int) -> str:
+        with self._lock:
+            rows = self._mmap("passages.idx")
+            texts = self._mmap("passages.txt")
+        offset, length = _PASSAGE.unpack_from(rows, row * _PASSAGE.size)
+        return texts[offset:offset + length].decode("utf-8")
+
+    def close(self):
+        for data in self._maps.values():
+            if data is not None:
+                try:
+                    data.close()
+                except BufferError:
+                    # En pågående sökning håller fortfarande en vy; mappningen frigörs med den
+                    pass
+        for f in self._files:
+            f.close()
+
+
+class TranscriptIndex:
+    def __init__(self, index_dir: str = TRANSCRIPT_INDEX_DIR):
+        """
+        Läsare för indexet; laddar om automatiskt när manifestet ändrats
+
+        :param index_dir: Katalog med manifest.json och segment
+        """
+        self.index_dir = index_dir
+        self.manifest_path = os.path.join(index_dir, "manifest.json")
+        self._loaded_mtime = None
+        self._lock = threading.Lock()
+        self.segments: Dict[str, _Segment] = {}
+        self.docs_by_id: Dict[int, Tuple[str, Dict[str, Any]]] = {}
+        self.video_doc_ids: Dict[str, int] = {}
+        self.live_doc_ids = np.zeros(0, dtype=np.uint32)
+        self.deleted = set()
+        self.total_passages = 0
+
+    def _refresh(self):
+        try:
+            mtime = os.path.getmtime(self.manifest_path)
+        except OSError:
+            raise FileNotFoundError(f"Inget transkriptindex i {self.index_dir}; kör 'transcript_index.py build'")
+        if mtime == self._loaded_mtime:
+            return
+        with self._lock:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            old_segments = self.segments
+            self.segments = {
+                name: old_segments.pop(name, None) or _Segment(os.path.join(self.index_dir, name),
+                                                                 manifest["num_shards"])
+                for name in manifest["segments"]
+            }
+            for segment in old_segments.values():
+                segment.close()
+            self.docs_by_id = {doc["doc_id"]: (video_id, doc) for video_id, doc in manifest["docs"].items()}
+            self.video_doc_ids = {video_id: doc["doc_id"] for video_id, doc in manifest["docs"].items()}
+            self.live_doc_ids = np.array(sorted(self.docs_by_id), dtype=np.uint32)
+            self.deleted = set(manifest["deleted"])
+            self.total_passages = manifest.get("total_passages", 0)
+            self._loaded_mtime = mtime
+
+    def search(self, query: str, limit: int = 20, video_ids: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """
+        Sök passager som innehåller frågans termer
+
+        Passager rankas först på antal matchade termer och sedan på en
+        tf-idf-poäng, så passager som nämner alla termer kommer först.
+
+        :param query: Sökfråga
+        :param limit: Max antal passager
+        :param video_ids: Begränsa till dessa videor
+        :return: Lista med {video_id, passage, score, matched_terms, text}
+        """
+        self._refresh()
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        if video_ids:
+            allowed = np.array(sorted(self.video_doc_ids[video_id] for video_id in video_ids
+                                      if video_id in self.video_doc_ids), dtype=np.uint32)
+        else:
+            allowed = None
+
+        keys, weights = [], []
+        for term in terms:
+            hits = np.concatenate([segment.postings(term) for segment in self.segments.values()])
+            # Postings för borttagna eller ersatta dokument saknas bland de levande dokumenten
+            hits = hits[np.isin(hits["doc"], self.live_doc_ids)]
+            if not len(hits):
+                continue
+            idf = math.log(1 + self.total_passages / len(hits))
+            if allowed is not None:
+                hits = hits[np.isin(hits["doc"], allowed)]
+            keys.append((hits["doc"].astype(np.int64) << 16) | hits["passage"])
+            weights.append((1 + np.log(hits["tf"].astype(np.float64))) * idf)
+        if not keys:
+            return []
+
+        unique_keys, inverse = np.unique(np.concatenate(keys), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(weights))
+        matched = np.bincount(inverse)
+        top = np.lexsort((-scores, -matched))[:limit]
+        ranked = [(int(unique_keys[i] >> 16), int(unique_keys[i] & 0xFFFF), float(scores[i]), int(matched[i]))
+                  for i in top]
+
+        results = []
+        for doc_id, passage, score, matched_terms in ranked:
+            video_id, doc = self.docs_by_id[doc_id]
+            results.append({
+                "video_id": video_id,
+                "passage": passage,
+                "score": round(score, 3),
+                "matched_terms": matched_terms,
+                "text": self.segments[doc["segment"]].passage(doc["first_row"] + passage),
+            })
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        self._refresh()
+        return {"documents": len(self.docs_by_id), "passages": self.total_passages,
+                "segments": len(self.segments), "deleted": len(self.deleted)}
+
+
+_index: Optional[TranscriptIndex] = None
+
+
+def get_transcript_index() -> TranscriptIndex:
+    """
+    Delad läsare för processen
+    """
+    global _index
+    if _index is None:
+        _index = TranscriptIndex(TRANSCRIPT_INDEX_DIR)
+    return _index
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Passageindex över podcasttranskript")
+    parser.add_argument("command", choices=["build", "search", "stats"])
+    parser.add_argument("query", nargs="?", help="search: sökfråga")
+    parser.add_argument("--index-dir", default=TRANSCRIPT_INDEX_DIR, help="Indexkatalog")
+    parser.add_argument("--transcripts-dir", default=TRANSCRIPTS_DIR, help="build: katalog med transkript")
+    parser.add_argument("--full", action="store_true", help="build: bygg om hela indexet")
+    parser.add_argument("--limit", type=int, default=10, help="search: max antal passager")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        started = time.perf_counter()
+        stats = TranscriptIndexBuilder(args.index_dir, args.transcripts_dir).build(full=args.full)
+        print(f"{stats} på {time.perf_counter() - started:.1f}s")
+    elif args.command == "stats":
+        print(TranscriptIndex(args.index_dir).stats())
+    else:
+        if not args.query:
+            parser.error("search kräver en sökfråga")
+        index = TranscriptIndex(args.index_dir)
+        started = time.perf_counter()
+        results = index.search(args.query, args.limit)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        for result in results:
+            print(f"{result['video_id']} #{result['passage']} ({result['score']}): {result['text'][:200]}")
+        print(f"{len(results)} passager på {elapsed_ms:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
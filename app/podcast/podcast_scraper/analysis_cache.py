@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+Durable cache for Gemini analysis results.
+
+Entries are keyed by (transcript hash, podcast, prompt template version, model),
+so re-running a playlist or re-importing the same transcript reuses the stored
+result, while any change to the prompt template or model misses the cache.
+
+Usage:
+    python analysis_cache.py list [--podcast NAME]
+    python analysis_cache.py purge [--podcast NAME] [--stale] [--failed] [--all]
+    python analysis_cache.py warm --podcast NAME [--video-ids ID ...]
+"""
+import os
+import sys
+import json
+import sqlite3
+import hashlib
+import argparse
+from datetime import datetime
+from typing import Dict, List, Optional, Any
+
+
+def transcript_hash(text: str) -> str:
+    """
+    Stable hash of the transcript text
+
+    :param text: Transcript text
+    :return: SHA-256 hex digest
+    """
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def prompt_version(template: str) -> str:
+    """
+    Version identifier derived from the prompt template itself
+
+    :param template: Prompt template string
+    :return: Short hash that changes whenever the template changes
+    """
+    return hashlib.sha256(template.encode('utf-8')).hexdigest()[:12]
+
+
+class AnalysisCache:
+    def __init__(self, db_path: str):
+        """
+        Open (or create) the SQLite-backed analysis cache
+
+        :param db_path: Path to the SQLite file
+        """
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS analysis_cache (
+                cache_key TEXT PRIMARY KEY,
+                transcript_hash TEXT NOT NULL,
+                podcast_name TEXT NOT NULL,
+                prompt_version TEXT NOT NULL,
+                model TEXT NOT NULL,
+                episode_title TEXT,
+                transcript_chars INTEGER,
+                result_json TEXT NOT NULL,
+                quality_ok INTEGER NOT NULL,
+                created_at TEXT NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_analysis_cache_podcast ON analysis_cache(podcast_name)"
+        )
+        self._conn.commit()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(text_hash: str, podcast_name: str, version: str, model: str) -> str:
+        """
+        Build the cache key
+
+        :param text_hash: Transcript hash
+        :param podcast_name: Podcast name
+        :param version: Prompt template version
+        :param model: Gemini model name
+        :return: Cache key
+        """
+        raw = '\x1f'.join([text_hash, podcast_name, version, model])
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get(self, text: str, podcast_name: str, version: str, model: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up a cached analysis
+
+        :return: Dictionary with 'result' and 'quality_ok', or None on a miss
+        """
+        key = self.make_key(transcript_hash(text), podcast_name, version, model)
+        row = self._conn.execute(
+            "SELECT result_json, quality_ok FROM analysis_cache WHERE cache_key = ?", (key,)
+        ).fetchone()
+        if not row:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._conn.execute("UPDATE analysis_cache SET hits = hits + 1 WHERE cache_key = ?", (key,))
+        self._conn.commit()
+        return {'result': json.loads(row[0]), 'quality_ok': bool(row[1])}
+
+    def put(self, text: str, podcast_name: str, version: str, model: str,
+            result: Dict[str, Any], quality_ok: bool, episode_title: str = None):
+        """
+        Store a parsed Gemini result together with its quality-check outcome
+        """
+        text_hash = transcript_hash(text)
+        key = self.make_key(text_hash, podcast_name, version, model)
+        self._conn.execute(
+            """
+            INSERT OR REPLACE INTO analysis_cache
+                (cache_key, transcript_hash, podcast_name, prompt_version, model,
+                 episode_title, transcript_chars, result_json, quality_ok, created_at, hits)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 0)
+            """,
+            (key, text_hash, podcast_name, version, model, episode_title, len(text),
+             json.dumps(result, ensure_ascii=False), int(bool(quality_ok)), datetime.now().isoformat())
+        )
+        self._conn.commit()
+
+    def list_entries(self, podcast_name: str = None) -> List[Dict[str, Any]]:
+        """
+        List cache entries (without the stored results)
+
+        :param podcast_name: Optional podcast filter
+        :return: List of entry dictionaries
+        """
+        query = ("SELECT podcast_name, episode_title, transcript_hash, prompt_version, model, "
+                 "quality_ok, transcript_chars, created_at, hits FROM analysis_cache")
+        params = ()
+        if podcast_name:
+            query += " WHERE podcast_name = ?"
+            params = (podcast_name,)
+        query += " ORDER BY created_at DESC"
+        columns = ['podcast_name', 'episode_title', 'transcript_hash', 'prompt_version', 'model',
+                   'quality_ok', 'transcript_chars', 'created_at', 'hits']
+        return [dict(zip(columns, row)) for row in self._conn.execute(query, params)]
+
+    def purge(self, podcast_name: str = None, current_version: str = None,
+              current_model: str = None, failed_only: bool = False) -> int:
+        """
+        Delete cache entries
+
+        :param podcast_name: Only purge entries for this podcast
+        :param current_version: If set, only purge entries with a different prompt version or model
+        :param current_model: Model used together with current_version for stale detection
+        :param failed_only: Only purge entries that failed the quality check
+        :return: Number of deleted entries
+        """
+        clauses, params = [], []
+        if podcast_name:
+            clauses.append("podcast_name = ?")
+            params.append(podcast_name)
+        if current_version:
+            clauses.append("(prompt_version != ? OR model != ?)")
+            params.extend([current_version, current_model or ''])
+        if failed_only:
+            clauses.append("quality_ok = 0")
+        query = "DELETE FROM analysis_cache"
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        cursor = self._conn.execute(query, params)
+        self._conn.commit()
+        return cursor.rowcount
+
+    def close(self):
+        self._conn.close()
+
+
+def main():
+    # Importeras här så att cachen kan användas utan analysatorns beroenden
+    from dotenv import load_dotenv
+    from youtube_podcast_analyser import YouTubePodcastAnalyzer, GEMINI_MODEL, PROMPT_VERSION
+
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description='Manage the Gemini analysis cache')
+    parser.add_argument('command', choices=['list', 'purge', 'warm'])
+    parser.add_argument('--output-dir', '-o', default='podcast_data',
+                        help='Data directory containing analysis_cache.sqlite')
+    parser.add_argument('--podcast', '-p', help='Restrict to one podcast')
+    parser.add_argument('--stale', action='store_true',
+                        help='purge: only entries from an older prompt version or model')
+    parser.add_argument('--failed', action='store_true',
+                        help='purge: only entries that failed the quality check')
+    parser.add_argument('--all', action='store_true', help='purge: delete every entry')
+    parser.add_argument('--video-ids', nargs='+',
+                        help='warm: only these cached transcripts (default: all in transcripts/)')
+    args = parser.parse_args()
+
+    cache = AnalysisCache(os.path.join(args.output_dir, 'analysis_cache.sqlite'))
+
+    if args.command == 'list':
+        entries = cache.list_entries(args.podcast)
+        for entry in entries:
+            status = 'ok' if entry['quality_ok'] else 'low-quality'
+            current = '' if entry['prompt_version'] == PROMPT_VERSION and entry['model'] == GEMINI_MODEL else ' (stale)'
+            print(f"{entry['created_at'][:19]}  {entry['podcast_name']:<20} {entry['transcript_hash'][:10]} "
+                  f"{entry['prompt_version']} {entry['model']} {status:<11} hits={entry['hits']}{current}  "
+                  f"{entry['episode_title'] or ''}")
+        print(f"{len(entries)} entries")
+
+    elif args.command == 'purge':
+        if not (args.all or args.stale or args.failed or args.podcast):
+            print("Refusing to purge everything without --all")
+            sys.exit(1)
+        deleted = cache.purge(
+            podcast_name=args.podcast,
+            current_version=PROMPT_VERSION if args.stale else None,
+            current_model=GEMINI_MODEL,
+            failed_only=args.failed
+        )
+        print(f"Deleted {deleted} entries")
+
+    elif args.command == 'warm':
+        if not args.podcast:
+            print("warm requires --podcast")
+            sys.exit(1)
+        analyzer = YouTubePodcastAnalyzer(os.getenv('YOUTUBE_API_KEY'), os.getenv('GOOGLE_API_KEY'), args.output_dir)
+        analyzer.analysis_cache = cache
+        transcripts_dir = os.path.join(args.output_dir, 'transcripts')
+        video_ids = args.video_ids or sorted(
+            name[:-4] for name in os.listdir(transcripts_dir)
+            if name.endswith('.txt')
+        )
+        cached, analyzed, skipped, failed = 0, 0, 0, 0
+        for video_id in video_ids:
+            path = os.path.join(transcripts_dir, f'{video_id}.txt')
+            if not os.path.exists(path):
+                print(f"No cached transcript for {video_id}")
+                continue
+            with open(path, 'r', encoding='utf-8') as f:
+                text = f.read()
+            # Cachen nycklas på den förfiltrerade texten, precis som i analysen
+            prepared = analyzer.prefilter_text(text, video_id)
+            if prepared is None:
+                skipped += 1
+                continue
+            entry = cache.get(prepared, args.podcast, PROMPT_VERSION, GEMINI_MODEL)
+            if entry and entry['quality_ok']:
+                cached += 1
+                continue
+            title = analyzer.get_video_info(f"https://www.youtube.com/watch?v={video_id}")['title']
+            failures = {}
+            # Den redan förfiltrerade texten skickas direkt så att förfiltret inte körs två gånger
+            analyzer.analyze_many_with_gemini([(video_id, prepared, args.podcast, title)], failures=failures,
+                                              prefiltered=True)
+            if failures:
+                failed += 1
+            else:
+                analyzed += 1
+        print(f"Warm finished: {cached} already cached, {analyzed} analyzed, {failed} failed, "
+              f"{skipped} without financial content")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,468 @@
+#!/usr/bin/env python3
+"""
+Append-only analysis store partitioned by podcast and month.
+
+Layout under <data_dir>/analysis_store:
+
+    video_index.jsonl                               one line per stored episode
+    podcast=<slug>/month=YYYY-MM/episodes.jsonl     episode metadata and summary
+    podcast=<slug>/month=YYYY-MM/mentions.jsonl     one line per episode, mention
+                                                    fields stored as column arrays
+
+Readers prune partitions on podcast and month before opening any file, and
+skip mention lines that cannot contain the requested ticker before parsing
+them. Re-analysing an episode appends a new record; the newest one wins,
+also when it lands in another partition (the video index records where the
+newest record of each video lives).
+
+Usage:
+    python analysis_store.py migrate [--data-dir DIR]
+    python analysis_store.py query [--podcast NAME] [--start YYYY-MM-DD] [--end YYYY-MM-DD] [--ticker T]
+    python analysis_store.py stats [--data-dir DIR]
+"""
+import os
+import re
+import json
+import shutil
+import logging
+import argparse
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: bara lås inom processen
+    fcntl = None
+
+logger = logging.getLogger('youtube_podcast_analyzer')
+
+STORE_DIRNAME = 'analysis_store'
+LEGACY_DIRNAME = 'legacy_json'
+EPISODES_FILE = 'episodes.jsonl'
+MENTIONS_FILE = 'mentions.jsonl'
+INDEX_FILE = 'video_index.jsonl'
+# Skrivs när de gamla JSON-filerna har flyttats in, så att det bara görs en gång
+MIGRATED_MARKER = '.legacy_migrated'
+
+# Mentionfält i fast ordning; okända fält från Gemini läggs till efter dessa
+MENTION_FIELDS = ('name', 'ticker', 'context', 'sentiment', 'recommendation', 'price_info', 'mention_reason')
+
+_MONTH_PATTERN = re.compile(r'^\d{4}-\d{2}')
+# Gamla analysfiler: <podcast>[_ep<n>][_pub<datum>]_<YYYYMMDD>_<HHMMSS>.json
+_LEGACY_FILENAME = re.compile(r'^.+_\d{8}_\d{6}\.json$')
+# video_id skrivs alltid först på varje rad
+_VIDEO_ID_PREFIX = re.compile(r'^\{"video_id": ("(?:[^"\\]|\\.)*"|null)')
+
+
+def podcast_slug(podcast_name: str) -> str:
+    """
+    Partition name for a podcast (same convention as the old JSON filenames)
+    """
+    return podcast_name.replace(' ', '_').replace(os.sep, '_').lower()
+
+
+def item_date(item: Dict[str, Any], analysis_date: str) -> str:
+    """
+    Date used for partitioning and date filters: publish date, else analysis date
+
+    :return: 'YYYY-MM-DD'
+    """
+    published = item.get('published_at') or ''
+    if _MONTH_PATTERN.match(published):
+        return published[:10]
+    return analysis_date[:10]
+
+
+def mentions_to_columns(mentions: List[Dict[str, Any]]) -> Dict[str, List[Any]]:
+    """
+    Convert a list of mention dicts to column arrays
+    """
+    columns = list(MENTION_FIELDS)
+    for mention in mentions:
+        for key in mention:
+            if key not in columns:
+                columns.append(key)
+    return {column: [mention.get(column) for mention in mentions] for column in columns}
+
+
+def columns_to_mentions(columns: Dict[str, List[Any]], count: int) -> List[Dict[str, Any]]:
+    """
+    Convert column arrays back to mention dicts (missing values are dropped)
+    """
+    mentions = [{} for _ in range(count)]
+    for column, values in columns.items():
+        for mention, value in zip(mentions, values):
+            if value is not None:
+                mention[column] = value
+    return mentions
+
+
+class AnalysisStore:
+    def __init__(self, data_dir: str):
+        """
+        Open the store in <data_dir>/analysis_store
+
+        :param data_dir: Analyzer data directory
+        """
+        self.root = os.path.join(data_dir, STORE_DIRNAME)
+        os.makedirs(self.root, exist_ok=True)
+        self._index: Optional[Dict[str, Tuple[str, str]]] = None
+        self._index_size = 0
+        self._lock = threading.Lock()
+
+    # ------------------------------------------------------------------ skrivning
+
+    def _partition_dir(self, slug: str, month: str) -> str:
+        return os.path.join(self.root, f'podcast={slug}', f'month={month}')
+
+    @staticmethod
+    def _append_lines(path: str, records: List[Dict[str, Any]]):
+        # Ett enda write-anrop i append-läge per batch
+        payload = ''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in records)
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(payload)
+
+    def append(self, podcast_name: str, items: List[Dict[str, Any]],
+               analysis_date: Optional[str] = None) -> List[str]:
+        """
+        Append analyzed episodes
+
+        :param podcast_name: Podcast name
+        :param items: Analyzed items (episode fields plus 'mentions')
+        :param analysis_date: ISO timestamp of the analysis (default now)
+        :return: Episode partition files written to
+        """
+        analysis_date = analysis_date or datetime.now().isoformat()
+        slug = podcast_slug(podcast_name)
+
+        partitions: Dict[str, Dict[str, List[Dict[str, Any]]]] = {}
+        index_records = []
+        for item in items:
+            date = item_date(item, analysis_date)
+            month = date[:7]
+            episode = {key: value for key, value in item.items() if key != 'mentions'}
+            episode.update({'podcast_name': podcast_name, 'analysis_date': analysis_date, 'date': date})
+            mentions = item.get('mentions', [])
+            mention_line = {
+                'video_id': item.get('video_id'),
+                'podcast_name': podcast_name,
+                'date': date,
+                'analysis_date': analysis_date,
+                'count': len(mentions),
+                'columns': mentions_to_columns(mentions),
+            }
+            bucket = partitions.setdefault(month, {'episodes': [], 'mentions': []})
+            bucket['episodes'].append(episode)
+            bucket['mentions'].append(mention_line)
+            index_records.append({'video_id': item.get('video_id'), 'podcast': slug, 'month': month})
+
+        written = []
+        with self._lock, open(os.path.join(self.root, '.append.lock'), 'a') as lock_file:
+            # Fillåset serialiserar skrivningar från flera arbetarprocesser
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            for month, bucket in sorted(partitions.items()):
+                directory = self._partition_dir(slug, month)
+                os.makedirs(directory, exist_ok=True)
+                self._append_lines(os.path.join(directory, EPISODES_FILE), bucket['episodes'])
+                self._append_lines(os.path.join(directory, MENTIONS_FILE), bucket['mentions'])
+                written.append(os.path.join(directory, EPISODES_FILE))
+            index_path = os.path.join(self.root, INDEX_FILE)
+            index_size = os.path.getsize(index_path) if os.path.exists(index_path) else 0
+            self._append_lines(index_path, index_records)
+            if self._index is not None and index_size == self._index_size:
+                # Ingen annan process har skrivit sedan indexet lästes - uppdatera i minnet
+                for record in index_records:
+                    self._index[record['video_id']] = (record['podcast'], record['month'])
+                self._index_size = os.path.getsize(index_path)
+        return written
+
+    # ------------------------------------------------------------------ läsning
+
+    def _load_index(self) -> Dict[str, Tuple[str, str]]:
+        path = os.path.join(self.root, INDEX_FILE)
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        if self._index is None or size != self._index_size:
+            # Läses om när filen har växt, t.ex. efter skrivningar från en annan arbetarprocess
+            index = {}
+            if size:
+                with open(path, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        if line.strip():
+                            record = json.loads(line)
+                            index[record['video_id']] = (record['podcast'], record['month'])
+            self._index = index
+            self._index_size = size
+        return self._index
+
+    def _latest_locations(self) -> Dict[str, Tuple[str, str]]:
+        """
+        Mapping video_id -> (podcast slug, month) of the newest record
+        """
+        with self._lock:
+            return self._load_index()
+
+    @staticmethod
+    def _is_latest(locations: Dict[str, Tuple[str, str]], video_id: Optional[str],
+                   slug: str, month: str) -> bool:
+        # Poster för en video som senare sparats i en annan partition är inaktuella
+        location = locations.get(video_id) if video_id else None
+        return location is None or location == (slug, month)
+
+    def has_video(self, video_id: str) -> bool:
+        """
+        Check whether an episode has been stored (reads only the video index)
+        """
+        with self._lock:
+            return video_id in self._load_index()
+
+    def partitions(self, podcast: Optional[str] = None, start: Optional[str] = None,
+                   end: Optional[str] = None) -> List[Tuple[str, str, str]]:
+        """
+        List partitions matching the filters
+
+        :param podcast: Podcast name (or slug)
+        :param start: First date 'YYYY-MM-DD' (inclusive)
+        :param end: Last date 'YYYY-MM-DD' (inclusive)
+        :return: List of (podcast slug, month, directory)
+        """
+        wanted_slug = podcast_slug(podcast) if podcast else None
+        result = []
+        for podcast_dir in sorted(os.listdir(self.root)):
+            if not podcast_dir.startswith('podcast='):
+                continue
+            slug = podcast_dir[len('podcast='):]
+            if wanted_slug and slug != wanted_slug:
+                continue
+            for month_dir in sorted(os.listdir(os.path.join(self.root, podcast_dir))):
+                month = month_dir[len('month='):]
+                if start and month < start[:7]:
+                    continue
+                if end and month > end[:7]:
+                    continue
+                result.append((slug, month, os.path.join(self.root, podcast_dir, month_dir)))
+        return result
+
+    @staticmethod
+    def _in_range(date: str, start: Optional[str], end: Optional[str]) -> bool:
+        return (not start or date >= start[:10]) and (not end or date <= end[:10])
+
+    def _read_mention_lines(self, directory: str, start: Optional[str], end: Optional[str],
+                            ticker: Optional[str], slug: str, month: str,
+                            locations: Dict[str, Tuple[str, str]]) -> Dict[str, Dict[str, Any]]:
+        path = os.path.join(directory, MENTIONS_FILE)
+        lines: Dict[str, Dict[str, Any]] = {}
+        if not os.path.exists(path):
+            return lines
+        needle = ticker.upper() if ticker else None
+        with open(path, 'r', encoding='utf-8') as f:
+            for raw in f:
+                # Billig förfiltrering på rå text innan JSON-tolkning; en nyare rad utan
+                # tickern ersätter ändå en äldre rad för samma video
+                if needle and needle not in raw.upper():
+                    match = _VIDEO_ID_PREFIX.match(raw)
+                    if match:
+                        lines.pop(json.loads(match.group(1)), None)
+                    continue
+                record = json.loads(raw)
+                if not self._in_range(record['date'], start, end):
+                    continue
+                if not self._is_latest(locations, record['video_id'], slug, month):
+                    continue
+                lines[record['video_id']] = record
+        if needle:
+            lines = {
+                video_id: record for video_id, record in lines.items()
+                if any((value or '').upper() == needle for value in record['columns'].get('ticker', []))
+            }
+        return lines
+
+    def iter_mentions(self, podcast: Optional[str] = None, start: Optional[str] = None,
+                      end: Optional[str] = None, ticker: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Iterate over stock mentions, flattened with their episode keys
+
+        :param podcast: Podcast name filter
+        :param start: First date 'YYYY-MM-DD'
+        :param end: Last date 'YYYY-MM-DD'
+        :param ticker: Only mentions of this ticker (case-insensitive)
+        :return: Iterator of dicts with video_id, podcast_name, date and the mention fields
+        """
+        needle = ticker.upper() if ticker else None
+        locations = self._latest_locations()
+        for slug, month, directory in self.partitions(podcast, start, end):
+            for record in self._read_mention_lines(directory, start, end, ticker, slug, month, locations).values():
+                for mention in columns_to_mentions(record['columns'], record['count']):
+                    if needle and (mention.get('ticker') or '').upper() != needle:
+                        continue
+                    yield {
+                        'video_id': record['video_id'],
+                        'podcast_name': record['podcast_name'],
+                        'date': record['date'],
+                        **mention,
+                    }
+
+    def iter_episodes(self, podcast: Optional[str] = None, start: Optional[str] = None,
+                      end: Optional[str] = None, ticker: Optional[str] = None,
+                      with_mentions: bool = True) -> Iterator[Dict[str, Any]]:
+        """
+        Iterate over stored episodes (newest record per video)
+
+        :param podcast: Podcast name filter
+        :param start: First date 'YYYY-MM-DD'
+        :param end: Last date 'YYYY-MM-DD'
+        :param ticker: Only episodes mentioning this ticker
+        :param with_mentions: Attach the 'mentions' list
+        :return: Iterator of items in the same shape save_analysis received
+        """
+        locations = self._latest_locations()
+        for slug, month, directory in self.partitions(podcast, start, end):
+            mention_lines = None
+            if ticker or with_mentions:
+                mention_lines = self._read_mention_lines(directory, start, end, ticker, slug, month, locations)
+                if ticker and not mention_lines:
+                    continue
+
+            episodes: Dict[str, Dict[str, Any]] = {}
+            path = os.path.join(directory, EPISODES_FILE)
+            if not os.path.exists(path):
+                continue
+            with open(path, 'r', encoding='utf-8') as f:
+                for raw in f:
+                    record = json.loads(raw)
+                    if ticker and record.get('video_id') not in mention_lines:
+                        continue
+                    if not self._is_latest(locations, record.get('video_id'), slug, month):
+                        continue
+                    if self._in_range(record['date'], start, end):
+                        episodes[record.get('video_id')] = record
+
+            for video_id, episode in episodes.items():
+                if with_mentions:
+                    line = mention_lines.get(video_id)
+                    episode['mentions'] = columns_to_mentions(line['columns'], line['count']) if line else []
+                yield episode
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Partition, episode and mention counts
+        """
+        partitions = self.partitions()
+        episodes = mentions = 0
+        for _, _, directory in partitions:
+            path = os.path.join(directory, MENTIONS_FILE)
+            if os.path.exists(path):
+                with open(path, 'r', encoding='utf-8') as f:
+                    for raw in f:
+                        episodes += 1
+                        mentions += json.loads(raw)['count']
+        return {
+            'partitions': len(partitions),
+            'podcasts': len({slug for slug, _, _ in partitions}),
+            'episode_records': episodes,
+            'mentions': mentions,
+            'unique_videos': len(self._latest_locations()),
+        }
+
+
+def find_legacy_json_files(data_dir: str) -> List[str]:
+    """
+    Find the old one-file-per-episode analysis JSON files in data_dir
+
+    Only files named like the old save_analysis output are opened, so caches
+    and state files in the same directory are never parsed.
+    """
+    files = []
+    for filename in sorted(os.listdir(data_dir)):
+        path = os.path.join(data_dir, filename)
+        if not _LEGACY_FILENAME.match(filename) or not os.path.isfile(path):
+            continue
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except Exception as e:
+            logger.warning(f"Could not check file {filename}: {e}")
+            continue
+        if isinstance(data, dict) and 'podcast_name' in data and isinstance(data.get('items'), list):
+            files.append(path)
+    return files
+
+
+def migrate_legacy_json(data_dir: str, store: Optional[AnalysisStore] = None) -> Dict[str, int]:
+    """
+    Append every old analysis JSON file to the store and move it to legacy_json/
+
+    :param data_dir: Analyzer data directory
+    :param store: Store to write to (default: the store in data_dir)
+    :return: Counts of migrated files and items
+    """
+    store = store or AnalysisStore(data_dir)
+    legacy_dir = os.path.join(data_dir, LEGACY_DIRNAME)
+    migrated_files = migrated_items = 0
+
+    for path in find_legacy_json_files(data_dir):
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        items = [item for item in data['items'] if item.get('video_id')]
+        if items:
+            store.append(data['podcast_name'], items, analysis_date=data.get('analysis_date'))
+        os.makedirs(legacy_dir, exist_ok=True)
+        shutil.move(path, os.path.join(legacy_dir, os.path.basename(path)))
+        migrated_files += 1
+        migrated_items += len(items)
+
+    if migrated_files:
+        logger.info(f"Migrated {migrated_items} items from {migrated_files} JSON files to {store.root}")
+    with open(os.path.join(store.root, MIGRATED_MARKER), 'w', encoding='utf-8') as f:
+        f.write(datetime.now().isoformat())
+    return {'files': migrated_files, 'items': migrated_items}
+
+
+def migrate_legacy_json_once(data_dir: str, store: Optional[AnalysisStore] = None) -> Optional[Dict[str, int]]:
+    """
+    Run migrate_legacy_json unless the store has already been migrated
+
+    Later legacy files can still be moved in with 'analysis_store.py migrate'.
+
+    :return: Migration counts, or None when the migration had already run
+    """
+    store = store or AnalysisStore(data_dir)
+    if os.path.exists(os.path.join(store.root, MIGRATED_MARKER)):
+        return None
+    return migrate_legacy_json(data_dir, store)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Manage the partitioned analysis store')
+    parser.add_argument('command', choices=['migrate', 'query', 'stats'])
+    parser.add_argument('--data-dir', '-o', default='podcast_data', help='Analyzer data directory')
+    parser.add_argument('--podcast', '-p', help='query: podcast name')
+    parser.add_argument('--start', help='query: first date (YYYY-MM-DD)')
+    parser.add_argument('--end', help='query: last date (YYYY-MM-DD)')
+    parser.add_argument('--ticker', '-t', help='query: ticker')
+    args = parser.parse_args()
+
+    store = AnalysisStore(args.data_dir)
+
+    if args.command == 'migrate':
+        result = migrate_legacy_json(args.data_dir, store)
+        print(f"Migrated {result['items']} items from {result['files']} files "
+              f"(originals moved to {os.path.join(args.data_dir, LEGACY_DIRNAME)})")
+
+    elif args.command == 'query':
+        count = 0
+        for mention in store.iter_mentions(args.podcast, args.start, args.end, args.ticker):
+            print(f"{mention['date']}  {mention['podcast_name']:<20} {mention.get('ticker') or '-':<10} "
+                  f"{mention.get('sentiment') or '':<9} {mention.get('recommendation') or '':<6} "
+                  f"{mention.get('name') or ''}")
+            count += 1
+        print(f"{count} mentions")
+
+    elif args.command == 'stats':
+        for key, value in store.stats().items():
+            print(f"{key}: {value}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Micro benchmarks for the podcast pipeline.
+
+Usage:
+    python benchmarks.py bulk-save [--episodes 1000] [--mentions 5] [--db-url URL]
+"""
+import os
+import time
+import random
+import argparse
+import tempfile
+from datetime import datetime
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from models import Base, Podcast, Episode, StockMention
+from episode_writer import EpisodeBulkWriter, episode_row, mention_row
+
+
+def make_items(count, mentions_per_item, prefix='bench'):
+    """
+    Build synthetic analyzed items shaped like the Gemini pipeline output
+    """
+    tickers = ['VOLV-B', 'ERIC-B', 'INVE-B', 'HM-B', 'SEB-A', 'ABB', 'AZN', 'SAND']
+    items = []
+    for i in range(count):
+        items.append({
+            'video_id': f'{prefix}{i:07d}',
+            'title': f'Avsnitt {i}',
+            'video_url': f'https://www.youtube.com/watch?v={prefix}{i:07d}',
+            'published_at': '2024-01-01T06:00:00Z',
+            'description': 'Beskrivning ' * 20,
+            'summary': 'Sammanfattning ' * 30,
+            'transcript_length': 40000,
+            'mentions': [{
+                'name': f'Bolag {j}',
+                'ticker': random.choice(tickers),
+                'context': 'Kontext ' * 10,
+                'sentiment': random.choice(['positive', 'neutral', 'negative']),
+                'recommendation': random.choice(['buy', 'hold', 'sell', 'none']),
+                'price_info': '',
+                'mention_reason': 'Rapport',
+            } for j in range(mentions_per_item)],
+        })
+    return items
+
+
+def legacy_save(engine, podcast_name, items):
+    """
+    Reference implementation of the old per-item ORM path (one SELECT per episode)
+    """
+    session = sessionmaker(bind=engine)()
+    try:
+        podcast = session.query(Podcast).filter_by(name=podcast_name).first()
+        if not podcast:
+            podcast = Podcast(name=podcast_name)
+            session.add(podcast)
+            session.flush()
+        now = datetime.now()
+        for item in items:
+            if session.query(Episode).filter_by(video_id=item['video_id']).first():
+                continue
+            episode = Episode(**episode_row(item, podcast.id, now))
+            session.add(episode)
+            session.flush()
+            for mention in item['mentions']:
+                session.add(StockMention(**mention_row(mention, episode.id)))
+        session.commit()
+    finally:
+        session.close()
+
+
+def bench_bulk_save(args):
+    items = make_items(args.episodes, args.mentions)
+    rows = args.episodes * (1 + args.mentions)
+
+    def fresh_engine(name):
+        if args.db_url:
+            engine = create_engine(args.db_url)
+            Base.metadata.drop_all(engine)
+        else:
+            engine = create_engine(f"sqlite:///{os.path.join(tmp_dir, name)}")
+        Base.metadata.create_all(engine)
+        return engine
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        engine = fresh_engine('legacy.sqlite')
+        started = time.perf_counter()
+        legacy_save(engine, 'Benchmark', items)
+        legacy_seconds = time.perf_counter() - started
+        engine.dispose()
+
+        engine = fresh_engine('bulk.sqlite')
+        writer = EpisodeBulkWriter(engine)
+        started = time.perf_counter()
+        stats = writer.write('Benchmark', items)
+        bulk_seconds = time.perf_counter() - started
+
+        # Andra körningen: allt finns redan, bara förladdningen av video_id körs
+        started = time.perf_counter()
+        rerun = writer.write('Benchmark', items)
+        rerun_seconds = time.perf_counter() - started
+        engine.dispose()
+
+    print(f"{args.episodes} episodes, {args.mentions} mentions each ({rows} rows), {engine.dialect.name}")
+    print(f"  legacy per-item : {legacy_seconds:7.3f}s  {rows / legacy_seconds:10.0f} rows/s")
+    print(f"  bulk upsert     : {bulk_seconds:7.3f}s  {rows / bulk_seconds:10.0f} rows/s  "
+          f"(inserted {stats['episodes_inserted']} episodes, {stats['mentions_inserted']} mentions)")
+    print(f"  bulk re-run     : {rerun_seconds:7.3f}s  (skipped {rerun['episodes_skipped']} episodes)")
+    print(f"  speedup         : {legacy_seconds / bulk_seconds:.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Podcast pipeline benchmarks')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    bulk = subparsers.add_parser('bulk-save', help='Per-item ORM save vs bulk upsert')
+    bulk.add_argument('--episodes', type=int, default=1000)
+    bulk.add_argument('--mentions', type=int, default=5, help='Mentions per episode')
+    bulk.add_argument('--db-url', help='Database URL (default: temporary SQLite file). '
+                                       'WARNING: drops and recreates the podcast tables')
+    bulk.set_defaults(func=bench_bulk_save)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""
+Bulk writer for analyzed episodes and their stock mentions.
+
+Existing video_ids are preloaded with one query, episodes are inserted with
+multi-row INSERT ... ON CONFLICT (video_id) DO NOTHING/UPDATE RETURNING, and
+mentions are inserted in batches for the returned episode IDs. The daily
+mention rollups (date, ticker, source) used for trending queries are updated
+from the same rows. Everything for one call happens in a single transaction.
+Works on PostgreSQL and SQLite.
+"""
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import select, delete, func, inspect
+
+from models import Podcast, Episode, StockMention, MentionDailyRollup
+
+logger = logging.getLogger('youtube_podcast_analyzer')
+
+# Rader per INSERT-sats; håller SQLite under gränsen för antal bundna parametrar
+DEFAULT_CHUNK_SIZE = 500
+CONFLICT_MODES = ('nothing', 'update')
+
+ROLLUP_SOURCE = 'podcast'
+# Delsträngar i gemen text, i den ordning de prövas (samma regler som mention_codes.py i API:t)
+SENTIMENT_PATTERNS = (('positiv', 1.0), ('negativ', -1.0), ('neutral', 0.0))
+RECOMMENDATION_PATTERNS = (('buy', ('köp', 'buy')), ('sell', ('sälj', 'sell')), ('hold', ('håll', 'hold')))
+MENTION_CODE_COLUMNS = ('sentiment_value', 'recommendation_code')
+
+
+def dialect_insert(engine):
+    """
+    Get the dialect-specific insert() that supports ON CONFLICT
+
+    :param engine: SQLAlchemy engine or connection
+    :return: insert function
+    """
+    name = engine.dialect.name
+    if name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise ValueError(f"Bulk upsert is not supported for dialect {name}")
+    return insert
+
+
+def parse_published_at(value: Optional[str]) -> Optional[datetime]:
+    """
+    Parse the YouTube publishedAt value (only the date part is kept)
+
+    :param value: ISO 8601 string, 'Unknown' or None
+    :return: datetime or None
+    """
+    if not value or value == 'Unknown':
+        return None
+    try:
+        return datetime.strptime(value.split('T')[0], '%Y-%m-%d')
+    except Exception as e:
+        logger.warning(f"Kunde inte tolka publiceringsdatum: {e}")
+        return None
+
+
+def episode_row(item: Dict[str, Any], podcast_id: int, analysis_date: datetime) -> Dict[str, Any]:
+    """
+    Convert an analyzed item to an episodes row (same truncation as the ORM path)
+    """
+    return {
+        'video_id': item['video_id'],
+        'title': item.get('title', 'Okänd titel')[:255],
+        'video_url': item.get('video_url', '')[:512],
+        'published_at': parse_published_at(item.get('published_at')),
+        'description': item.get('description', '')[:1000],
+        'summary': item.get('summary', '')[:2000],
+        'transcript_length': item.get('transcript_length', 0),
+        'analysis_date': analysis_date,
+        'podcast_id': podcast_id,
+    }
+
+
+def sentiment_value(text: Optional[str]) -> Optional[float]:
+    """
+    Free-text sentiment as a number: 1 positive, 0 neutral, -1 negative, None unknown
+    """
+    lowered = (text or '').lower()
+    for pattern, value in SENTIMENT_PATTERNS:
+        if pattern in lowered:
+            return value
+    return None
+
+
+def recommendation_code(text: Optional[str]) -> str:
+    """
+    Free-text recommendation as 'buy', 'sell', 'hold' or 'none'
+    """
+    lowered = (text or '').lower()
+    for code, patterns in RECOMMENDATION_PATTERNS:
+        if any(pattern in lowered for pattern in patterns):
+            return code
+    return 'none'
+
+
+def mention_row(mention: Dict[str, Any], episode_id: int) -> Dict[str, Any]:
+    """
+    Convert a Gemini mention to a stock_mentions row (with the normalized codes)
+    """
+    sentiment = (mention.get('sentiment') or 'neutral')[:50]
+    recommendation = (mention.get('recommendation') or 'none')[:50]
+    return {
+        'name': (mention.get('name') or 'Okänt')[:255],
+        'ticker': (mention.get('ticker') or '')[:50],
+        'context': (mention.get('context') or '')[:500],
+        'sentiment': sentiment,
+        'recommendation': recommendation,
+        'sentiment_value': sentiment_value(sentiment),
+        'recommendation_code': recommendation_code(recommendation),
+        'price_info': (mention.get('price_info') or '')[:255],
+        'mention_reason': (mention.get('mention_reason') or '')[:255],
+        'episode_id': episode_id,
+    }
+
+
+def add_rollup_delta(deltas: Dict[tuple, list], published_at: Optional[datetime], ticker: Optional[str],
+                     name: Optional[str], value: Optional[float], count: int = 1):
+    """
+    Add (or with count=-1 remove) one mention in a (date, ticker) -> [name, count, sum, n] mapping
+
+    Mentions without a ticker are keyed on the name, like the backfill in the API.
+    """
+    key = (ticker or name or '')[:50]
+    if published_at is None or not key:
+        return
+    row = deltas.setdefault((published_at.date(), key), [name, 0, 0.0, 0])
+    row[0] = name or row[0]
+    row[1] += count
+    if value is not None:
+        row[2] += value * count
+        row[3] += count
+
+
+class EpisodeBulkWriter:
+    def __init__(self, engine, on_conflict: str = 'nothing', chunk_size: int = DEFAULT_CHUNK_SIZE):
+        """
+        Initialize the bulk writer
+
+        :param engine: SQLAlchemy engine
+        :param on_conflict: 'nothing' keeps existing episodes untouched (same as the old
+                            per-item path), 'update' overwrites them and replaces their mentions
+        :param chunk_size: Rows per INSERT statement
+        """
+        if on_conflict not in CONFLICT_MODES:
+            raise ValueError(f"on_conflict must be one of {CONFLICT_MODES}")
+        self.engine = engine
+        self.on_conflict = on_conflict
+        self.chunk_size = chunk_size
+        self.insert = dialect_insert(engine)
+        self._mention_columns = None
+
+    def _podcast_id(self, conn, podcast_name: str, playlist_id: Optional[str]) -> int:
+        podcast_id = conn.execute(
+            select(Podcast.id).where(Podcast.name == podcast_name).limit(1)
+        ).scalar()
+        if podcast_id is None:
+            podcast_id = conn.execute(
+                Podcast.__table__.insert().values(name=podcast_name, playlist_id=playlist_id)
+                .returning(Podcast.id)
+            ).scalar()
+        return podcast_id
+
+    def _existing_video_ids(self, conn, video_ids: List[str]) -> set:
+        existing = set()
+        for start in range(0, len(video_ids), self.chunk_size):
+            chunk = video_ids[start:start + self.chunk_size]
+            existing.update(conn.execute(
+                select(Episode.video_id).where(Episode.video_id.in_(chunk))
+            ).scalars())
+        return existing
+
+    def _subtract_existing_mentions(self, conn, video_ids: List[str], deltas: Dict[tuple, list]):
+        for start in range(0, len(video_ids), self.chunk_size):
+            rows = conn.execute(
+                select(Episode.published_at, StockMention.ticker, StockMention.name, StockMention.sentiment)
+                .join(StockMention, StockMention.episode_id == Episode.id)
+                .where(Episode.video_id.in_(video_ids[start:start + self.chunk_size]))
+            )
+            for published_at, ticker, name, sentiment in rows:
+                add_rollup_delta(deltas, published_at, ticker, name, sentiment_value(sentiment), count=-1)
+
+    def _writable_mention_columns(self, conn) -> set:
+        if self._mention_columns is None:
+            self._mention_columns = {column['name'] for column in inspect(conn).get_columns('stock_mentions')}
+            missing = [column for column in MENTION_CODE_COLUMNS if column not in self._mention_columns]
+            if missing:
+                logger.warning(f"stock_mentions saknar {', '.join(missing)}; starta API:t en gång så att "
+                               f"migreringarna lägger till och fyller i kolumnerna")
+        return self._mention_columns
+
+    def _apply_rollups(self, conn, deltas: Dict[tuple, list]) -> int:
+        """
+        Add the collected deltas to mention_daily_rollups
+
+        :return: Number of (date, ticker) rows touched
+        """
+        if not deltas:
+            return 0
+        table = MentionDailyRollup.__table__
+        statement = self.insert(table)
+        statement = statement.on_conflict_do_update(
+            index_elements=['date', 'ticker', 'source'],
+            set_={
+                'name': func.coalesce(statement.excluded.name, table.c.name),
+                'mention_count': table.c.mention_count + statement.excluded.mention_count,
+                'sentiment_sum': table.c.sentiment_sum + statement.excluded.sentiment_sum,
+                'sentiment_n': table.c.sentiment_n + statement.excluded.sentiment_n,
+            }
+        )
+        # Sorterade nycklar så att samtidiga skrivare låser rader i samma ordning
+        rows = [
+            {'date': day, 'ticker': ticker, 'source': ROLLUP_SOURCE, 'name': name, 'mention_count': count,
+             'sentiment_sum': sentiment_sum, 'sentiment_n': sentiment_n}
+            for (day, ticker), (name, count, sentiment_sum, sentiment_n) in sorted(deltas.items())
+        ]
+        for start in range(0, len(rows), self.chunk_size):
+            conn.execute(statement, rows[start:start + self.chunk_size])
+        return len(rows)
+
+    def write(self, podcast_name: str, items: List[Dict[str, Any]],
+              playlist_id: Optional[str] = None) -> Dict[str, int]:
+        """
+        Insert analyzed items in one transaction
+
+        :param podcast_name: Podcast name
+        :param items: Analyzed items (must contain video_id)
+        :param playlist_id: Playlist ID used if the podcast row has to be created
+        :return: Counters: episodes_inserted, episodes_updated, episodes_skipped, mentions_inserted,
+                 rollup_rows
+        """
+        stats = {'episodes_inserted': 0, 'episodes_updated': 0, 'episodes_skipped': 0, 'mentions_inserted': 0,
+                 'rollup_rows': 0}
+
+        # Första förekomsten vinner om samma video finns flera gånger i batchen
+        unique_items: Dict[str, Dict[str, Any]] = {}
+        for item in items:
+            if item['video_id'] in unique_items:
+                stats['episodes_skipped'] += 1
+                continue
+            unique_items[item['video_id']] = item
+        if not unique_items:
+            return stats
+
+        analysis_date = datetime.now()
+        episodes_table = Episode.__table__
+        mentions_table = StockMention.__table__
+
+        with self.engine.begin() as conn:
+            podcast_id = self._podcast_id(conn, podcast_name, playlist_id)
+            existing = self._existing_video_ids(conn, list(unique_items))
+            rollup_deltas: Dict[tuple, list] = {}
+            if self.on_conflict == 'update':
+                # Omnämnanden som ersätts dras av innan avsnittens datum skrivs över
+                self._subtract_existing_mentions(conn, list(existing), rollup_deltas)
+
+            if self.on_conflict == 'nothing':
+                for video_id in existing:
+                    logger.info(f"Episode {video_id} already exists, skipping")
+                stats['episodes_skipped'] += len(existing)
+                to_write = [item for video_id, item in unique_items.items() if video_id not in existing]
+            else:
+                to_write = list(unique_items.values())
+
+            episode_ids: Dict[str, int] = {}
+            for start in range(0, len(to_write), self.chunk_size):
+                rows = [episode_row(item, podcast_id, analysis_date)
+                        for item in to_write[start:start + self.chunk_size]]
+                statement = self.insert(episodes_table).values(rows)
+                if self.on_conflict == 'nothing':
+                    statement = statement.on_conflict_do_nothing(index_elements=['video_id'])
+                else:
+                    statement = statement.on_conflict_do_update(
+                        index_elements=['video_id'],
+                        set_={column: statement.excluded[column]
+                              for column in rows[0] if column != 'video_id'}
+                    )
+                statement = statement.returning(episodes_table.c.id, episodes_table.c.video_id)
+                for episode_id, video_id in conn.execute(statement):
+                    episode_ids[video_id] = episode_id
+
+            # Uppdaterade avsnitt får sina omnämnanden ersatta
+            replaced = [episode_ids[video_id] for video_id in existing if video_id in episode_ids]
+            for start in range(0, len(replaced), self.chunk_size):
+                conn.execute(delete(mentions_table).where(
+                    mentions_table.c.episode_id.in_(replaced[start:start + self.chunk_size])
+                ))
+            stats['episodes_updated'] = len(replaced)
+            stats['episodes_inserted'] = len(episode_ids) - len(replaced)
+
+            mention_rows = []
+            columns = self._writable_mention_columns(conn)
+            for video_id, item in unique_items.items():
+                if video_id not in episode_ids:
+                    continue
+                published_at = parse_published_at(item.get('published_at'))
+                for mention in item.get('mentions', []):
+                    row = mention_row(mention, episode_ids[video_id])
+                    add_rollup_delta(rollup_deltas, published_at, row['ticker'], row['name'], row['sentiment_value'])
+                    mention_rows.append({key: value for key, value in row.items() if key in columns})
+            for start in range(0, len(mention_rows), self.chunk_size):
+                conn.execute(mentions_table.insert(), mention_rows[start:start + self.chunk_size])
+            stats['mentions_inserted'] = len(mention_rows)
+            stats['rollup_rows'] = self._apply_rollups(conn, rollup_deltas)
+
+        return stats
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Streaming export of stock mentions to CSV or Parquet.
+
+Rows are produced lazily from the current run's results, the analysis store
+or the database, and written row by row (CSV) or in bounded record batches
+(Parquet, requires pyarrow), so memory use does not grow with the history.
+
+Usage:
+    python exporter.py mentions.csv [--source store|db] [--podcast NAME]
+                       [--start YYYY-MM-DD] [--end YYYY-MM-DD] [--ticker T]
+    python exporter.py mentions.parquet --source db --db-url postgresql://...
+"""
+import os
+import csv
+import logging
+import argparse
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger('youtube_podcast_analyzer')
+
+EXPORT_COLUMNS = ('Podcast', 'Episode', 'Date', 'Stock', 'Ticker', 'Sentiment',
+                  'Recommendation', 'PriceInfo', 'Context')
+DEFAULT_BATCH_SIZE = 10000
+PARQUET_EXTENSIONS = ('.parquet', '.pq')
+
+
+def _mention_row(podcast_name: str, episode: Dict[str, Any], mention: Dict[str, Any]) -> Tuple:
+    return (
+        podcast_name,
+        episode.get('title', 'Unknown'),
+        episode.get('published_at', 'Unknown'),
+        mention.get('name', ''),
+        mention.get('ticker', ''),
+        mention.get('sentiment', 'unknown'),
+        mention.get('recommendation', 'None'),
+        mention.get('price_info', ''),
+        mention.get('context', ''),
+    )
+
+
+def _ticker_matches(mention: Dict[str, Any], ticker: Optional[str]) -> bool:
+    return not ticker or (mention.get('ticker') or '').upper() == ticker.upper()
+
+
+def iter_result_rows(results: Iterable[Dict[str, Any]], ticker: Optional[str] = None) -> Iterator[Tuple]:
+    """
+    Rows from in-memory analysis results (one per mention)
+
+    :param results: Analyzed items
+    :param ticker: Optional ticker filter
+    """
+    for result in results:
+        podcast_name = result.get('podcast_name', 'Unknown')
+        for mention in result.get('mentions', []):
+            if _ticker_matches(mention, ticker):
+                yield _mention_row(podcast_name, result, mention)
+
+
+def iter_store_rows(store, podcast: Optional[str] = None, start: Optional[str] = None,
+                    end: Optional[str] = None, ticker: Optional[str] = None) -> Iterator[Tuple]:
+    """
+    Rows from the analysis store; filters are pushed down to the partition reader
+
+    :param store: AnalysisStore
+    """
+    for episode in store.iter_episodes(podcast, start, end, ticker):
+        for mention in episode['mentions']:
+            if _ticker_matches(mention, ticker):
+                yield _mention_row(episode.get('podcast_name', 'Unknown'), episode, mention)
+
+
+def iter_db_rows(engine, podcast: Optional[str] = None, start: Optional[str] = None,
+                 end: Optional[str] = None, ticker: Optional[str] = None,
+                 batch_size: int = DEFAULT_BATCH_SIZE) -> Iterator[Tuple]:
+    """
+    Rows from the database, streamed with a server-side cursor where supported
+
+    :param engine: SQLAlchemy engine for the podcast tables
+    """
+    from datetime import datetime, timedelta
+    from sqlalchemy import select, func
+    from models import Podcast, Episode, StockMention
+
+    query = (
+        select(Podcast.name, Episode.title, Episode.published_at, StockMention.name, StockMention.ticker,
+               StockMention.sentiment, StockMention.recommendation, StockMention.price_info,
+               StockMention.context)
+        .join(Episode, StockMention.episode_id == Episode.id)
+        .join(Podcast, Episode.podcast_id == Podcast.id)
+        .order_by(Episode.published_at, StockMention.id)
+    )
+    if podcast:
+        query = query.where(Podcast.name == podcast)
+    if start:
+        query = query.where(Episode.published_at >= datetime.strptime(start[:10], '%Y-%m-%d'))
+    if end:
+        query = query.where(Episode.published_at < datetime.strptime(end[:10], '%Y-%m-%d') + timedelta(days=1))
+    if ticker:
+        query = query.where(func.upper(StockMention.ticker) == ticker.upper())
+
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=batch_size).execute(query)
+        for row in result:
+            published_at = row[2].isoformat() if row[2] else 'Unknown'
+            yield (row[0], row[1], published_at) + tuple('' if value is None else value for value in row[3:])
+
+
+def write_csv(rows: Iterable[Tuple], output_file: str) -> int:
+    """
+    Write rows to CSV one at a time
+
+    :return: Number of rows written
+    """
+    count = 0
+    with open(output_file, 'w', newline='', encoding='utf-8-sig') as f:
+        writer = csv.writer(f)
+        writer.writerow(EXPORT_COLUMNS)
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    return count
+
+
+def write_parquet(rows: Iterable[Tuple], output_file: str, batch_size: int = DEFAULT_BATCH_SIZE) -> int:
+    """
+    Write rows to Parquet in record batches of at most batch_size rows
+
+    :return: Number of rows written
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("Parquet export requires pyarrow (pip install pyarrow)")
+
+    schema = pa.schema([(column, pa.string()) for column in EXPORT_COLUMNS])
+    count = 0
+    batch: List[Tuple] = []
+
+    def flush(writer):
+        columns = [pa.array([None if row[i] is None else str(row[i]) for row in batch], pa.string())
+                   for i in range(len(EXPORT_COLUMNS))]
+        writer.write_batch(pa.RecordBatch.from_arrays(columns, schema=schema))
+        batch.clear()
+
+    with pq.ParquetWriter(output_file, schema) as writer:
+        for row in rows:
+            batch.append(row)
+            count += 1
+            if len(batch) >= batch_size:
+                flush(writer)
+        if batch:
+            flush(writer)
+    return count
+
+
+def export_rows(rows: Iterable[Tuple], output_file: str, fmt: Optional[str] = None,
+                batch_size: int = DEFAULT_BATCH_SIZE) -> int:
+    """
+    Write rows as CSV or Parquet (chosen from fmt or the file extension)
+
+    :return: Number of rows written
+    """
+    fmt = fmt or ('parquet' if output_file.lower().endswith(PARQUET_EXTENSIONS) else 'csv')
+    if fmt == 'parquet':
+        return write_parquet(rows, output_file, batch_size)
+    return write_csv(rows, output_file)
+
+
+def main():
+    from dotenv import load_dotenv
+
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description='Export stock mentions to CSV or Parquet')
+    parser.add_argument('output', help='Output file (.csv or .parquet)')
+    parser.add_argument('--source', choices=['store', 'db'], default='store',
+                        help='Read from the analysis store or the database')
+    parser.add_argument('--data-dir', '-o', default='podcast_data', help='Analyzer data directory (store)')
+    parser.add_argument('--db-url', default=os.getenv('DATABASE_URL'), help='Database URL (db)')
+    parser.add_argument('--podcast', '-p', help='Podcast name')
+    parser.add_argument('--start', help='First publish date (YYYY-MM-DD)')
+    parser.add_argument('--end', help='Last publish date (YYYY-MM-DD)')
+    parser.add_argument('--ticker', '-t', help='Ticker')
+    parser.add_argument('--format', choices=['csv', 'parquet'], help='Output format (default: from extension)')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help='Rows per Parquet batch / database fetch')
+    args = parser.parse_args()
+
+    if args.source == 'db':
+        if not args.db_url:
+            parser.error('--source db requires --db-url or DATABASE_URL')
+        from sqlalchemy import create_engine
+        rows = iter_db_rows(create_engine(args.db_url), args.podcast, args.start, args.end,
+                            args.ticker, args.batch_size)
+    else:
+        from analysis_store import AnalysisStore
+        rows = iter_store_rows(AnalysisStore(args.data_dir), args.podcast, args.start, args.end, args.ticker)
+
+    count = export_rows(rows, args.output, args.format, args.batch_size)
+    print(f"Exported {count} mentions to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""
+Cheap local pre-filter that estimates how much stock talk a text contains.
+
+Each chunk of a transcript is scored from keyword and ticker dictionary
+hits, number-and-currency patterns and a small TF-IDF centroid classifier
+trained on the labeled fixture set. Texts without any dense chunk are not
+sent to Gemini at all; texts where only a minority of chunks are dense are
+reduced to those chunks.
+
+Usage:
+    python financial_prefilter.py evaluate [--fixtures PATH] [--threshold 0.3]
+    python financial_prefilter.py score TRANSCRIPT.txt
+"""
+import os
+import re
+import json
+import math
+import argparse
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+FIXTURES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'prefilter_chunks.jsonl')
+
+CHUNK_CHARS = 1500
+# Tröskel för att ett stycke räknas som finansiellt tätt (vald för hög recall på fixturerna)
+CHUNK_THRESHOLD = 0.3
+# Andel täta stycken som krävs för att skicka hela texten
+FULL_TEXT_SHARE = 0.6
+
+DECISION_SKIP = 'skip'
+DECISION_CHUNKS = 'chunks'
+DECISION_FULL = 'full'
+
+FINANCIAL_KEYWORDS = {
+    # svenska
+    'aktie', 'aktien', 'aktier', 'aktierna', 'börs', 'börsen', 'börsnoterad', 'börsnoterade', 'utdelning',
+    'utdelningen', 'kvartalsrapport', 'rapport', 'rapporten', 'delårsrapport', 'vinst', 'vinsten', 'rörelseresultat',
+    'omsättning', 'omsättningen', 'intäkter', 'marginal', 'marginalen', 'värdering', 'värderingen', 'kurs',
+    'kursen', 'riktkurs', 'riktkursen', 'köpläge', 'köpa', 'sälja', 'sålt', 'köpt', 'innehav', 'portfölj',
+    'portföljen', 'fond', 'fonden', 'fonder', 'index', 'indexet', 'ränta', 'räntan', 'räntor', 'riksbanken',
+    'inflation', 'inflationen', 'analytiker', 'emission', 'nyemission', 'förvärv', 'uppköp', 'bud', 'blankning',
+    'blankare', 'sektor', 'sektorn', 'bolag', 'bolaget', 'bolagen', 'kassaflöde', 'skuld', 'skulder',
+    'tillväxt', 'prognos', 'guidning', 'investerare', 'investera', 'placering', 'avkastning', 'direktavkastning',
+    'substansrabatt', 'investmentbolag', 'storbank', 'bankerna', 'ebit', 'ebitda', 'vinstvarning', 'nedgradering',
+    'uppgradering', 'certifikat', 'etf', 'optioner', 'terminer', 'obligationer', 'kronan', 'valuta',
+    # engelska
+    'stock', 'stocks', 'shares', 'dividend', 'earnings', 'revenue', 'valuation', 'market', 'nasdaq',
+    'portfolio', 'analyst', 'guidance', 'buyback', 'ipo',
+}
+
+# Vanliga bolag och tickers på Stockholmsbörsen (gemener, utan aktieslag)
+KNOWN_COMPANIES = {
+    'volvo', 'ericsson', 'h&m', 'hm', 'seb', 'handelsbanken', 'shb', 'swedbank', 'nordea', 'investor', 'inve',
+    'atlas copco', 'atco', 'sandvik', 'sand', 'abb', 'astrazeneca', 'azn', 'evolution', 'evo', 'hexagon', 'hexa',
+    'essity', 'sca', 'boliden', 'ssab', 'skf', 'alfa laval', 'alfa', 'assa abloy', 'assa', 'epiroc', 'epi',
+    'telia', 'tele2', 'electrolux', 'elux', 'saab', 'sinch', 'embracer', 'kinnevik', 'latour', 'lundbergs',
+    'industrivärden', 'indu', 'getinge', 'geti', 'castellum', 'balder', 'sagax', 'fabege', 'nibe', 'autoliv',
+    'husqvarna', 'trelleborg', 'securitas', 'spotify', 'tesla', 'nvidia', 'apple', 'microsoft', 'amazon',
+    'avanza', 'nordnet', 'klarna', 'storskogen', 'addtech', 'lifco', 'indutrade', 'thule', 'mips', 'vitrolife',
+}
+
+_WORD = re.compile(r"[a-zåäöéü0-9&]+")
+_TICKER = re.compile(r"\b[A-ZÅÄÖ]{2,5}(?:[ -][ABC])\b")
+_MONEY = re.compile(
+    r"\d[\d\s.,]*\s?(?:kr\b|kronor|sek\b|mkr|mdkr|miljoner|miljarder|mdr|procent|%|usd|dollar|euro|gånger vinsten)",
+    re.IGNORECASE
+)
+
+
+def tokenize(text: str) -> List[str]:
+    return _WORD.findall(text.lower())
+
+
+def split_chunks(text: str, chunk_chars: int = CHUNK_CHARS) -> List[str]:
+    """
+    Split a text into chunks of about chunk_chars characters on word boundaries
+    """
+    chunks, current, size = [], [], 0
+    for word in text.split():
+        current.append(word)
+        size += len(word) + 1
+        if size >= chunk_chars:
+            chunks.append(' '.join(current))
+            current, size = [], 0
+    if current:
+        chunks.append(' '.join(current))
+    return chunks
+
+
+class TfidfCentroidClassifier:
+    def __init__(self):
+        """
+        Minimal TF-IDF classifier: cosine similarity to the centroid of each class
+        """
+        self.idf: Dict[str, float] = {}
+        self.centroids: Dict[int, Dict[str, float]] = {}
+
+    def _vector(self, tokens: List[str]) -> Dict[str, float]:
+        counts = Counter(token for token in tokens if token in self.idf)
+        vector = {token: (1 + math.log(count)) * self.idf[token] for token, count in counts.items()}
+        norm = math.sqrt(sum(value * value for value in vector.values())) or 1.0
+        return {token: value / norm for token, value in vector.items()}
+
+    def fit(self, texts: List[str], labels: List[int]) -> 'TfidfCentroidClassifier':
+        documents = [tokenize(text) for text in texts]
+        document_frequency = Counter(token for tokens in documents for token in set(tokens))
+        total = len(documents)
+        self.idf = {token: math.log((1 + total) / (1 + df)) + 1 for token, df in document_frequency.items()}
+
+        self.centroids = {}
+        for label in set(labels):
+            summed: Counter = Counter()
+            members = [tokens for tokens, doc_label in zip(documents, labels) if doc_label == label]
+            for tokens in members:
+                summed.update(self._vector(tokens))
+            norm = math.sqrt(sum(value * value for value in summed.values())) or 1.0
+            self.centroids[label] = {token: value / norm for token, value in summed.items()}
+        return self
+
+    def predict_proba(self, text: str) -> float:
+        """
+        Probability-like score (0-1) that the text is financial
+        """
+        if not self.centroids:
+            return 0.5
+        vector = self._vector(tokenize(text))
+        similarity = {
+            label: sum(value * centroid.get(token, 0.0) for token, value in vector.items())
+            for label, centroid in self.centroids.items()
+        }
+        positive, negative = similarity.get(1, 0.0), similarity.get(0, 0.0)
+        if positive + negative <= 0:
+            return 0.0
+        return positive / (positive + negative)
+
+
+def load_fixtures(path: str = FIXTURES_PATH) -> List[Dict[str, Any]]:
+    """
+    Load labeled chunks ({"text": ..., "label": 0|1} per line)
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class FinancialPrefilter:
+    _default_classifier: Optional[TfidfCentroidClassifier] = None
+
+    def __init__(self, classifier: Optional[TfidfCentroidClassifier] = None,
+                 chunk_threshold: float = CHUNK_THRESHOLD, full_text_share: float = FULL_TEXT_SHARE,
+                 chunk_chars: int = CHUNK_CHARS, use_classifier: bool = True):
+        """
+        Initialize the pre-filter
+
+        :param classifier: TF-IDF classifier (default: trained once on the fixture set)
+        :param use_classifier: False to score with the dictionary and pattern signals only
+        :param chunk_threshold: Score at which a chunk counts as financially dense
+        :param full_text_share: Share of dense chunks at which the whole text is kept
+        :param chunk_chars: Chunk size in characters
+        """
+        if classifier is None and use_classifier:
+            classifier = self.default_classifier()
+        self.classifier = classifier if use_classifier else None
+        self.chunk_threshold = chunk_threshold
+        self.full_text_share = full_text_share
+        self.chunk_chars = chunk_chars
+
+    @classmethod
+    def default_classifier(cls) -> Optional[TfidfCentroidClassifier]:
+        if cls._default_classifier is None and os.path.exists(FIXTURES_PATH):
+            fixtures = load_fixtures()
+            cls._default_classifier = TfidfCentroidClassifier().fit(
+                [fixture['text'] for fixture in fixtures], [fixture['label'] for fixture in fixtures]
+            )
+        return cls._default_classifier
+
+    def score_chunk(self, text: str) -> Dict[str, float]:
+        """
+        Score one chunk
+
+        :return: Dictionary with the individual signals and the combined 'score' (0-1)
+        """
+        tokens = tokenize(text)
+        words = max(1, len(tokens))
+        keyword_hits = sum(1 for token in tokens if token in FINANCIAL_KEYWORDS)
+        lowered = ' ' + ' '.join(tokens) + ' '
+        company_hits = sum(1 for name in KNOWN_COMPANIES if f' {name.lower()} ' in lowered)
+        ticker_hits = len(_TICKER.findall(text))
+        money_hits = len(_MONEY.findall(text))
+
+        # Nyckelord per 100 ord; 4 eller fler räknas som mättat
+        keyword_density = keyword_hits * 100.0 / words
+        signals = {
+            'keywords': min(1.0, keyword_density / 4.0),
+            'companies': min(1.0, (company_hits + ticker_hits) / 2.0),
+            'money': min(1.0, money_hits / 2.0),
+        }
+        if self.classifier:
+            signals['tfidf'] = self.classifier.predict_proba(text)
+            score = (0.35 * signals['keywords'] + 0.2 * signals['companies']
+                     + 0.15 * signals['money'] + 0.3 * signals['tfidf'])
+        else:
+            score = 0.5 * signals['keywords'] + 0.3 * signals['companies'] + 0.2 * signals['money']
+        signals['score'] = score
+        return signals
+
+    def evaluate(self, text: str) -> Dict[str, Any]:
+        """
+        Decide what to send to the LLM
+
+        :param text: Transcript or description
+        :return: Dictionary with 'decision' (skip/chunks/full), 'text' to analyze,
+                 'density' (share of dense chunks) and per-chunk 'scores'
+        """
+        chunks = split_chunks(text, self.chunk_chars)
+        scores = [self.score_chunk(chunk)['score'] for chunk in chunks]
+        dense = [chunk for chunk, score in zip(chunks, scores) if score >= self.chunk_threshold]
+        density = len(dense) / len(chunks) if chunks else 0.0
+
+        if not dense:
+            decision, kept = DECISION_SKIP, ''
+        elif density >= self.full_text_share:
+            decision, kept = DECISION_FULL, text
+        else:
+            decision, kept = DECISION_CHUNKS, '\n...\n'.join(dense)
+        return {'decision': decision, 'text': kept, 'density': density, 'scores': scores}
+
+
+def precision_recall(predictions: List[int], labels: List[int]) -> Dict[str, float]:
+    true_positive = sum(1 for p, l in zip(predictions, labels) if p and l)
+    false_positive = sum(1 for p, l in zip(predictions, labels) if p and not l)
+    false_negative = sum(1 for p, l in zip(predictions, labels) if not p and l)
+    precision = true_positive / (true_positive + false_positive) if true_positive + false_positive else 0.0
+    recall = true_positive / (true_positive + false_negative) if true_positive + false_negative else 0.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return {'precision': precision, 'recall': recall, 'f1': f1}
+
+
+def evaluate_fixtures(path: str = FIXTURES_PATH, threshold: float = CHUNK_THRESHOLD) -> Dict[str, Any]:
+    """
+    Chunk-level precision/recall on the fixture set
+
+    The TF-IDF classifier is evaluated leave-one-out, so no chunk is scored
+    by a model that was trained on it.
+    """
+    fixtures = load_fixtures(path)
+    texts = [fixture['text'] for fixture in fixtures]
+    labels = [int(fixture['label']) for fixture in fixtures]
+
+    predictions, rule_predictions = [], []
+    for i, text in enumerate(texts):
+        classifier = TfidfCentroidClassifier().fit(texts[:i] + texts[i + 1:], labels[:i] + labels[i + 1:])
+        predictions.append(int(FinancialPrefilter(classifier).score_chunk(text)['score'] >= threshold))
+        rule_only = FinancialPrefilter(use_classifier=False)
+        rule_predictions.append(int(rule_only.score_chunk(text)['score'] >= threshold))
+
+    return {
+        'fixtures': len(fixtures),
+        'positives': sum(labels),
+        'threshold': threshold,
+        'combined': precision_recall(predictions, labels),
+        'rules_only': precision_recall(rule_predictions, labels),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Financial density pre-filter')
+    parser.add_argument('command', choices=['evaluate', 'score'])
+    parser.add_argument('path', nargs='?', help='score: transcript file')
+    parser.add_argument('--fixtures', default=FIXTURES_PATH, help='evaluate: labeled JSONL fixture file')
+    parser.add_argument('--threshold', type=float, default=CHUNK_THRESHOLD, help='Chunk score threshold')
+    args = parser.parse_args()
+
+    if args.command == 'evaluate':
+        report = evaluate_fixtures(args.fixtures, args.threshold)
+        print(f"{report['fixtures']} labeled chunks ({report['positives']} financial), threshold {report['threshold']}")
+        for name in ('combined', 'rules_only'):
+            metrics = report[name]
+            print(f"  {name:<10} precision={metrics['precision']:.2f}  recall={metrics['recall']:.2f}  "
+                  f"f1={metrics['f1']:.2f}")
+
+    elif args.command == 'score':
+        if not args.path:
+            parser.error('score requires a transcript file')
+        with open(args.path, 'r', encoding='utf-8') as f:
+            text = f.read()
+        prefilter = FinancialPrefilter(chunk_threshold=args.threshold)
+        result = prefilter.evaluate(text)
+        for i, score in enumerate(result['scores']):
+            marker = '*' if score >= args.threshold else ' '
+            print(f"{marker} chunk {i:3d}  {score:.2f}")
+        print(f"decision={result['decision']}  density={result['density']:.2f}  "
+              f"chars {len(text)} -> {len(result['text'])}")
+
+
+if __name__ == '__main__':
+    main()
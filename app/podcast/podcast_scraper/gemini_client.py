@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+"""
+Shared Gemini client and a quota-aware request scheduler.
+
+The scheduler keeps requests-per-minute and tokens-per-minute budgets in two
+token buckets. Failed or low-quality attempts are parked on a retry queue with
+jittered exponential backoff instead of sleeping, so other episodes keep using
+the budget while one of them waits for its retry.
+"""
+import time
+import heapq
+import random
+import logging
+import threading
+import multiprocessing
+from collections import deque
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+logger = logging.getLogger('youtube_podcast_analyzer')
+
+# Utfall för ett jobb i schemaläggaren
+JOB_OK = 'ok'
+JOB_RETRY = 'retry'
+JOB_ERROR = 'error'
+JOB_EXHAUSTED = 'exhausted'
+
+
+def estimate_prompt_tokens(prompt: str) -> int:
+    """
+    Rough token estimate for budget accounting (about four characters per token)
+
+    :param prompt: Prompt text
+    :return: Estimated tokens
+    """
+    return max(1, len(prompt) // 4)
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """
+    Check whether an exception from the Gemini SDK is a quota/rate-limit error
+
+    :param error: Exception raised by generate_content
+    :return: True for HTTP 429 / ResourceExhausted
+    """
+    return '429' in str(error) or type(error).__name__ in ('ResourceExhausted', 'TooManyRequests')
+
+
+class TokenBucket:
+    def __init__(self, capacity: float, refill_per_second: float, clock: Callable[[], float] = time.monotonic):
+        """
+        Classic token bucket
+
+        :param capacity: Maximum number of tokens (burst size)
+        :param refill_per_second: Tokens added per second
+        :param clock: Monotonic clock function
+        """
+        self.capacity = float(capacity)
+        self.refill_per_second = float(refill_per_second)
+        self.clock = clock
+        self.tokens = float(capacity)
+        self.updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = self.clock()
+        elapsed = now - self.updated
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.refill_per_second)
+            self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """
+        Seconds until `amount` tokens are available (0 if available now)
+
+        Requests larger than the capacity are clamped so they can still run.
+        """
+        amount = min(amount, self.capacity)
+        with self._lock:
+            self._refill()
+            missing = amount - self.tokens
+            if missing <= 1e-9:
+                return 0.0
+            return missing / self.refill_per_second
+
+    def consume(self, amount: float):
+        """
+        Take tokens from the bucket (may go negative for clamped requests)
+        """
+        with self._lock:
+            self._refill()
+            self.tokens -= min(amount, self.capacity)
+
+    def try_consume(self, amount: float) -> float:
+        """
+        Take `amount` tokens if they are available, in one locked step
+
+        Checking with wait_time and then calling consume lets two workers both
+        pass the check; this does not.
+
+        :return: 0 when the tokens were taken, else seconds until they are available
+        """
+        amount = min(amount, self.capacity)
+        with self._lock:
+            self._refill()
+            missing = amount - self.tokens
+            if missing <= 1e-9:
+                self.tokens -= amount
+                return 0.0
+            return missing / self.refill_per_second
+
+    def refund(self, amount: float):
+        """
+        Give back tokens taken by try_consume that were not used
+        """
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens + min(amount, self.capacity))
+
+    @classmethod
+    def per_minute(cls, limit: float, clock: Callable[[], float] = time.monotonic) -> 'TokenBucket':
+        """
+        Bucket for a per-minute quota
+
+        :param limit: Allowed units per minute
+        """
+        return cls(limit, limit / 60.0, clock)
+
+
+class SharedTokenBucket(TokenBucket):
+    def __init__(self, capacity: float, refill_per_second: float, context=None,
+                 clock: Callable[[], float] = time.time):
+        """
+        Token bucket whose state lives in shared memory, so several processes
+        draw from one budget. Create it in the parent process and pass it to
+        pool workers through the initializer arguments.
+
+        :param capacity: Maximum number of tokens (burst size)
+        :param refill_per_second: Tokens added per second
+        :param context: multiprocessing context (default: the current one)
+        :param clock: Wall clock shared by all processes
+        """
+        context = context or multiprocessing.get_context()
+        self.capacity = float(capacity)
+        self.refill_per_second = float(refill_per_second)
+        self.clock = clock
+        self._tokens = context.Value('d', float(capacity), lock=False)
+        self._updated = context.Value('d', clock(), lock=False)
+        self._lock = context.Lock()
+
+    @property
+    def tokens(self) -> float:
+        return self._tokens.value
+
+    @tokens.setter
+    def tokens(self, value: float):
+        self._tokens.value = value
+
+    @property
+    def updated(self) -> float:
+        return self._updated.value
+
+    @updated.setter
+    def updated(self, value: float):
+        self._updated.value = value
+
+    @classmethod
+    def per_minute(cls, limit: float, context=None) -> 'SharedTokenBucket':
+        """
+        Shared bucket for a per-minute quota
+        """
+        return cls(limit, limit / 60.0, context)
+
+
+class GeminiClient:
+    """
+    One configured Gemini model instance, shared by every analysis in the process
+    """
+    _shared: Dict[Tuple[str, str], 'GeminiClient'] = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, api_key: str, model_name: str):
+        """
+        Configure the SDK once and build the model
+
+        :param api_key: Google API key
+        :param model_name: Gemini model name
+        """
+        import google.generativeai as genai
+
+        genai.configure(api_key=api_key)
+        self.model_name = model_name
+        self.model = genai.GenerativeModel(model_name)
+
+    @classmethod
+    def shared(cls, api_key: str, model_name: str) -> 'GeminiClient':
+        """
+        Get the process-wide client for this API key and model
+        """
+        key = (api_key, model_name)
+        with cls._shared_lock:
+            if key not in cls._shared:
+                cls._shared[key] = cls(api_key, model_name)
+            return cls._shared[key]
+
+    def generate(self, prompt: str) -> str:
+        """
+        Run one generate_content call
+
+        :param prompt: Prompt text
+        :return: Response text
+        """
+        return self.model.generate_content(prompt).text
+
+
+class _Job:
+    __slots__ = ('job_id', 'prompt', 'tokens', 'handle_response', 'attempts', 'last_value', 'last_error',
+                 'elapsed', 'response_chars')
+
+    def __init__(self, job_id, prompt, handle_response):
+        self.job_id = job_id
+        self.prompt = prompt
+        self.tokens = estimate_prompt_tokens(prompt)
+        self.handle_response = handle_response
+        self.attempts = 0
+        self.last_value = None
+        self.last_error = None
+        self.elapsed = 0.0
+        self.response_chars = 0
+
+
+class GeminiScheduler:
+    def __init__(self, client: GeminiClient, rpm: int = 15, tpm: int = 1000000, max_retries: int = 3,
+                 base_delay: float = 10.0, max_delay: float = 300.0,
+                 clock: Callable[[], float] = time.monotonic, sleep: Callable[[float], None] = time.sleep,
+                 requests_bucket: TokenBucket = None, tokens_bucket: TokenBucket = None):
+        """
+        Schedule Gemini calls under RPM/TPM budgets
+
+        :param client: Shared GeminiClient
+        :param rpm: Requests per minute budget
+        :param tpm: Estimated input tokens per minute budget
+        :param max_retries: Maximum attempts per job
+        :param base_delay: First retry delay in seconds (doubles per attempt, with jitter)
+        :param max_delay: Upper bound for a single retry delay
+        :param requests_bucket: Existing bucket to use instead of a private RPM bucket
+        :param tokens_bucket: Existing bucket to use instead of a private TPM bucket
+        """
+        self.client = client
+        self.requests_bucket = requests_bucket or TokenBucket.per_minute(rpm, clock)
+        self.tokens_bucket = tokens_bucket or TokenBucket.per_minute(tpm, clock)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.clock = clock
+        self.sleep = sleep
+        self._ready = deque()
+        self._parked = []  # heap av (ready_at, seq, job)
+        self._seq = 0
+        self._outcomes: Dict[Hashable, Dict[str, Any]] = {}
+
+    def submit(self, job_id: Hashable, prompt: str,
+               handle_response: Callable[[str], Tuple[str, Any]]):
+        """
+        Queue a prompt
+
+        :param job_id: Identifier used in the result mapping
+        :param prompt: Prompt text
+        :param handle_response: Called with the response text, returns (JOB_OK, value)
+                                or (JOB_RETRY, partial_value_or_None)
+        """
+        self._ready.append(_Job(job_id, prompt, handle_response))
+
+    def retry_delay(self, attempts: int) -> float:
+        """
+        Jittered exponential backoff for the given number of completed attempts
+        """
+        delay = min(self.max_delay, self.base_delay * (2 ** max(0, attempts - 1)))
+        return delay * random.uniform(0.5, 1.5)
+
+    def _park(self, job: _Job):
+        delay = self.retry_delay(job.attempts)
+        self._seq += 1
+        heapq.heappush(self._parked, (self.clock() + delay, self._seq, job))
+        logger.info(f"Gemini job {job.job_id} parked for {delay:.1f}s (attempt {job.attempts}/{self.max_retries})")
+
+    def _finish(self, job: _Job, status: str, value: Any = None):
+        self._outcomes[job.job_id] = {
+            'status': status,
+            'value': value if value is not None else job.last_value,
+            'attempts': job.attempts,
+            'error': job.last_error,
+            'elapsed': job.elapsed,
+            'prompt_chars': len(job.prompt),
+            'response_chars': job.response_chars,
+        }
+
+    def _release_parked(self):
+        now = self.clock()
+        while self._parked and self._parked[0][0] <= now:
+            _, _, job = heapq.heappop(self._parked)
+            self._ready.append(job)
+
+    def _run_job(self, job: _Job):
+        job.attempts += 1
+        started = time.perf_counter()
+        try:
+            response_text = self.client.generate(job.prompt)
+        except Exception as e:
+            job.elapsed += time.perf_counter() - started
+            job.last_error = str(e)
+            if is_rate_limit_error(e):
+                logger.warning(f"API-kvotfel för Gemini-jobb {job.job_id}")
+                # Kvotfel: töm förfrågningsbudgeten så att inga andra jobb skickas direkt
+                self.requests_bucket.consume(self.requests_bucket.capacity)
+                if job.attempts < self.max_retries:
+                    self._park(job)
+                else:
+                    self._finish(job, JOB_EXHAUSTED)
+                return
+            logger.error(f"Error using Gemini with API key: {e}")
+            self._finish(job, JOB_ERROR)
+            return
+        job.elapsed += time.perf_counter() - started
+        job.response_chars += len(response_text or '')
+
+        try:
+            status, value = job.handle_response(response_text)
+        except Exception as e:
+            # Ett trasigt svar får bara påverka det här jobbet, inte hela körningen
+            logger.warning(f"Could not handle Gemini response for job {job.job_id}: {e}")
+            job.last_error = str(e)
+            status, value = JOB_RETRY, None
+        if status == JOB_OK:
+            self._finish(job, JOB_OK, value)
+            return
+        if value is not None:
+            job.last_value = value
+        if job.attempts < self.max_retries:
+            self._park(job)
+        else:
+            self._finish(job, JOB_EXHAUSTED)
+
+    def run(self) -> Dict[Hashable, Dict[str, Any]]:
+        """
+        Process all submitted jobs
+
+        Only blocks when every remaining job is either parked or waiting for
+        budget, and then only until the earliest of those becomes runnable.
+
+        :return: Mapping job_id -> {'status', 'value', 'attempts', 'error', 'elapsed',
+                 'prompt_chars', 'response_chars'}; elapsed is the time spent in API
+                 calls over all attempts
+        """
+        while self._ready or self._parked:
+            self._release_parked()
+
+            if self._ready:
+                job = self._ready[0]
+                # Kontroll och uttag i samma låsta steg, så att delade hinkar inte övertecknas
+                wait = self.requests_bucket.try_consume(1)
+                if wait <= 0:
+                    wait = self.tokens_bucket.try_consume(job.tokens)
+                    if wait > 0:
+                        self.requests_bucket.refund(1)
+                if wait <= 0:
+                    self._ready.popleft()
+                    self._run_job(job)
+                    continue
+            else:
+                wait = float('inf')
+
+            if self._parked:
+                wait = min(wait, max(0.0, self._parked[0][0] - self.clock()))
+            if wait != float('inf'):
+                # Minsta väntetid så att avrundningsfel inte ger en tom loop
+                self.sleep(max(wait, 0.01))
+
+        outcomes, self._outcomes = self._outcomes, {}
+        return outcomes
@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, Float, Boolean, ForeignKey
+from sqlalchemy import create_engine, Column, Integer, String, Text, Date, DateTime, Float, Boolean, ForeignKey
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 
@@ -44,6 +44,8 @@ class StockMention(Base):
     context = Column(Text)
     sentiment = Column(String(50))
     recommendation = Column(String(50))
+    sentiment_value = Column(Float)  # 1 positivt, 0 neutralt, -1 negativt, NULL okänt
+    recommendation_code = Column(String(10))  # 'buy', 'hold', 'sell' eller 'none'
     price_info = Column(String(255))
     mention_reason = Column(String(255))
     
@@ -51,4 +53,18 @@ class StockMention(Base):
     episode = relationship("Episode", back_populates="mentions")
     
     def __repr__(self):
-        return f"<StockMention(name='{self.name}', sentiment='{self.sentiment}')>"
\ No newline at end of file
+        return f"<StockMention(name='{self.name}', sentiment='{self.sentiment}')>"
+
+class MentionDailyRollup(Base):
+    __tablename__ = 'mention_daily_rollups'
+    
+    date = Column(Date, primary_key=True)
+    ticker = Column(String(50), primary_key=True)  # Ticker, eller namnet när tickern saknas
+    source = Column(String(20), primary_key=True)
+    name = Column(String(255))
+    mention_count = Column(Integer, nullable=False, default=0)
+    sentiment_sum = Column(Float, nullable=False, default=0.0)
+    sentiment_n = Column(Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f"<MentionDailyRollup(date='{self.date}', ticker='{self.ticker}', count='{self.mention_count}')>"
\ No newline at end of file
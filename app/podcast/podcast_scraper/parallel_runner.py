@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Process-pool fan-out for the analyzer CLI.
+
+The parent process lists the playlists and puts their videos on the work
+queue, then splits each podcast's videos into shards and hands them to a
+pool of worker processes. Every worker builds its own analyzer (own DB
+engine, HTTP sessions and YouTube client) in the pool initializer. YouTube
+and Gemini budgets are shared by all processes through token buckets held
+in shared memory, so adding workers never exceeds the global rate limits.
+"""
+import os
+import math
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Dict, List, Tuple
+
+from gemini_client import SharedTokenBucket
+
+logger = logging.getLogger('youtube_podcast_analyzer')
+
+# Gemensam takt för YouTube Data API-anrop från alla processer
+YOUTUBE_REQUESTS_PER_SECOND = float(os.getenv('YOUTUBE_RPS', 5))
+
+_worker_analyzer = None
+
+
+def _init_worker(config: Dict[str, Any], youtube_bucket, gemini_buckets):
+    """
+    Pool initializer: build one analyzer per worker process
+    """
+    global _worker_analyzer
+    from youtube_podcast_analyser import YouTubePodcastAnalyzer
+
+    analyzer = YouTubePodcastAnalyzer(
+        config['youtube_api_key'], config['google_api_key'], config['data_dir'], config['db_url'],
+        use_analysis_cache=config['use_analysis_cache'],
+        gemini_rpm=config['gemini_rpm'], gemini_tpm=config['gemini_tpm'],
+        use_prefilter=config.get('use_prefilter', True)
+    )
+    analyzer.quota.limiter = youtube_bucket
+    analyzer.gemini_buckets = gemini_buckets
+    _worker_analyzer = analyzer
+
+
+def _run_shard(podcast_name: str, video_ids: List[str]) -> Dict[str, Any]:
+    """
+    Process one shard of queued videos in a worker
+    """
+    items = _worker_analyzer.process_queue(podcast_name, video_ids=video_ids, workers=1)
+    quota_calls = dict(_worker_analyzer.quota.calls)
+    _worker_analyzer.quota.calls.clear()
+    prefilter_stats = dict(_worker_analyzer.prefilter_stats)
+    for key in _worker_analyzer.prefilter_stats:
+        _worker_analyzer.prefilter_stats[key] = 0
+    return {'podcast_name': podcast_name, 'items': items, 'quota': quota_calls,
+            'prefilter': prefilter_stats, 'spans': _worker_analyzer.metrics.drain()}
+
+
+def is_playlist(analyzer, target: str) -> bool:
+    return "playlist" in target or "list=" in target or target in analyzer.podcasts.values()
+
+
+def make_shards(podcast_name: str, video_ids: List[str], workers: int) -> List[Tuple[str, List[str]]]:
+    """
+    Split a podcast's videos into at most `workers` shards of similar size
+    """
+    if not video_ids:
+        return []
+    size = max(1, math.ceil(len(video_ids) / workers))
+    return [(podcast_name, video_ids[start:start + size]) for start in range(0, len(video_ids), size)]
+
+
+def run_parallel(analyzer, targets: List[Tuple[str, str]], workers: int, config: Dict[str, Any],
+                 max_episodes: int = 5, sync_mode: str = 'full') -> List[Dict[str, Any]]:
+    """
+    Analyze several podcasts/videos with a pool of worker processes
+
+    :param analyzer: Analyzer in the parent process (lists playlists, owns the sync state)
+    :param targets: List of (podcast_name, playlist ID/URL or video URL)
+    :param workers: Number of worker processes
+    :param config: Constructor arguments for the worker analyzers: youtube_api_key,
+                   google_api_key, data_dir, db_url, use_analysis_cache, gemini_rpm, gemini_tpm,
+                   use_prefilter
+    :param max_episodes: Maximum number of episodes per playlist
+    :param sync_mode: Playlist sync mode
+    :return: Saved items from all workers, merged
+    """
+    context = multiprocessing.get_context()
+    youtube_bucket = SharedTokenBucket(YOUTUBE_REQUESTS_PER_SECOND, YOUTUBE_REQUESTS_PER_SECOND, context)
+    gemini_buckets = (
+        SharedTokenBucket.per_minute(analyzer.gemini_rpm, context),
+        SharedTokenBucket.per_minute(analyzer.gemini_tpm, context),
+    )
+    analyzer.quota.limiter = youtube_bucket
+
+    # Listning och köläggning sker i föräldern; bara den skriver synkstatus
+    planned = []
+    tasks = []
+    for podcast_name, target in targets:
+        if is_playlist(analyzer, target):
+            urls = analyzer.get_playlist_videos(target, max_videos=max_episodes, sync_mode=sync_mode)
+        else:
+            urls = [target]
+        video_ids = analyzer.enqueue_videos(urls, podcast_name)
+        planned.append((podcast_name, target, urls))
+        tasks.extend(make_shards(podcast_name, video_ids, workers))
+
+    results = []
+    if tasks:
+        logger.info(f"Processing {len(tasks)} shards with {workers} worker processes")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker,
+                                 initargs=(config, youtube_bucket, gemini_buckets)) as executor:
+            futures = {executor.submit(_run_shard, *task): task for task in tasks}
+            for future in as_completed(futures):
+                podcast_name, video_ids = futures[future]
+                try:
+                    outcome = future.result()
+                except Exception as e:
+                    # Videorna ligger kvar i kön och tas upp vid nästa körning
+                    logger.error(f"Worker failed for {podcast_name} ({len(video_ids)} videos): {e}")
+                    continue
+                results.extend(outcome['items'])
+                for method, count in outcome['quota'].items():
+                    analyzer.quota.record(method, count)
+                for key, count in outcome['prefilter'].items():
+                    analyzer.prefilter_stats[key] = analyzer.prefilter_stats.get(key, 0) + count
+                analyzer.metrics.extend(outcome['spans'])
+
+    for podcast_name, target, urls in planned:
+        if is_playlist(analyzer, target) and urls:
+            analyzer.commit_playlist_sync(target, urls)
+
+    return results
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Per-playlist sync state and YouTube API quota accounting.
+
+Incremental runs list a playlist from the top and stop at the first video
+that was already seen. When a run is capped by max_videos before reaching
+that video, the old watermark is kept as a "resume below" cursor, and the
+next incremental run skips the videos it already took and keeps paging
+down to the cursor. Backfill runs walk the full history page by page and
+store the next page token after every page, so they can be resumed.
+"""
+import os
+import json
+import time
+import tempfile
+from datetime import datetime
+from typing import Dict, List, Optional, Any
+
+# Kostnad i kvotenheter per anrop enligt YouTube Data API v3
+YOUTUBE_QUOTA_COSTS = {
+    'playlistItems.list': 1,
+    'videos.list': 1,
+}
+
+# Hur många sedda video-ID:n som sparas per spellista
+MAX_KNOWN_VIDEO_IDS = 2000
+
+SYNC_MODES = ('full', 'incremental', 'backfill')
+
+
+class QuotaMeter:
+    def __init__(self):
+        """
+        Count YouTube Data API calls and quota units for the current run
+        """
+        self.calls: Dict[str, int] = {}
+        # Valfri TokenBucket som delar anropstakten mellan processer
+        self.limiter = None
+
+    def throttle(self):
+        """
+        Wait for the shared rate limiter (if any) before an API call
+        """
+        if not self.limiter:
+            return
+        wait = self.limiter.try_consume(1)
+        while wait > 0:
+            time.sleep(wait)
+            wait = self.limiter.try_consume(1)
+
+    def record(self, method: str, count: int = 1):
+        """
+        Record API calls
+
+        :param method: API method, e.g. 'playlistItems.list'
+        :param count: Number of calls
+        """
+        self.calls[method] = self.calls.get(method, 0) + count
+
+    @property
+    def units(self) -> int:
+        return sum(YOUTUBE_QUOTA_COSTS.get(method, 1) * count for method, count in self.calls.items())
+
+    def report(self) -> str:
+        """
+        Human readable summary, e.g. '3 units (playlistItems.list x2, videos.list x1)'
+        """
+        if not self.calls:
+            return "0 units"
+        details = ', '.join(f"{method} x{count}" for method, count in sorted(self.calls.items()))
+        return f"{self.units} units ({details})"
+
+
+class PlaylistSyncState:
+    def __init__(self, path: str):
+        """
+        Load sync state from a JSON file
+
+        :param path: Path to the state file
+        """
+        self.path = path
+        self.state: Dict[str, Dict[str, Any]] = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.state = json.load(f)
+
+    def get(self, playlist_id: str) -> Dict[str, Any]:
+        """
+        Get (and create if missing) the state entry for a playlist
+        """
+        return self.state.setdefault(playlist_id, {
+            'newest_video_id': None,
+            'known_video_ids': [],
+            'backfill_page_token': None,
+            'backfill_complete': False,
+            'resume_below_video_id': None,
+            'last_sync': None,
+            'last_quota_units': 0,
+        })
+
+    def known_ids(self, playlist_id: str) -> set:
+        """
+        Video IDs already seen for a playlist
+        """
+        return set(self.state.get(playlist_id, {}).get('known_video_ids', []))
+
+    def resume_below(self, playlist_id: str) -> Optional[str]:
+        """
+        Video ID an incremental listing has to reach before it may stop, or
+        None when every video above the first known one has been synced
+        """
+        return self.state.get(playlist_id, {}).get('resume_below_video_id')
+
+    def update_incremental_cursor(self, playlist_id: str, complete: bool):
+        """
+        Keep or clear the resume cursor after an incremental listing
+
+        Must be called before mark_seen, which moves newest_video_id.
+
+        :param playlist_id: Playlist ID
+        :param complete: True when the listing reached the known videos (or the end
+                         of the playlist), False when it was capped by max_videos
+        """
+        entry = self.get(playlist_id)
+        if complete:
+            entry['resume_below_video_id'] = None
+        elif not entry.get('resume_below_video_id'):
+            # Det gamla vattenmärket gäller tills luckan ovanför det är hämtad
+            entry['resume_below_video_id'] = entry['newest_video_id']
+
+    def mark_seen(self, playlist_id: str, video_ids: List[str], newest_first: bool = True,
+                  keep_newest: bool = False):
+        """
+        Record processed videos
+
+        :param playlist_id: Playlist ID
+        :param video_ids: Processed video IDs in playlist order
+        :param newest_first: True when video_ids came from the top of the playlist
+        :param keep_newest: Do not move newest_video_id (videos taken from below the resume cursor's gap)
+        """
+        entry = self.get(playlist_id)
+        known = entry['known_video_ids']
+        known_set = set(known)
+        new_ids = [video_id for video_id in video_ids if video_id not in known_set]
+        if newest_first:
+            if video_ids and not keep_newest:
+                entry['newest_video_id'] = video_ids[0]
+            known[:0] = new_ids
+        else:
+            known.extend(new_ids)
+            if not entry['newest_video_id'] and video_ids:
+                entry['newest_video_id'] = video_ids[0]
+        del known[MAX_KNOWN_VIDEO_IDS:]
+        entry['last_sync'] = datetime.now().isoformat()
+
+    def set_backfill_cursor(self, playlist_id: str, page_token: Optional[str]):
+        """
+        Store where the next backfill run should continue
+
+        :param page_token: Next page token, or None when the history is exhausted
+        """
+        entry = self.get(playlist_id)
+        entry['backfill_page_token'] = page_token
+        entry['backfill_complete'] = page_token is None
+
+    def save(self):
+        """
+        Write the state atomically
+        """
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.sync_state_')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Per-stage timing and cost report for analysis runs.
+
+The analyzer records one span per unit of work: the batched metadata lookup,
+every transcript method attempt, the pre-filter, each Gemini job (all its
+attempts), and the store and database saves. A span holds the duration and
+whatever sizes the stage knows: bytes, characters in/out, estimated tokens
+and retries. At the end of a run the spans are aggregated per stage
+(count, failures, total, p50/p95/max, sums) with a Gemini cost estimate,
+printed and written as JSON to <data_dir>/run_reports/ so scheduled runs
+can be compared over time.
+
+Usage:
+    python run_metrics.py [--output-dir podcast_data] [--last N]
+"""
+import os
+import glob
+import math
+import json
+import time
+import argparse
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+# Pris i USD per miljon tokens för Gemini (överstyrs med miljövariabler)
+GEMINI_INPUT_USD_PER_MTOK = float(os.getenv('GEMINI_INPUT_USD_PER_MTOK', 1.25))
+GEMINI_OUTPUT_USD_PER_MTOK = float(os.getenv('GEMINI_OUTPUT_USD_PER_MTOK', 5.0))
+
+STAGE_GEMINI = 'gemini'
+SUM_FIELDS = ('bytes', 'chars_in', 'chars_out', 'tokens_in', 'tokens_out', 'retries', 'items')
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """
+    Nearest-rank percentile of an unsorted list
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100.0 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+class RunMetrics:
+    def __init__(self, clock=time.perf_counter):
+        """
+        Collect spans for one run (thread-safe; worker processes send theirs back with extend)
+        """
+        self.clock = clock
+        self.started_at = datetime.now()
+        self._start = clock()
+        self._spans: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, duration: float, video_id: Optional[str] = None, ok: bool = True, **fields):
+        """
+        Add a span measured elsewhere
+
+        :param stage: Stage name, e.g. 'transcript.youtubetotranscript'
+        :param duration: Seconds
+        :param video_id: Video the work was for, if any
+        :param ok: Whether the stage produced a usable result
+        :param fields: bytes, chars_in, chars_out, tokens_in, tokens_out, retries, items, error, ...
+        """
+        span = {'stage': stage, 'video_id': video_id, 'duration': round(duration, 4), 'ok': ok}
+        span.update({key: value for key, value in fields.items() if value is not None})
+        with self._lock:
+            self._spans.append(span)
+
+    @contextmanager
+    def span(self, stage: str, video_id: Optional[str] = None, **fields):
+        """
+        Time a block; the yielded dict can be filled with sizes and 'ok'
+
+        An exception marks the span failed and is re-raised.
+        """
+        extra = dict(fields)
+        started = self.clock()
+        try:
+            yield extra
+        except Exception as e:
+            extra['ok'] = False
+            extra['error'] = str(e)[:200]
+            raise
+        finally:
+            fields = {key: value for key, value in extra.items() if key != 'ok'}
+            self.record(stage, self.clock() - started, video_id, extra.get('ok', True), **fields)
+
+    def extend(self, spans: Iterable[Dict[str, Any]]):
+        with self._lock:
+            self._spans.extend(spans)
+
+    def drain(self) -> List[Dict[str, Any]]:
+        """
+        Take all spans recorded so far (used by worker processes)
+        """
+        with self._lock:
+            spans, self._spans = self._spans, []
+        return spans
+
+    @property
+    def spans(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self._spans)
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        Aggregate the spans per stage and estimate the Gemini cost
+        """
+        by_stage: Dict[str, List[Dict[str, Any]]] = {}
+        for span in self.spans:
+            by_stage.setdefault(span['stage'], []).append(span)
+
+        stages = {}
+        for stage, spans in sorted(by_stage.items()):
+            durations = [span['duration'] for span in spans]
+            stats = {
+                'count': len(spans),
+                'failed': sum(1 for span in spans if not span['ok']),
+                'total_s': round(sum(durations), 3),
+                'p50_s': round(percentile(durations, 50), 3),
+                'p95_s': round(percentile(durations, 95), 3),
+                'max_s': round(max(durations), 3),
+            }
+            for field in SUM_FIELDS:
+                values = [span[field] for span in spans if field in span]
+                if values:
+                    stats[field] = sum(values)
+            stages[stage] = stats
+
+        gemini = stages.get(STAGE_GEMINI, {})
+        input_cost = gemini.get('tokens_in', 0) / 1e6 * GEMINI_INPUT_USD_PER_MTOK
+        output_cost = gemini.get('tokens_out', 0) / 1e6 * GEMINI_OUTPUT_USD_PER_MTOK
+        return {
+            'started_at': self.started_at.isoformat(timespec='seconds'),
+            'wall_s': round(self.clock() - self._start, 3),
+            'videos': len({span['video_id'] for span in self.spans if span.get('video_id')}),
+            'stages': stages,
+            'cost_usd': {
+                'gemini_input': round(input_cost, 4),
+                'gemini_output': round(output_cost, 4),
+                'total': round(input_cost + output_cost, 4),
+            },
+        }
+
+    def write(self, data_dir: str, summary: Optional[Dict[str, Any]] = None) -> str:
+        """
+        Write summary and raw spans to <data_dir>/run_reports/run_<timestamp>.json
+
+        :return: Path of the report
+        """
+        summary = summary or self.summary()
+        reports_dir = os.path.join(data_dir, 'run_reports')
+        os.makedirs(reports_dir, exist_ok=True)
+        path = os.path.join(reports_dir, f"run_{self.started_at.strftime('%Y%m%d_%H%M%S')}.json")
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'summary': summary, 'spans': self.spans}, f, ensure_ascii=False, indent=1)
+        return path
+
+
+def format_summary(summary: Dict[str, Any]) -> str:
+    """
+    Render a run summary as a fixed-width table
+    """
+    lines = [f"{'stage':<34}{'n':>5}{'fail':>5}{'total s':>9}{'p50 s':>8}{'p95 s':>8}"
+             f"{'chars in':>11}{'chars out':>11}{'tokens':>9}{'retries':>8}"]
+    for stage, stats in summary['stages'].items():
+        tokens = stats.get('tokens_in', 0) + stats.get('tokens_out', 0)
+        lines.append(
+            f"{stage:<34}{stats['count']:>5}{stats['failed']:>5}{stats['total_s']:>9.1f}"
+            f"{stats['p50_s']:>8.2f}{stats['p95_s']:>8.2f}{stats.get('chars_in', 0):>11}"
+            f"{stats.get('chars_out', 0):>11}{tokens:>9}{stats.get('retries', 0):>8}"
+        )
+    cost = summary['cost_usd']
+    lines.append(f"{summary['videos']} videos in {summary['wall_s']:.1f}s, "
+                 f"estimated Gemini cost ${cost['total']:.4f} "
+                 f"(input ${cost['gemini_input']:.4f}, output ${cost['gemini_output']:.4f})")
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Show trends across saved run reports')
+    parser.add_argument('--output-dir', '-o', default='podcast_data', help='Analyzer data directory')
+    parser.add_argument('--last', type=int, default=10, help='Number of most recent runs')
+    args = parser.parse_args()
+
+    paths = sorted(glob.glob(os.path.join(args.output_dir, 'run_reports', 'run_*.json')))[-args.last:]
+    if not paths:
+        print('No run reports found')
+        return
+
+    print(f"{'started':<21}{'videos':>7}{'wall s':>9}{'gemini p95':>12}{'fetch p95':>11}{'cost $':>9}")
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            summary = json.load(f)['summary']
+        stages = summary['stages']
+        fetch_p95 = max((stats['p95_s'] for stage, stats in stages.items() if stage.startswith('transcript.')),
+                        default=0.0)
+        print(f"{summary['started_at']:<21}{summary['videos']:>7}{summary['wall_s']:>9.1f}"
+              f"{stages.get(STAGE_GEMINI, {}).get('p95_s', 0.0):>12.2f}{fetch_p95:>11.2f}"
+              f"{summary['cost_usd']['total']:>9.4f}")
+
+
+if __name__ == '__main__':
+    main()
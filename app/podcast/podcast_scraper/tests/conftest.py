@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Modulerna i podcast_scraper importeras platt (som när skripten körs direkt)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
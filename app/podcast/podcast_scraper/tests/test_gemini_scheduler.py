@@ -0,0 +1,66 @@
+import pytest
+
+from gemini_client import GeminiScheduler, TokenBucket, JOB_OK, JOB_RETRY, JOB_EXHAUSTED
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class FakeClient:
+    def __init__(self, responses):
+        self.responses = responses
+
+    def generate(self, prompt):
+        return self.responses[prompt]
+
+
+def make_scheduler(responses, max_retries=2):
+    clock = FakeClock()
+    return GeminiScheduler(
+        FakeClient(responses), max_retries=max_retries, base_delay=1.0, clock=clock, sleep=clock.sleep,
+        requests_bucket=TokenBucket.per_minute(1000, clock), tokens_bucket=TokenBucket.per_minute(10 ** 9, clock)
+    )
+
+
+def test_failing_response_handler_only_affects_its_own_job():
+    def handle(text):
+        if text == 'boom':
+            raise AttributeError("'list' object has no attribute 'get'")
+        return JOB_OK, text
+
+    scheduler = make_scheduler({'bad': 'boom', 'good': 'fine'})
+    scheduler.submit('bad', 'bad', handle)
+    scheduler.submit('good', 'good', handle)
+    outcomes = scheduler.run()
+
+    assert outcomes['good']['status'] == JOB_OK
+    assert outcomes['good']['value'] == 'fine'
+    assert outcomes['bad']['status'] == JOB_EXHAUSTED
+    assert outcomes['bad']['attempts'] == 2
+    assert 'attribute' in outcomes['bad']['error']
+
+
+@pytest.mark.parametrize('response_text', ['[1, 2]', '"ok"', 'null', '42'])
+def test_non_object_json_is_retried(response_text):
+    analyser = pytest.importorskip('youtube_podcast_analyser')
+    assert analyser.YouTubePodcastAnalyzer._parse_gemini_response(response_text) == (JOB_RETRY, None)
+
+
+def test_non_object_json_does_not_abort_the_batch():
+    analyser = pytest.importorskip('youtube_podcast_analyser')
+    valid = '{"mentions": [{"company": "Volvo"}], "summary": "%s"}' % ('x' * 60)
+    scheduler = make_scheduler({'list': '[1, 2]', 'valid': valid})
+    scheduler.submit('list', 'list', analyser.YouTubePodcastAnalyzer._parse_gemini_response)
+    scheduler.submit('valid', 'valid', analyser.YouTubePodcastAnalyzer._parse_gemini_response)
+    outcomes = scheduler.run()
+
+    assert outcomes['list']['status'] == JOB_EXHAUSTED
+    assert outcomes['valid']['status'] == JOB_OK
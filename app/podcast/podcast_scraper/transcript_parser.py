@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+Streaming WebVTT/SRT parser for subtitle files downloaded by yt-dlp.
+
+YouTube's automatic captions are "rolling": every cue repeats the previous
+line and adds a new one, and each word carries an inline timestamp tag.
+The parser strips headers, cue settings and markup and drops the repeated
+lines, so only the spoken text is sent on to Gemini. Manual subtitles (SRT
+or VTT without word timestamps) keep every line, since a repeated line
+there is actually spoken twice.
+"""
+import re
+import sys
+import html
+import json
+from collections import deque
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+# 00:01:02.345 --> 00:01:04.000 align:start position:0%  (VTT)
+# 00:01:02,345 --> 00:01:04,000                          (SRT)
+TIMESTAMP_LINE = re.compile(
+    r'^\s*((?:\d+:)?\d{1,2}:\d{2}[.,]\d{1,3})\s*-->\s*((?:\d+:)?\d{1,2}:\d{2}[.,]\d{1,3})'
+)
+# Inline markup: <00:00:01.234>, <c>, </c>, <c.colorE5E5E5>, <v Speaker>, <i> ...
+INLINE_TAG = re.compile(r'<[^>]*>')
+# Word-level timestamp tag, only present in YouTube's automatic (rolling) captions
+WORD_TIMESTAMP_TAG = re.compile(r'<(?:\d+:)?\d{1,2}:\d{2}\.\d{3}>')
+# How many recently emitted lines to compare against when dropping rolling duplicates
+DEDUP_WINDOW = 3
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough token estimate (about four characters per token for Gemini)
+
+    :param text: Text to estimate
+    :return: Estimated number of tokens
+    """
+    return (len(text) + 3) // 4 if text else 0
+
+
+def parse_timestamp(value: str) -> float:
+    """
+    Convert a VTT/SRT timestamp to seconds
+
+    :param value: Timestamp such as '01:02:03.456', '02:03.456' or '01:02:03,456'
+    :return: Seconds as float
+    """
+    parts = value.replace(',', '.').split(':')
+    seconds = float(parts[-1])
+    if len(parts) >= 2:
+        seconds += int(parts[-2]) * 60
+    if len(parts) >= 3:
+        seconds += int(parts[-3]) * 3600
+    return seconds
+
+
+def iter_cues(lines: Iterable[str]) -> Iterator[Tuple[float, float, List[str]]]:
+    """
+    Stream cues from a VTT or SRT source
+
+    Works line by line, so a file object can be passed without reading it
+    into memory first.
+
+    :param lines: Iterable of text lines (e.g. an open file)
+    :return: Iterator of (start_seconds, end_seconds, text_lines)
+    """
+    block: List[str] = []
+
+    def flush(block_lines):
+        for idx, line in enumerate(block_lines):
+            match = TIMESTAMP_LINE.match(line)
+            if match:
+                start = parse_timestamp(match.group(1))
+                end = parse_timestamp(match.group(2))
+                return start, end, block_lines[idx + 1:]
+        # WEBVTT header, NOTE, STYLE or REGION block - no timestamp, no cue
+        return None
+
+    for raw_line in lines:
+        line = raw_line.rstrip('\r\n').lstrip('﻿')
+        if line == '':
+            if block:
+                cue = flush(block)
+                if cue:
+                    yield cue
+                block = []
+            continue
+        block.append(line)
+
+    if block:
+        cue = flush(block)
+        if cue:
+            yield cue
+
+
+def clean_cue_line(line: str) -> str:
+    """
+    Remove inline timing tags, markup and entities from a caption line
+
+    :param line: Raw caption line
+    :return: Plain text line
+    """
+    # Entiteter avkodas i ett steg, så att t.ex. &amp;lt; blir &lt; och inte <
+    text = html.unescape(INLINE_TAG.sub('', line))
+    return ' '.join(text.split())
+
+
+def iter_clean_segments(cues: Iterable[Tuple[float, float, List[str]]],
+                        stats: Optional[Dict[str, int]] = None,
+                        rolling: Optional[bool] = None) -> Iterator[Tuple[float, str]]:
+    """
+    Turn cues into deduplicated text segments
+
+    For rolling captions, drops lines already emitted by one of the last few
+    cues (YouTube repeats the previous line in every rolling cue) and, when a
+    line only grows the previous one, emits just the new words. Other
+    subtitles are passed through line by line.
+
+    :param cues: Iterator from iter_cues
+    :param stats: Optional dict that receives 'cues' and 'duplicate_lines' counters
+    :param rolling: True/False to force rolling-caption handling; None detects it
+                    from word-level timestamp tags in the cue text
+    :return: Iterator of (start_seconds, text)
+    """
+    recent = deque(maxlen=DEDUP_WINDOW)
+    detect = rolling is None
+    if stats is not None:
+        stats.setdefault('cues', 0)
+        stats.setdefault('duplicate_lines', 0)
+
+    for start, _end, text_lines in cues:
+        if stats is not None:
+            stats['cues'] += 1
+        for raw in text_lines:
+            if detect and not rolling and WORD_TIMESTAMP_TAG.search(raw):
+                rolling = True
+            line = clean_cue_line(raw)
+            if not line:
+                continue
+            if not rolling:
+                yield start, line
+                continue
+            if line in recent:
+                if stats is not None:
+                    stats['duplicate_lines'] += 1
+                continue
+            previous = recent[-1] if recent else None
+            recent.append(line)
+            if previous and line.startswith(previous + ' '):
+                # Rullande text som bara har vuxit med hela ord - skicka bara det nya
+                line = line[len(previous) + 1:].strip()
+                if stats is not None:
+                    stats['duplicate_lines'] += 1
+                if not line:
+                    continue
+            yield start, line
+
+
+def parse_subtitles(lines: Iterable[str], with_index: bool = False,
+                    rolling: Optional[bool] = None) -> Dict[str, object]:
+    """
+    Parse a VTT/SRT stream into clean transcript text
+
+    :param lines: Iterable of subtitle lines (e.g. an open file)
+    :param with_index: Also return a cue-offset index of (char_offset, start_seconds)
+    :param rolling: Force rolling-caption deduplication on/off (default: detect)
+    :return: Dictionary with 'text', 'cue_index' (or None) and 'stats'
+    """
+    raw_chars = 0
+
+    def counting(source):
+        nonlocal raw_chars
+        for line in source:
+            raw_chars += len(line)
+            yield line
+
+    counters: Dict[str, int] = {}
+    pieces: List[str] = []
+    cue_index: Optional[List[Tuple[int, float]]] = [] if with_index else None
+    offset = 0
+
+    for start, segment in iter_clean_segments(iter_cues(counting(lines)), counters, rolling):
+        if pieces:
+            offset += 1  # separating space
+        if cue_index is not None:
+            cue_index.append((offset, round(start, 3)))
+        pieces.append(segment)
+        offset += len(segment)
+
+    text = ' '.join(pieces)
+    stats = {
+        'raw_chars': raw_chars,
+        'clean_chars': len(text),
+        'raw_tokens_est': (raw_chars + 3) // 4,
+        'clean_tokens_est': estimate_tokens(text),
+        'cues': counters.get('cues', 0),
+        'duplicate_lines': counters.get('duplicate_lines', 0),
+        'reduction_pct': round(100.0 * (1 - len(text) / raw_chars), 1) if raw_chars else 0.0,
+    }
+    return {'text': text, 'cue_index': cue_index, 'stats': stats}
+
+
+def parse_subtitle_file(path: str, with_index: bool = False,
+                        rolling: Optional[bool] = None) -> Dict[str, object]:
+    """
+    Parse a subtitle file from disk without loading it into memory
+
+    :param path: Path to a .vtt or .srt file
+    :param with_index: Also return a cue-offset index
+    :param rolling: Force rolling-caption deduplication on/off (default: detect)
+    :return: Dictionary with 'text', 'cue_index' and 'stats'
+    """
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        return parse_subtitles(f, with_index=with_index, rolling=rolling)
+
+
+def format_reduction_stats(stats: Dict[str, object]) -> str:
+    """
+    One-line human readable token-reduction report
+
+    :param stats: Stats dict from parse_subtitles
+    :return: Formatted string
+    """
+    return (f"{stats['raw_chars']} -> {stats['clean_chars']} chars "
+            f"(~{stats['raw_tokens_est']} -> ~{stats['clean_tokens_est']} tokens, "
+            f"-{stats['reduction_pct']}%, {stats['duplicate_lines']} duplicate lines in {stats['cues']} cues)")
+
+
+if __name__ == '__main__':
+    # Usage: python transcript_parser.py file.vtt [--index]
+    if len(sys.argv) < 2:
+        print("Usage: transcript_parser.py <subtitle file> [--index]")
+        sys.exit(1)
+    parsed = parse_subtitle_file(sys.argv[1], with_index='--index' in sys.argv)
+    print(parsed['text'])
+    print(format_reduction_stats(parsed['stats']), file=sys.stderr)
+    if parsed['cue_index'] is not None:
+        print(json.dumps(parsed['cue_index']), file=sys.stderr)
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Concurrent, resumable transcript prefetch stage.
+
+Fetches transcripts into the transcript cache (transcripts/<video_id>.txt)
+without calling Gemini. Work is taken from the durable work queue: each
+worker thread leases queued videos, fetches them and advances them to
+'fetched' (recording whether a transcript or only a usable description was
+found) or marks them failed. A later analysis pass runs from disk.
+"""
+import os
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from work_queue import STATE_QUEUED, STATE_FETCHED, STAGE_FETCH
+
+logger = logging.getLogger('youtube_podcast_analyzer')
+
+SOURCE_TRANSCRIPT = 'transcript'
+SOURCE_DESCRIPTION = 'description'
+
+
+class TranscriptPrefetcher:
+    def __init__(self, analyzer, workers: int = 4, delay: float = 3.0):
+        """
+        Initialize the prefetcher
+
+        :param analyzer: YouTubePodcastAnalyzer whose transcript methods, cache and queue are used
+        :param workers: Number of concurrent fetch threads
+        :param delay: Pause per worker after each network fetch, to avoid overwhelming the website
+        """
+        self.analyzer = analyzer
+        self.queue = analyzer.queue
+        self.workers = max(1, workers)
+        self.delay = delay
+        self.transcripts_dir = os.path.join(analyzer.data_dir, 'transcripts')
+
+    def _cache_path(self, video_id: str) -> str:
+        return os.path.join(self.transcripts_dir, f'{video_id}.txt')
+
+    def _fetch_one(self, item: Dict[str, Any]):
+        video_id = item['video_id']
+        already_cached = os.path.exists(self._cache_path(video_id))
+        try:
+            text = self.analyzer.get_transcript_from_website(item['video_url'])
+        except Exception as e:
+            logger.warning(f"Transcript fetch for {video_id} failed: {e}")
+            text = None
+
+        description = item.get('description') or ''
+        if text and os.path.exists(self._cache_path(video_id)):
+            self.queue.advance(video_id, STATE_FETCHED, source=SOURCE_TRANSCRIPT)
+        elif text and text != description:
+            # Transkript som inte cachats av hämtningsmetoden
+            with open(self._cache_path(video_id), 'w', encoding='utf-8') as f:
+                f.write(text)
+            self.queue.advance(video_id, STATE_FETCHED, source=SOURCE_TRANSCRIPT)
+        elif len(description) > 100:
+            # Samma reserv som analysen använder: beskrivningen i stället för transkript
+            self.queue.advance(video_id, STATE_FETCHED, source=SOURCE_DESCRIPTION)
+        else:
+            self.queue.fail(video_id, STAGE_FETCH, 'No transcript or useful description available')
+
+        if not already_cached and self.delay:
+            time.sleep(self.delay)
+
+    def _worker(self, podcast_name: Optional[str], video_ids: Optional[List[str]]) -> int:
+        done = 0
+        while True:
+            claimed = self.queue.claim(STATE_QUEUED, 1, podcast_name=podcast_name, video_ids=video_ids)
+            if not claimed:
+                return done
+            video_id = claimed[0]['video_id']
+            try:
+                self._fetch_one(claimed[0])
+            except Exception as e:
+                logger.error(f"Fetch stage failed for {video_id}: {e}")
+                self.queue.fail_leased([video_id], STAGE_FETCH, str(e))
+            finally:
+                # Gör inget om videon redan flyttats eller markerats; annars (t.ex. vid Ctrl-C) lämnas den tillbaka
+                self.queue.release([video_id])
+            done += 1
+
+    def run(self, podcast_name: Optional[str] = None, video_ids: Optional[List[str]] = None) -> int:
+        """
+        Fetch all queued videos concurrently
+
+        :param podcast_name: Only videos of this podcast
+        :param video_ids: Only these videos
+        :return: Number of videos processed
+        """
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = [executor.submit(self._worker, podcast_name, video_ids) for _ in range(self.workers)]
+            return sum(future.result() for future in futures)
+
+    def load_text(self, item: Dict[str, Any]) -> Optional[str]:
+        """
+        Read the cached text for a fetched queue item
+        """
+        if item.get('source') == SOURCE_DESCRIPTION:
+            return item.get('description')
+        path = self._cache_path(item['video_id'])
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return f.read()
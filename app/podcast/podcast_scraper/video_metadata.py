@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Batched YouTube video metadata lookups.
+
+videos.list accepts up to 50 IDs per request, so snippets are fetched for a
+whole playlist page at once and kept in an in-memory dict backed by a JSON
+file on disk. Later lookups for the same video cost no quota at all.
+"""
+import os
+import json
+import logging
+import tempfile
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Any
+
+logger = logging.getLogger('youtube_podcast_analyzer')
+
+# Maximalt antal ID:n per videos.list-anrop enligt YouTube Data API v3
+MAX_IDS_PER_REQUEST = 50
+
+
+class VideoMetadataResolver:
+    def __init__(self, youtube, cache_path: str, quota=None):
+        """
+        Initialize the resolver
+
+        :param youtube: YouTube API client from googleapiclient (may be None)
+        :param cache_path: Path to the JSON snippet cache
+        :param quota: Optional QuotaMeter that records API calls
+        """
+        self.youtube = youtube
+        self.cache_path = cache_path
+        self.quota = quota
+        self._snippets: Dict[str, Dict[str, Any]] = {}
+        # Videor som API:t inte returnerade (privata/borttagna) - bara i minnet
+        self._missing = set()
+        self._dirty = False
+
+        if os.path.exists(cache_path):
+            try:
+                with open(cache_path, 'r', encoding='utf-8') as f:
+                    self._snippets = json.load(f)
+            except Exception as e:
+                logger.warning(f"Could not read video metadata cache {cache_path}: {e}")
+
+    def prefetch(self, video_ids: Iterable[str]) -> int:
+        """
+        Fetch snippets for all uncached IDs, up to 50 per API call
+
+        :param video_ids: Video IDs
+        :return: Number of API calls made
+        """
+        if not self.youtube:
+            return 0
+
+        wanted: List[str] = []
+        seen = set()
+        for video_id in video_ids:
+            if (video_id and video_id not in seen and video_id not in self._snippets
+                    and video_id not in self._missing):
+                wanted.append(video_id)
+                seen.add(video_id)
+
+        calls = 0
+        for start in range(0, len(wanted), MAX_IDS_PER_REQUEST):
+            batch = wanted[start:start + MAX_IDS_PER_REQUEST]
+            try:
+                if self.quota:
+                    self.quota.throttle()
+                response = self.youtube.videos().list(
+                    part="snippet",
+                    id=','.join(batch),
+                    maxResults=MAX_IDS_PER_REQUEST
+                ).execute()
+            except Exception as e:
+                logger.warning(f"YouTube API error: {e}")
+                break
+            calls += 1
+            if self.quota:
+                self.quota.record('videos.list')
+
+            fetched_at = datetime.now().isoformat()
+            for item in response.get('items', []):
+                snippet = item.get('snippet', {})
+                self._snippets[item['id']] = {
+                    'title': snippet.get('title', 'Unknown'),
+                    'publishedAt': snippet.get('publishedAt', 'Unknown'),
+                    'description': snippet.get('description', ''),
+                    'fetched_at': fetched_at,
+                }
+                self._dirty = True
+            returned = {item['id'] for item in response.get('items', [])}
+            self._missing.update(video_id for video_id in batch if video_id not in returned)
+
+        if calls:
+            logger.info(f"Fetched metadata for {len(wanted)} videos in {calls} API call(s)")
+            self.save()
+        return calls
+
+    def get(self, video_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Get the cached snippet for a video, fetching it if needed
+
+        :param video_id: YouTube video ID
+        :return: Dictionary with title, publishedAt and description, or None
+        """
+        if video_id not in self._snippets:
+            self.prefetch([video_id])
+        return self._snippets.get(video_id)
+
+    def save(self):
+        """
+        Write the snippet cache to disk if it changed
+        """
+        if not self._dirty:
+            return
+        try:
+            directory = os.path.dirname(os.path.abspath(self.cache_path))
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.video_metadata_')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(self._snippets, f, ensure_ascii=False)
+            os.replace(tmp_path, self.cache_path)
+            self._dirty = False
+        except Exception as e:
+            logger.warning(f"Could not write video metadata cache: {e}")
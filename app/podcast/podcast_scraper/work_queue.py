@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+"""
+Durable SQLite work queue for the podcast pipeline.
+
+Every video moves through queued -> fetched -> analyzed -> saved. A worker
+claims items in one state with a time-limited lease, does the stage's work
+and advances them. Errors in a batch fail the items it still holds and an
+interrupt releases them; only a hard crash leaves the lease to expire before
+the next run picks the item up again from its last checkpoint. Failures keep
+the stage they failed in (and count in attempts), so retry-failed only
+re-runs that stage.
+
+Usage:
+    python work_queue.py status [--podcast NAME] [--failed]
+    python work_queue.py resume [--podcast NAME] [--prefetch-workers N]
+    python work_queue.py retry-failed [--podcast NAME] [--stage fetch|analyze|save]
+"""
+import os
+import json
+import time
+import uuid
+import sqlite3
+import argparse
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+STATE_QUEUED = 'queued'
+STATE_FETCHED = 'fetched'
+STATE_ANALYZED = 'analyzed'
+STATE_SAVED = 'saved'
+STATE_FAILED = 'failed'
+STATES = (STATE_QUEUED, STATE_FETCHED, STATE_ANALYZED, STATE_SAVED, STATE_FAILED)
+
+# Steg -> tillståndet som steget läser från
+STAGE_FETCH = 'fetch'
+STAGE_ANALYZE = 'analyze'
+STAGE_SAVE = 'save'
+STAGE_INPUT_STATE = {
+    STAGE_FETCH: STATE_QUEUED,
+    STAGE_ANALYZE: STATE_FETCHED,
+    STAGE_SAVE: STATE_ANALYZED,
+}
+
+DEFAULT_LEASE_SECONDS = 900
+
+
+class WorkQueue:
+    def __init__(self, db_path: str):
+        """
+        Open (or create) the queue database
+
+        :param db_path: Path to the SQLite file
+        """
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS work_items (
+                video_id TEXT PRIMARY KEY,
+                video_url TEXT NOT NULL,
+                podcast_name TEXT NOT NULL,
+                title TEXT,
+                published_at TEXT,
+                description TEXT,
+                state TEXT NOT NULL,
+                source TEXT,
+                failed_stage TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT,
+                lease_owner TEXT,
+                lease_expires REAL,
+                analysis_json TEXT,
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_work_items_state ON work_items(state, podcast_name)")
+        self._lock = threading.Lock()
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+    def enqueue(self, podcast_name: str, video_infos: Iterable[Dict[str, Any]]) -> int:
+        """
+        Add videos in state 'queued' (videos already in the queue are left untouched)
+
+        :param podcast_name: Podcast name
+        :param video_infos: Dicts from get_video_info
+        :return: Number of newly queued videos
+        """
+        now = datetime.now().isoformat()
+        rows = [
+            (info['video_id'], info['video_url'], podcast_name, info.get('title'), info.get('published_at'),
+             info.get('description'), STATE_QUEUED, now, now)
+            for info in video_infos
+        ]
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                """
+                INSERT OR IGNORE INTO work_items
+                    (video_id, video_url, podcast_name, title, published_at, description, state, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                rows
+            )
+            return self._conn.total_changes - before
+
+    def claim(self, state: str, limit: int = 1, podcast_name: Optional[str] = None,
+              video_ids: Optional[List[str]] = None,
+              lease_seconds: float = DEFAULT_LEASE_SECONDS) -> List[Dict[str, Any]]:
+        """
+        Lease up to `limit` items in the given state
+
+        Items leased by another worker are skipped until their lease expires.
+
+        :param state: State to claim from
+        :param limit: Maximum number of items
+        :param podcast_name: Optional podcast filter
+        :param video_ids: Optional restriction to these videos
+        :param lease_seconds: Lease duration
+        :return: Claimed items as dicts
+        """
+        now = time.time()
+        query = ("SELECT video_id FROM work_items WHERE state = ? "
+                 "AND (lease_expires IS NULL OR lease_expires < ?)")
+        params: List[Any] = [state, now]
+        if podcast_name:
+            query += " AND podcast_name = ?"
+            params.append(podcast_name)
+        if video_ids is not None:
+            if not video_ids:
+                return []
+            query += f" AND video_id IN ({','.join('?' * len(video_ids))})"
+            params.extend(video_ids)
+        query += " ORDER BY published_at, created_at LIMIT ?"
+        params.append(limit)
+
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                ids = [row['video_id'] for row in self._conn.execute(query, params)]
+                if ids:
+                    placeholders = ','.join('?' * len(ids))
+                    self._conn.execute(
+                        f"UPDATE work_items SET lease_owner = ?, lease_expires = ?, "
+                        f"updated_at = ? WHERE video_id IN ({placeholders})",
+                        [self.owner, now + lease_seconds, datetime.now().isoformat()] + ids
+                    )
+                rows = self._conn.execute(
+                    f"SELECT * FROM work_items WHERE video_id IN ({','.join('?' * len(ids))})", ids
+                ).fetchall() if ids else []
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return [self._row_to_item(row) for row in rows]
+
+    @staticmethod
+    def _row_to_item(row) -> Dict[str, Any]:
+        item = dict(row)
+        item['analysis'] = json.loads(item.pop('analysis_json')) if row['analysis_json'] else None
+        return item
+
+    def advance(self, video_id: str, state: str, **fields):
+        """
+        Move a claimed item to its next state and release the lease
+
+        :param video_id: Video ID
+        :param state: New state
+        :param fields: Extra columns to set: source, analysis (dict)
+        """
+        assignments = {'state': state, 'lease_owner': None, 'lease_expires': None,
+                       'last_error': None, 'failed_stage': None, 'updated_at': datetime.now().isoformat()}
+        if 'analysis' in fields:
+            assignments['analysis_json'] = json.dumps(fields.pop('analysis'), ensure_ascii=False)
+        assignments.update(fields)
+        columns = ', '.join(f"{column} = ?" for column in assignments)
+        with self._lock:
+            self._conn.execute(f"UPDATE work_items SET {columns} WHERE video_id = ?",
+                               list(assignments.values()) + [video_id])
+
+    def fail(self, video_id: str, stage: str, error: str):
+        """
+        Mark an item as failed in the given stage, count the attempt and release the lease
+        """
+        with self._lock:
+            self._conn.execute(
+                "UPDATE work_items SET state = ?, failed_stage = ?, last_error = ?, attempts = attempts + 1, "
+                "lease_owner = NULL, lease_expires = NULL, updated_at = ? WHERE video_id = ?",
+                (STATE_FAILED, stage, (error or '')[:1000], datetime.now().isoformat(), video_id)
+            )
+
+    def fail_leased(self, video_ids: Iterable[str], stage: str, error: str) -> int:
+        """
+        Fail the items this worker still holds a lease on (e.g. after an error mid-batch)
+
+        Items already advanced or failed by the batch are left untouched.
+
+        :return: Number of items marked as failed
+        """
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "UPDATE work_items SET state = ?, failed_stage = ?, last_error = ?, attempts = attempts + 1, "
+                "lease_owner = NULL, lease_expires = NULL, updated_at = ? WHERE video_id = ? AND lease_owner = ?",
+                [(STATE_FAILED, stage, (error or '')[:1000], datetime.now().isoformat(), video_id, self.owner)
+                 for video_id in video_ids]
+            )
+            return self._conn.total_changes - before
+
+    def release(self, video_ids: Iterable[str]):
+        """
+        Give back leases without changing state (e.g. on interrupt)
+        """
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE work_items SET lease_owner = NULL, lease_expires = NULL WHERE video_id = ? AND lease_owner = ?",
+                [(video_id, self.owner) for video_id in video_ids]
+            )
+
+    def retry_failed(self, podcast_name: Optional[str] = None, stage: Optional[str] = None) -> int:
+        """
+        Put failed items back into the input state of the stage they failed in
+
+        :param podcast_name: Optional podcast filter
+        :param stage: Only retry failures from this stage
+        :return: Number of items requeued
+        """
+        total = 0
+        with self._lock:
+            for failed_stage, state in STAGE_INPUT_STATE.items():
+                if stage and stage != failed_stage:
+                    continue
+                query = ("UPDATE work_items SET state = ?, failed_stage = NULL, updated_at = ? "
+                         "WHERE state = ? AND failed_stage = ?")
+                params: List[Any] = [state, datetime.now().isoformat(), STATE_FAILED, failed_stage]
+                if podcast_name:
+                    query += " AND podcast_name = ?"
+                    params.append(podcast_name)
+                total += self._conn.execute(query, params).rowcount
+        return total
+
+    def has_video(self, video_id: str) -> bool:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT 1 FROM work_items WHERE video_id = ?", (video_id,)
+            ).fetchone() is not None
+
+    def counts(self, podcast_name: Optional[str] = None) -> Dict[str, int]:
+        """
+        Number of items per state
+        """
+        query = "SELECT state, COUNT(*) FROM work_items"
+        params: List[Any] = []
+        if podcast_name:
+            query += " WHERE podcast_name = ?"
+            params.append(podcast_name)
+        query += " GROUP BY state"
+        with self._lock:
+            found = dict(self._conn.execute(query, params).fetchall())
+        return {state: found.get(state, 0) for state in STATES}
+
+    def items(self, state: Optional[str] = None, podcast_name: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        List items (optionally filtered by state and podcast)
+        """
+        query = "SELECT * FROM work_items WHERE 1 = 1"
+        params: List[Any] = []
+        if state:
+            query += " AND state = ?"
+            params.append(state)
+        if podcast_name:
+            query += " AND podcast_name = ?"
+            params.append(podcast_name)
+        query += " ORDER BY updated_at"
+        with self._lock:
+            return [self._row_to_item(row) for row in self._conn.execute(query, params)]
+
+    def close(self):
+        self._conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Inspect and resume the podcast pipeline queue')
+    parser.add_argument('command', choices=['status', 'resume', 'retry-failed'])
+    parser.add_argument('--output-dir', '-o', default='podcast_data', help='Data directory containing work_queue.sqlite')
+    parser.add_argument('--podcast', '-p', help='Restrict to one podcast')
+    parser.add_argument('--failed', action='store_true', help='status: list failed items')
+    parser.add_argument('--stage', choices=list(STAGE_INPUT_STATE), help='retry-failed: only this stage')
+    parser.add_argument('--prefetch-workers', type=int, default=4, help='resume: concurrent transcript fetches')
+    parser.add_argument('--use-db', action='store_true', help='resume: also save to the database from .env')
+    args = parser.parse_args()
+
+    queue = WorkQueue(os.path.join(args.output_dir, 'work_queue.sqlite'))
+
+    if args.command == 'status':
+        counts = queue.counts(args.podcast)
+        print('  '.join(f"{state}={count}" for state, count in counts.items()))
+        if args.failed:
+            for item in queue.items(STATE_FAILED, args.podcast):
+                print(f"{item['video_id']}  {item['podcast_name']:<20} stage={item['failed_stage']:<8} "
+                      f"attempts={item['attempts']}  {item['last_error']}")
+
+    elif args.command == 'retry-failed':
+        print(f"Requeued {queue.retry_failed(args.podcast, args.stage)} failed items")
+
+    elif args.command == 'resume':
+        # Importeras här så att kön kan inspekteras utan analysatorns beroenden
+        from dotenv import load_dotenv
+        from youtube_podcast_analyser import YouTubePodcastAnalyzer, db_url_from_env
+
+        load_dotenv()
+        queue.close()
+        analyzer = YouTubePodcastAnalyzer(os.getenv('YOUTUBE_API_KEY'), os.getenv('GOOGLE_API_KEY'),
+                                          args.output_dir, db_url_from_env() if args.use_db else None)
+        results = analyzer.process_queue(args.podcast, workers=args.prefetch_workers)
+        print(f"Saved {len(results)} episodes")
+        print('  '.join(f"{state}={count}" for state, count in analyzer.queue.counts(args.podcast).items()))
+
+
+if __name__ == '__main__':
+    main()
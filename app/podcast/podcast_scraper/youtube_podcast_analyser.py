@@ -14,10 +14,8 @@ from typing import List, Dict, Optional, Any
 # External libraries
 import requests
 import yt_dlp
-import google.generativeai as genai
 from googleapiclient.discovery import build
 from dotenv import load_dotenv
-import pandas as pd
 import colorama
 from colorama import Fore, Style
 from bs4 import BeautifulSoup
@@ -26,6 +24,19 @@ from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, F
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
 
+from transcript_parser import parse_subtitle_file, format_reduction_stats
+from analysis_cache import AnalysisCache, prompt_version
+from gemini_client import GeminiClient, GeminiScheduler, JOB_OK, JOB_RETRY, JOB_ERROR
+from playlist_sync import PlaylistSyncState, QuotaMeter, SYNC_MODES
+from video_metadata import VideoMetadataResolver
+from episode_writer import EpisodeBulkWriter
+from analysis_store import AnalysisStore, migrate_legacy_json_once
+from exporter import export_rows, iter_result_rows
+from transcript_prefetch import TranscriptPrefetcher
+from financial_prefilter import FinancialPrefilter, DECISION_SKIP, DECISION_CHUNKS
+from run_metrics import RunMetrics, STAGE_GEMINI, format_summary
+from work_queue import WorkQueue, STATE_FETCHED, STATE_ANALYZED, STATE_SAVED, STAGE_FETCH, STAGE_ANALYZE, STAGE_SAVE
+
 # Initialize colorama for colored output
 colorama.init()
 
@@ -40,8 +51,81 @@ logging.basicConfig(
 )
 logger = logging.getLogger('youtube_podcast_analyzer')
 
+# Gemini-modell och promptmall. PROMPT_VERSION härleds från mallen så att
+# cachade analyser automatiskt blir inaktuella när prompten ändras.
+GEMINI_MODEL = "gemini-1.5-pro"
+GEMINI_PROMPT_TEMPLATE = """
+                    Podcast Analysis: "{podcast_name}" - Episode: "{episode_title}"
+
+                    Analysera denna svenskspråkiga podcast-transkription med fokus på den svenska och nordiska finansmarknaden:
+
+                    1. Skriv en koncis sammanfattning på svenska (3-5 meningar) som fångar huvudämnena i podcasten
+                    2. Identifiera alla omnämnanden av:
+                    - Svenska börshörnbolag (från Stockholmsbörsen, First North, NGM)
+                    - Nordiska börsnoterade bolag
+                    - Globala aktier som diskuteras i en svensk kontext
+                    - Finansiella instrument och investeringsprodukter (fonder, ETF:er, certifikat, etc.)
+
+                    För varje omnämnande, samla in följande information:
+                    - Företagets/aktiens namn
+                    - Tickersymbol exakt som den nämns (t.ex. ERIC B, SHB A) eller null om den inte nämns
+                    - Ett direkt citat som visar kontexten (högst 150 tecken)
+                    - Sentiment (positive/negative/neutral) baserat på hur aktien diskuteras
+                    - Rekommendation (buy/sell/hold/none) om sådan nämns eller antyds tydligt
+                    - Prisinformation eller prognos om sådan nämns (exakta siffror om möjligt)
+                    - En kort beskrivning av varför aktien nämns (t.ex. "kvartalsrapport", "produktlansering", "populär aktie")
+
+                    Returnera resultatet som JSON med följande struktur:
+                    {{
+                        "summary": "En sammanfattande text på svenska om podcasten",
+                        "mentions": [
+                            {{
+                                "name": "Företagsnamn",
+                                "ticker": "Tickersymbol eller null",
+                                "context": "Citat från texten",
+                                "sentiment": "positive/negative/neutral",
+                                "recommendation": "buy/sell/hold/none",
+                                "price_info": "Prisinformation eller null",
+                                "mention_reason": "Orsak till omnämnande"
+                            }}
+                        ]
+                    }}
+
+                    VIKTIGT: 
+                    - Inkludera INTE några kommentarer, förklaringar eller anteckningar i JSON-svaret
+                    - JSON måste vara helt giltig utan några kommentarer eller förklaringar
+                    - Använd "null" för värden som saknas, inte tomma strängar
+                    - Var så exakt och specifik som möjligt med tickersymboler (inkludera A/B/C-suffixet för svenska aktier)
+                    - För sentiment, använd endast värdena "positive", "negative" eller "neutral"
+                    - För recommendation, använd endast värdena "buy", "sell", "hold" eller "none"
+
+                    Text att analysera:
+                    {text}
+"""
+PROMPT_VERSION = prompt_version(GEMINI_PROMPT_TEMPLATE)
+
+# Antal köade videor som hämtas per steg och omgång
+QUEUE_BATCH_SIZE = 200
+
+def db_url_from_env():
+    """
+    Build the PostgreSQL URL from DB_HOST, DB_PORT, DB_NAME, DB_USER and DB_PASSWORD
+
+    :return: Database URL or None if host or password is missing
+    """
+    db_host = os.getenv('DB_HOST')
+    db_port = os.getenv('DB_PORT', '5432')
+    db_name = os.getenv('DB_NAME', 'postgres')
+    db_user = os.getenv('DB_USER', 'postgres')
+    db_password = os.getenv('DB_PASSWORD')
+    
+    if db_host and db_password:
+        return f"postgresql://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}"
+    return None
+
 class YouTubePodcastAnalyzer:
-    def __init__(self, youtube_api_key=None, google_api_key=None, data_dir='podcast_data', db_url=None):
+    def __init__(self, youtube_api_key=None, google_api_key=None, data_dir='podcast_data', db_url=None,
+                 use_analysis_cache=True, gemini_rpm=None, gemini_tpm=None, use_prefilter=True):
         """
         Initialize YouTube Podcast Analyzer
 
@@ -49,6 +133,10 @@ class YouTubePodcastAnalyzer:
         :param google_api_key: Google API key for Gemini (optional)
         :param data_dir: Directory to save analysis results
         :param db_url: Database connection URL (optional)
+        :param use_analysis_cache: Reuse cached Gemini results for identical transcripts
+        :param gemini_rpm: Gemini requests-per-minute budget (default GEMINI_RPM or 15)
+        :param gemini_tpm: Gemini tokens-per-minute budget (default GEMINI_TPM or 1,000,000)
+        :param use_prefilter: Skip texts without stock talk and send only the dense chunks of the rest
         """
         # Configuration
         self.data_dir = data_dir
@@ -91,6 +179,13 @@ class YouTubePodcastAnalyzer:
         # Save Google API key
         self.google_api_key = google_api_key
 
+        # Gemini-kvoter; klient och schemaläggare skapas först när de behövs
+        self.gemini_rpm = int(gemini_rpm or os.getenv('GEMINI_RPM', 15))
+        self.gemini_tpm = int(gemini_tpm or os.getenv('GEMINI_TPM', 1000000))
+        self.gemini_scheduler = None
+        # Delade (requests, tokens)-buckets när flera processer delar samma kvot
+        self.gemini_buckets = None
+
         # Podcast playlists - these are hardcoded since they remain the same
         self.podcasts = {
             'Avanzapodden': 'PLbBkvdCCY_gsmZi4wIBLq7wy1MIRhQhUO',
@@ -101,6 +196,47 @@ class YouTubePodcastAnalyzer:
         # No manual transcripts - we'll fetch them dynamically
         self.manual_transcripts = {}
 
+        # Token-reduction stats per video from the subtitle parser
+        self.transcript_stats = {}
+
+        # Synkstatus per spellista och förbrukad YouTube-kvot för körningen
+        self.sync_state = PlaylistSyncState(os.path.join(self.data_dir, 'playlist_sync_state.json'))
+        self._pending_sync = {}
+        self.quota = QuotaMeter()
+
+        # Batchade metadatauppslag (upp till 50 videor per anrop) med cache i minnet och på disk
+        self.metadata = VideoMetadataResolver(
+            self.youtube,
+            os.path.join(self.data_dir, 'video_metadata_cache.json'),
+            quota=self.quota
+        )
+
+        # Analysresultat i en append-only-lagring partitionerad per podcast och månad;
+        # gamla JSON-filer (en per avsnitt) flyttas in vid första start
+        self.store = AnalysisStore(self.data_dir)
+        try:
+            migrate_legacy_json_once(self.data_dir, self.store)
+        except Exception as e:
+            logger.warning(f"Could not migrate old analysis JSON files: {e}")
+
+        # Lokalt förfilter som uppskattar finansiell täthet innan Gemini anropas
+        self.prefilter = FinancialPrefilter() if use_prefilter else None
+        self.prefilter_stats = {'skipped': 0, 'reduced': 0, 'full': 0}
+
+        # Tidsmätning per steg och video för körningsrapporten
+        self.metrics = RunMetrics()
+
+        # Beständig arbetskö med status per video (queued/fetched/analyzed/saved/failed)
+        self.queue = WorkQueue(os.path.join(self.data_dir, 'work_queue.sqlite'))
+
+        # Cache för Gemini-analyser (transkript-hash, podcast, promptversion, modell)
+        self.analysis_cache = None
+        if use_analysis_cache:
+            try:
+                self.analysis_cache = AnalysisCache(os.path.join(self.data_dir, 'analysis_cache.sqlite'))
+            except Exception as e:
+                logger.warning(f"Analysis cache not available: {e}")
+
     
     def extract_transcript_from_html(self, html_content, video_id):
         """
@@ -195,10 +331,16 @@ class YouTubePodcastAnalyzer:
             self._method_youtube_description
         ]
         
+        video_id = self._extract_video_id(video_url)
         for method in transcript_methods:
+            stage = 'transcript.' + method.__name__.replace('_method_', '')
             try:
-                transcript = method(video_url)
-                if transcript and len(transcript) > 100:
+                with self.metrics.span(stage, video_id) as span:
+                    transcript = method(video_url)
+                    span['ok'] = bool(transcript and len(transcript) > 100)
+                    span['chars_out'] = len(transcript or '')
+                    span['bytes'] = len((transcript or '').encode('utf-8'))
+                if span['ok']:
                     return transcript
             except Exception as e:
                 logger.warning(f"Transcript method {method.__name__} failed: {e}")
@@ -316,6 +458,11 @@ class YouTubePodcastAnalyzer:
     def _method_alternative_transcript(self, video_url):
         """
         Alternativ metod för att hämta transkript med yt-dlp
+
+        The downloaded .vtt/.srt file is run through the subtitle parser so that
+        headers, timestamps and YouTube's rolling duplicate lines are removed
+        before the text reaches Gemini. The clean text is cached as
+        transcripts/<video_id>.txt and the cue offsets as <video_id>.cues.json.
         """
         try:
             import yt_dlp
@@ -325,31 +472,58 @@ class YouTubePodcastAnalyzer:
                 'writeautomaticsub': True,
                 'subtitleslangs': ['sv', 'en'],
                 'skip_download': True,
+                'quiet': True,
                 'outtmpl': os.path.join(self.data_dir, 'transcripts', '%(id)s.%(ext)s')
             }
             
             with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info_dict = ydl.extract_info(video_url, download=False)
+                # download=True krävs för att undertextfilerna ska skrivas (skip_download hoppar över videon)
+                info_dict = ydl.extract_info(video_url, download=True)
                 video_id = info_dict.get('id', None)
                 
                 if video_id:
                     # Försök hitta svenska eller engelska undertexter
                     for lang in ['sv', 'en']:
-                        subtitle_file = os.path.join(
-                            self.data_dir, 
-                            'transcripts', 
-                            f'{video_id}.{lang}.vtt'
-                        )
-                        
-                        if os.path.exists(subtitle_file):
-                            with open(subtitle_file, 'r', encoding='utf-8') as f:
-                                return f.read()
+                        for ext in ['vtt', 'srt']:
+                            subtitle_file = os.path.join(
+                                self.data_dir, 
+                                'transcripts', 
+                                f'{video_id}.{lang}.{ext}'
+                            )
+                            
+                            if os.path.exists(subtitle_file):
+                                return self._load_subtitle_file(subtitle_file, video_id)
             
             return None
         except Exception as e:
             logger.warning(f"Alternative transcript method failed: {e}")
             return None
 
+    def _load_subtitle_file(self, subtitle_file, video_id):
+        """
+        Parse a subtitle file into clean text and cache the result
+
+        :param subtitle_file: Path to a .vtt or .srt file
+        :param video_id: YouTube video ID
+        :return: Clean transcript text or None
+        """
+        parsed = parse_subtitle_file(subtitle_file, with_index=True)
+        stats = parsed['stats']
+        self.transcript_stats[video_id] = stats
+        print(f"{Fore.GREEN}Cleaned subtitles for {video_id}: {format_reduction_stats(stats)}{Style.RESET_ALL}")
+        logger.info(f"Subtitle cleanup for {video_id}: {json.dumps(stats)}")
+
+        if not parsed['text']:
+            return None
+
+        transcripts_dir = os.path.join(self.data_dir, 'transcripts')
+        with open(os.path.join(transcripts_dir, f'{video_id}.txt'), 'w', encoding='utf-8') as f:
+            f.write(parsed['text'])
+        with open(os.path.join(transcripts_dir, f'{video_id}.cues.json'), 'w', encoding='utf-8') as f:
+            json.dump(parsed['cue_index'], f)
+
+        return parsed['text']
+
     def _method_youtube_description(self, video_url):
         """
         Fallback-metod som hämtar och analyserar videobeskrivningen
@@ -392,26 +566,17 @@ class YouTubePodcastAnalyzer:
                     'description': ''
                 }
             
-            # Check if we have YouTube API access
+            # Check if we have YouTube API access (snippets are batched and cached)
             if self.youtube:
-                try:
-                    request = self.youtube.videos().list(
-                        part="snippet",
-                        id=video_id
-                    )
-                    response = request.execute()
-                    
-                    if response.get('items'):
-                        snippet = response['items'][0]['snippet']
-                        return {
-                            'title': snippet.get('title', 'Unknown'),
-                            'video_id': video_id,
-                            'video_url': video_url,
-                            'published_at': snippet.get('publishedAt', 'Unknown'),
-                            'description': snippet.get('description', '')
-                        }
-                except Exception as e:
-                    logger.warning(f"YouTube API error: {e}")
+                snippet = self.metadata.get(video_id)
+                if snippet:
+                    return {
+                        'title': snippet.get('title', 'Unknown'),
+                        'video_id': video_id,
+                        'video_url': video_url,
+                        'published_at': snippet.get('publishedAt', 'Unknown'),
+                        'description': snippet.get('description', '')
+                    }
             
             # Fallback to basic info if YouTube API failed or not available
             logger.info(f"Using basic info for video {video_id} (YouTube API not available)")
@@ -439,72 +604,116 @@ class YouTubePodcastAnalyzer:
         :return: Boolean indicating if the video has been analyzed
         """
         try:
-            # Sök igenom alla JSON-filer i data-katalogen
-            for filename in os.listdir(self.data_dir):
-                if filename.endswith('.json'):
-                    file_path = os.path.join(self.data_dir, filename)
-                    try:
-                        with open(file_path, 'r', encoding='utf-8') as f:
-                            data = json.load(f)
-                            # Kolla om video_id finns i någon analys
-                            for item in data.get('items', []):
-                                if item.get('video_id') == video_id:
-                                    logger.info(f"Video {video_id} already analyzed in {filename}")
-                                    return True
-                    except Exception as e:
-                        logger.warning(f"Could not check file {filename}: {e}")
-            
+            if self.store.has_video(video_id):
+                logger.info(f"Video {video_id} already analyzed")
+                return True
             return False
         except Exception as e:
             logger.error(f"Error checking for existing analyses: {e}")
             return False
 
-    def get_playlist_videos(self, playlist_id_or_url, max_videos=5):
+    def get_playlist_videos(self, playlist_id_or_url, max_videos=5, sync_mode='full'):
         """
         Get videos from a YouTube playlist using YouTube API
+
+        In 'incremental' mode listing stops at the first video already recorded
+        in the sync state, or, when an earlier run was capped by max_videos, at
+        the stored resume cursor (known videos above it are skipped). In 'backfill' mode listing resumes from the stored
+        page token and walks further back in the playlist history. The sync
+        state is only updated by commit_playlist_sync once the videos are processed.
         
         :param playlist_id_or_url: YouTube playlist ID or URL
         :param max_videos: Maximum number of videos to get
+        :param sync_mode: 'full', 'incremental' or 'backfill'
         :return: List of video URLs
         """
         try:
             # Extract playlist ID if URL is provided
-            playlist_id = playlist_id_or_url
-            if 'youtube.com/playlist' in playlist_id_or_url:
-                if 'list=' in playlist_id_or_url:
-                    playlist_id = playlist_id_or_url.split('list=')[1].split('&')[0]
+            playlist_id = self._extract_playlist_id(playlist_id_or_url)
+            
+            known_ids = set()
+            resume_below = None
+            if sync_mode in ('incremental', 'backfill'):
+                known_ids = self.sync_state.known_ids(playlist_id)
+            if sync_mode == 'incremental':
+                resume_below = self.sync_state.resume_below(playlist_id)
+            self._pending_sync[playlist_id] = {
+                'mode': sync_mode,
+                'next_page_token': None,
+                'complete': True,
+                'resumed': bool(resume_below),
+                'quota_start': self.quota.units,
+            }
             
             # Check if we have YouTube API access
             if self.youtube:
                 try:
                     videos = []
                     next_page_token = None
+                    reached_known = False
+                    capped = False
+                    
+                    if sync_mode == 'backfill':
+                        sync_entry = self.sync_state.get(playlist_id)
+                        if sync_entry['backfill_complete']:
+                            print(f"{Fore.GREEN}Backfill already complete for playlist {playlist_id}{Style.RESET_ALL}")
+                            return []
+                        next_page_token = sync_entry['backfill_page_token']
                     
                     while len(videos) < max_videos:
                         # Get playlist items
                         request = self.youtube.playlistItems().list(
                             part="contentDetails",
                             playlistId=playlist_id,
-                            maxResults=min(50, max_videos - len(videos)),
+                            # Med en öppen lucka måste kända videor bläddras förbi, så ta hela sidor
+                            maxResults=50 if resume_below else min(50, max_videos - len(videos)),
                             pageToken=next_page_token
                         )
+                        self.quota.throttle()
                         response = request.execute()
+                        self.quota.record('playlistItems.list')
+                        
+                        # Hämta metadata för hela sidan i ett enda videos.list-anrop
+                        page_ids = [item['contentDetails']['videoId'] for item in response.get('items', [])]
+                        self.metadata.prefetch([video_id for video_id in page_ids if video_id not in known_ids])
                         
                         # Extract video IDs and create URLs
-                        for item in response.get('items', []):
+                        items = response.get('items', [])
+                        for position, item in enumerate(items):
                             video_id = item['contentDetails']['videoId']
+                            if sync_mode == 'incremental' and (
+                                    video_id == resume_below or (not resume_below and video_id in known_ids)):
+                                # Vattenmärket nått - resten av listan är redan känd
+                                reached_known = True
+                                break
+                            if video_id in known_ids:
+                                continue
                             video_url = f"https://www.youtube.com/watch?v={video_id}"
                             videos.append(video_url)
                             
                             if len(videos) >= max_videos:
+                                capped = position < len(items) - 1
                                 break
                         
                         # Check if there are more pages
                         next_page_token = response.get('nextPageToken')
-                        if not next_page_token:
+                        if len(videos) >= max_videos and not reached_known and next_page_token:
+                            capped = True
+                        if sync_mode == 'backfill':
+                            # Sidan är helt genomgången, så nästa körning fortsätter från nästa sida
+                            self._pending_sync[playlist_id]['next_page_token'] = next_page_token
+                        if reached_known or not next_page_token:
                             break
                     
-                    if videos:
+                    if sync_mode == 'incremental':
+                        # Avbruten av max_videos innan vattenmärket - nästa körning fortsätter under luckan
+                        self._pending_sync[playlist_id]['complete'] = not capped
+                        if reached_known:
+                            logger.info(f"Reached known videos in playlist {playlist_id}, {len(videos)} new")
+                        elif capped:
+                            logger.info(f"Playlist {playlist_id} has more new videos than max_videos, "
+                                        f"resuming below them next run")
+                    if videos or sync_mode != 'full':
                         logger.info(f"Found {len(videos)} videos in playlist using YouTube API")
                         return videos
                 except Exception as e:
@@ -538,14 +747,76 @@ class YouTubePodcastAnalyzer:
                 videos = []
                 for video in playlist_dict.get('entries', []):
                     if video:
+                        if sync_mode == 'incremental' and (
+                                video['id'] == resume_below or (not resume_below and video['id'] in known_ids)):
+                            break
+                        if video['id'] in known_ids:
+                            continue
                         video_url = f"https://www.youtube.com/watch?v={video['id']}"
                         videos.append(video_url)
                 
+                if sync_mode == 'incremental':
+                    # Listan är kapad vid max_videos, så luckan kan bara anses fylld om vi nådde vattenmärket
+                    self._pending_sync[playlist_id]['complete'] = len(videos) < max_videos
+                if sync_mode == 'backfill':
+                    logger.warning("yt-dlp fallback has no page tokens; backfill cursor not advanced")
+                    self._pending_sync.pop(playlist_id, None)
+                
                 return videos
         except Exception as e:
             logger.error(f"Error fetching playlist: {e}")
             return []
     
+    @staticmethod
+    def _extract_video_id(video_url):
+        """
+        Extract the video ID from a watch or youtu.be URL
+
+        :param video_url: YouTube video URL
+        :return: Video ID or None
+        """
+        if 'youtube.com/watch?v=' in video_url:
+            return video_url.split('watch?v=')[1].split('&')[0]
+        if 'youtu.be/' in video_url:
+            return video_url.split('youtu.be/')[1].split('?')[0]
+        return None
+
+    @staticmethod
+    def _extract_playlist_id(playlist_id_or_url):
+        """
+        Extract the playlist ID from a playlist URL (IDs are returned unchanged)
+        """
+        if 'list=' in playlist_id_or_url:
+            return playlist_id_or_url.split('list=')[1].split('&')[0]
+        return playlist_id_or_url
+
+    def commit_playlist_sync(self, playlist_id_or_url, video_urls):
+        """
+        Record processed playlist videos in the sync state
+
+        :param playlist_id_or_url: Playlist ID or URL
+        :param video_urls: Video URLs returned by get_playlist_videos that were processed
+        """
+        playlist_id = self._extract_playlist_id(playlist_id_or_url)
+        pending = self._pending_sync.pop(playlist_id, {
+            'mode': 'full', 'next_page_token': None, 'complete': True, 'resumed': False,
+            'quota_start': self.quota.units
+        })
+        video_ids = [url.split('watch?v=')[1].split('&')[0] for url in video_urls if 'watch?v=' in url]
+
+        if pending['mode'] == 'incremental' and video_ids:
+            self.sync_state.update_incremental_cursor(playlist_id, pending['complete'])
+        self.sync_state.mark_seen(playlist_id, video_ids, newest_first=pending['mode'] != 'backfill',
+                                  keep_newest=pending['resumed'])
+        if pending['mode'] == 'backfill':
+            self.sync_state.set_backfill_cursor(playlist_id, pending['next_page_token'])
+        # Kvoten som den här spellistans synk har förbrukat, inte hela körningens
+        self.sync_state.get(playlist_id)['last_quota_units'] = self.quota.units - pending['quota_start']
+        try:
+            self.sync_state.save()
+        except Exception as e:
+            logger.error(f"Could not save playlist sync state: {e}")
+
     def analyze_with_gemini(self, text, podcast_name, episode_title):
         """
         Analyze text with Gemini to extract stock mentions and summarize
@@ -555,212 +826,253 @@ class YouTubePodcastAnalyzer:
         :param episode_title: Episode title
         :return: Analysis result or None if quality is insufficient
         """
-        max_retries = 3
-        retry_delay = 10  # sekunder mellan försök
+        return self.analyze_many_with_gemini([(0, text, podcast_name, episode_title)])[0]
 
-        for attempt in range(max_retries):
-            try:
-                # Behåll befintlig kod för API-nyckel och import
-                api_key = self.google_api_key or os.getenv('GOOGLE_API_KEY')
-                
-                if not api_key:
-                    return {
-                        "summary": "Gemini API not configured",
-                        "mentions": []
-                    }
-                
-                try:
-                    import google.generativeai as genai
-                    
-                    # Befintlig konfiguration
-                    genai.configure(api_key=api_key)
-                    
-                    # Befintlig längdbegränsning
-                    if len(text) > 90000:
-                        logger.info(f"Text is very long ({len(text)} characters), limiting to 90,000 characters")
-                        text = text[:90000]
-                
-                    prompt = f"""
-                    Podcast Analysis: "{podcast_name}" - Episode: "{episode_title}"
+    def prefilter_text(self, text, episode_title):
+        """
+        Run the local pre-filter on a text before it is sent to Gemini
 
-                    Analysera denna svenskspråkiga podcast-transkription med fokus på den svenska och nordiska finansmarknaden:
+        The returned text is also what the analysis cache is keyed on.
 
-                    1. Skriv en koncis sammanfattning på svenska (3-5 meningar) som fångar huvudämnena i podcasten
-                    2. Identifiera alla omnämnanden av:
-                    - Svenska börshörnbolag (från Stockholmsbörsen, First North, NGM)
-                    - Nordiska börsnoterade bolag
-                    - Globala aktier som diskuteras i en svensk kontext
-                    - Finansiella instrument och investeringsprodukter (fonder, ETF:er, certifikat, etc.)
+        :param text: Transcript or description text
+        :param episode_title: Episode title (for logging)
+        :return: Text to analyze (possibly reduced to the dense chunks), or None when
+                 the pre-filter found no financial content
+        """
+        if not self.prefilter:
+            return text
+        # Texter utan aktieprat skickas inte alls; glesa texter krymps till de täta styckena
+        with self.metrics.span('prefilter', chars_in=len(text)) as span:
+            verdict = self.prefilter.evaluate(text)
+            span['chars_out'] = len(verdict['text']) if verdict['decision'] != DECISION_SKIP else 0
+        if verdict['decision'] == DECISION_SKIP:
+            logger.info(f"Pre-filter found no financial content in '{episode_title}', skipping Gemini")
+            self.prefilter_stats['skipped'] += 1
+            return None
+        if verdict['decision'] == DECISION_CHUNKS:
+            logger.info(f"Pre-filter kept {len(verdict['text'])} of {len(text)} characters "
+                        f"for '{episode_title}' (density {verdict['density']:.2f})")
+            self.prefilter_stats['reduced'] += 1
+            return verdict['text']
+        self.prefilter_stats['full'] += 1
+        return text
 
-                    För varje omnämnande, samla in följande information:
-                    - Företagets/aktiens namn
-                    - Tickersymbol exakt som den nämns (t.ex. ERIC B, SHB A) eller null om den inte nämns
-                    - Ett direkt citat som visar kontexten (högst 150 tecken)
-                    - Sentiment (positive/negative/neutral) baserat på hur aktien diskuteras
-                    - Rekommendation (buy/sell/hold/none) om sådan nämns eller antyds tydligt
-                    - Prisinformation eller prognos om sådan nämns (exakta siffror om möjligt)
-                    - En kort beskrivning av varför aktien nämns (t.ex. "kvartalsrapport", "produktlansering", "populär aktie")
+    def analyze_many_with_gemini(self, jobs, failures=None, prefiltered=False):
+        """
+        Analyze several texts with Gemini through the shared quota-aware scheduler
 
-                    Returnera resultatet som JSON med följande struktur:
-                    {{
-                        "summary": "En sammanfattande text på svenska om podcasten",
-                        "mentions": [
-                            {{
-                                "name": "Företagsnamn",
-                                "ticker": "Tickersymbol eller null",
-                                "context": "Citat från texten",
-                                "sentiment": "positive/negative/neutral",
-                                "recommendation": "buy/sell/hold/none",
-                                "price_info": "Prisinformation eller null",
-                                "mention_reason": "Orsak till omnämnande"
-                            }}
-                        ]
-                    }}
+        Cached analyses that passed the quality check are returned directly. The
+        rest (including cached low-quality answers) are scheduled together so
+        that a retry waiting on backoff does not block the other episodes.
 
-                    VIKTIGT: 
-                    - Inkludera INTE några kommentarer, förklaringar eller anteckningar i JSON-svaret
-                    - JSON måste vara helt giltig utan några kommentarer eller förklaringar
-                    - Använd "null" för värden som saknas, inte tomma strängar
-                    - Var så exakt och specifik som möjligt med tickersymboler (inkludera A/B/C-suffixet för svenska aktier)
-                    - För sentiment, använd endast värdena "positive", "negative" eller "neutral"
-                    - För recommendation, använd endast värdena "buy", "sell", "hold" eller "none"
+        :param jobs: List of (key, text, podcast_name, episode_title)
+        :param failures: Optional dictionary that receives key -> error message for
+                         jobs that could not be analyzed (placeholders are still returned)
+        :param prefiltered: The texts already went through prefilter_text
+        :return: Dictionary key -> analysis result
+        """
+        if failures is None:
+            failures = {}
+        results = {}
+        pending = []
 
-                    Text att analysera:
-                    {text}
-                    """
-                
-                    # Befintlig modellinstans och innehållsgenerering
-                    model = genai.GenerativeModel("gemini-1.5-pro")
-                    response = model.generate_content(prompt)
-                    
-                    # Befintlig JSON-rensning
-                    response_text = response.text
-                    if response_text.startswith("```json") or response_text.startswith("```"):
-                        response_text = response_text.replace("```json", "").replace("```", "").strip()
-                    
-                    # Modifierad JSON-parsing och kvalitetskontroll
-                    try:
-                        result = json.loads(response_text)
-                        logger.info(f"Gemini analysis completed with API key, found {len(result.get('mentions', []))} mentions")
-                        
-                        mentions = result.get('mentions', [])
-                        summary = result.get('summary', '')
-                        
-                        # Ändrad kvalitetskontroll - mindre strikta krav
-                        if len(mentions) >= 1 and len(summary) > 50:
-                            return result
-                        
-                        logger.warning(f"Analysis quality too low: {len(mentions)} mentions, summary length: {len(summary)}")
-                        
-                        # Vänta innan nästa försök
-                        if attempt < max_retries - 1:
-                            time.sleep(retry_delay)
-                            retry_delay *= 2  # Exponentiell backoff
-                        
-                        continue  # Fortsätt till nästa iteration
-                    
-                    except json.JSONDecodeError as e:
-                        logger.error(f"Could not parse Gemini response as JSON: {e}")
-                        logger.error(f"Response text: {response_text}")
-                        
-                        # Vänta innan nästa försök
-                        if attempt < max_retries - 1:
-                            time.sleep(retry_delay)
-                            retry_delay *= 2  # Exponentiell backoff
-                        
-                        continue  # Fortsätt till nästa iteration
-                    
-                except Exception as e:
-                    logger.error(f"Error using Gemini with API key: {e}")
-                    
-                    # Specifik hantering för 429-fel (kvotfel)
-                    if "429" in str(e):
-                        logger.warning("API-kvotfel. Väntar mellan försök...")
-                        time.sleep(retry_delay)
-                        retry_delay *= 2  # Exponentiell backoff
-                        continue
-                    
-                    # För andra fel, returnera ett standardsvar
-                    return {
-                        "summary": "Error analyzing with Gemini",
-                        "mentions": []
-                    }
+        for key, text, podcast_name, episode_title in jobs:
+            if not prefiltered:
+                text = self.prefilter_text(text, episode_title)
+            if text is None:
+                results[key] = {
+                    "summary": "Inget finansiellt innehåll hittades av förfiltret",
+                    "mentions": [],
+                    "prefilter_skipped": True
+                }
+                continue
             
-            except Exception as e:
-                logger.error(f"Generellt fel vid Gemini-analys: {e}")
-                
-                # Vänta innan nästa försök
-                if attempt < max_retries - 1:
-                    time.sleep(retry_delay)
-                    retry_delay *= 2  # Exponentiell backoff
-        
-        # Om alla försök misslyckas
-        logger.error("Kunde inte genomföra Gemini-analys efter flera försök")
-        return {
-            "summary": "Analys kunde inte genomföras efter flera försök",
-            "mentions": []
-        }
-    
+            # Återanvänd en tidigare analys av samma transkript om prompt och modell är oförändrade
+            cached = None
+            if self.analysis_cache:
+                cached = self.analysis_cache.get(text, podcast_name, PROMPT_VERSION, GEMINI_MODEL)
+            if cached and cached['quality_ok']:
+                self.metrics.record('analysis_cache_hit', 0.0, ok=True)
+                logger.info(f"Using cached Gemini analysis for '{episode_title}'")
+                results[key] = cached['result']
+                continue
+            if cached:
+                # Ett underkänt svar sparas bara som utfall; texten skickas till Gemini igen
+                logger.info(f"Cached Gemini analysis for '{episode_title}' failed the quality check, retrying")
+            pending.append((key, text, podcast_name, episode_title))
+
+        if not pending:
+            return results
+
+        try:
+            scheduler = self._get_gemini_scheduler()
+        except Exception as e:
+            logger.error(f"Error using Gemini with API key: {e}")
+            for key, _, _, _ in pending:
+                failures[key] = str(e)
+                results[key] = {
+                    "summary": "Error analyzing with Gemini",
+                    "mentions": []
+                }
+            return results
+
+        if not scheduler:
+            for key, _, _, _ in pending:
+                results[key] = {
+                    "summary": "Gemini API not configured",
+                    "mentions": []
+                }
+            return results
+
+        for key, text, podcast_name, episode_title in pending:
+            scheduler.submit(key, self._build_gemini_prompt(text, podcast_name, episode_title),
+                             self._checkpointed_handler(text, podcast_name, episode_title))
+
+        outcomes = scheduler.run()
+
+        for key, text, podcast_name, episode_title in pending:
+            outcome = outcomes[key]
+            # Varje försök skickar om hela prompten; tokens är uppskattningar (fyra tecken per token)
+            self.metrics.record(
+                STAGE_GEMINI, outcome['elapsed'], ok=outcome['status'] == JOB_OK, title=episode_title,
+                chars_in=outcome['prompt_chars'] * outcome['attempts'], chars_out=outcome['response_chars'],
+                tokens_in=max(1, outcome['prompt_chars'] // 4) * outcome['attempts'],
+                tokens_out=outcome['response_chars'] // 4, retries=max(0, outcome['attempts'] - 1)
+            )
+            if outcome['status'] == JOB_OK:
+                result = outcome['value']
+                logger.info(f"Gemini analysis completed with API key, found {len(result.get('mentions', []))} mentions")
+                results[key] = result
+            elif outcome['status'] == JOB_ERROR:
+                # För andra fel än kvotfel, returnera ett standardsvar
+                failures[key] = outcome['error'] or 'Error analyzing with Gemini'
+                results[key] = {
+                    "summary": "Error analyzing with Gemini",
+                    "mentions": []
+                }
+            else:
+                # Om alla försök misslyckas
+                if outcome['value'] is not None:
+                    self._cache_analysis(text, podcast_name, episode_title, outcome['value'], False)
+                logger.error(f"Kunde inte genomföra Gemini-analys efter flera försök ({episode_title})")
+                failures[key] = outcome['error'] or 'Analysis failed the quality check after all retries'
+                results[key] = {
+                    "summary": "Analys kunde inte genomföras efter flera försök",
+                    "mentions": []
+                }
+
+        return results
+
+    def _checkpointed_handler(self, text, podcast_name, episode_title):
+        """
+        Response handler that caches a successful analysis as soon as it arrives,
+        so an interrupted batch does not lose the answers it already received
+        """
+        def handle_response(response_text):
+            status, value = self._parse_gemini_response(response_text)
+            if status == JOB_OK:
+                self._cache_analysis(text, podcast_name, episode_title, value, True)
+            return status, value
+        return handle_response
+
+    def _get_gemini_scheduler(self):
+        """
+        Get the scheduler backed by the shared Gemini client
+
+        :return: GeminiScheduler or None if no API key is configured
+        """
+        api_key = self.google_api_key or os.getenv('GOOGLE_API_KEY')
+        if not api_key:
+            return None
+        if self.gemini_scheduler is None:
+            client = GeminiClient.shared(api_key, GEMINI_MODEL)
+            requests_bucket, tokens_bucket = self.gemini_buckets or (None, None)
+            self.gemini_scheduler = GeminiScheduler(client, rpm=self.gemini_rpm, tpm=self.gemini_tpm,
+                                                    requests_bucket=requests_bucket, tokens_bucket=tokens_bucket)
+        return self.gemini_scheduler
+
+    def _build_gemini_prompt(self, text, podcast_name, episode_title):
+        """
+        Fill in the prompt template, limiting very long texts
+
+        :param text: Text to analyze
+        :param podcast_name: Podcast name
+        :param episode_title: Episode title
+        :return: Prompt text
+        """
+        if len(text) > 90000:
+            logger.info(f"Text is very long ({len(text)} characters), limiting to 90,000 characters")
+            text = text[:90000]
+        return GEMINI_PROMPT_TEMPLATE.format(
+            podcast_name=podcast_name,
+            episode_title=episode_title,
+            text=text
+        )
+
+    @staticmethod
+    def _parse_gemini_response(response_text):
+        """
+        Parse a Gemini response and apply the quality check
+
+        :param response_text: Raw response text
+        :return: (JOB_OK, result) or (JOB_RETRY, result_or_None)
+        """
+        if response_text.startswith("```json") or response_text.startswith("```"):
+            response_text = response_text.replace("```json", "").replace("```", "").strip()
+
+        try:
+            result = json.loads(response_text)
+        except json.JSONDecodeError as e:
+            logger.error(f"Could not parse Gemini response as JSON: {e}")
+            logger.error(f"Response text: {response_text}")
+            return JOB_RETRY, None
+
+        if not isinstance(result, dict):
+            logger.error(f"Gemini response is not a JSON object: {type(result).__name__}")
+            return JOB_RETRY, None
+
+        mentions = result.get('mentions') or []
+        summary = result.get('summary') or ''
+        if not isinstance(mentions, list) or not isinstance(summary, str):
+            logger.warning("Gemini response has unexpected types for 'mentions' or 'summary'")
+            return JOB_RETRY, None
+
+        # Ändrad kvalitetskontroll - mindre strikta krav
+        if len(mentions) >= 1 and len(summary) > 50:
+            return JOB_OK, result
+
+        logger.warning(f"Analysis quality too low: {len(mentions)} mentions, summary length: {len(summary)}")
+        return JOB_RETRY, result
+
+    def _cache_analysis(self, text, podcast_name, episode_title, result, quality_ok):
+        """
+        Store a parsed Gemini result in the analysis cache (if enabled)
+
+        :param text: Untruncated text that was analyzed
+        :param podcast_name: Podcast name
+        :param episode_title: Episode title
+        :param result: Parsed JSON result
+        :param quality_ok: Whether the result passed the quality check
+        """
+        if not self.analysis_cache:
+            return
+        try:
+            self.analysis_cache.put(text, podcast_name, PROMPT_VERSION, GEMINI_MODEL,
+                                    result, quality_ok, episode_title)
+        except Exception as e:
+            logger.warning(f"Could not write analysis cache: {e}")
+
     def save_analysis(self, podcast_name, items):
         """
-        Save analysis results to a JSON file with improved naming convention
-        Each episode is saved in a separate file
+        Append analysis results to the partitioned analysis store
         
         :param podcast_name: Podcast name
         :param items: List of analyzed items
-        :return: List of paths to saved files
+        :return: List of partition files written to
         """
-        saved_files = []
-        
-        # Spara varje episod i en separat fil
+        saved_files = self.store.append(podcast_name, items)
         for item in items:
-            # Extrahera avsnittsnummer från titeln om möjligt
-            title = item.get('title', '')
-            episode_number = None
-            # Mönster för att hitta avsnittsnummer som "Sparpodden 555" eller "Avsnitt 123" eller "#382"
-            match = re.search(r'(?:[Ss]parpodden|[Aa]vsnitt|[Ee]pisode|#)\s*#?(\d+)', title)
-            if match:
-                episode_number = match.group(1)
-            
-            # Extrahera publiceringsdatum
-            pub_date = item.get('published_at', '')
-            # Konvertera från ISO-format till YYYYMMDD
-            if pub_date and pub_date != 'Unknown':
-                try:
-                    # Hantera ISO 8601-format "2023-01-15T12:30:45Z"
-                    pub_date = pub_date.split('T')[0].replace('-', '')
-                except Exception:
-                    pub_date = ''
-            
-            # Skapa filnamn med avsnittsnummer och publiceringsdatum om tillgängliga
-            filename_parts = [podcast_name.replace(' ', '_').lower()]
-            
-            if episode_number:
-                filename_parts.append(f"ep{episode_number}")
-            
-            if pub_date:
-                filename_parts.append(f"pub{pub_date}")
-            
-            # Lägg till en tidsstämpel för när analysen gjordes
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename_parts.append(timestamp)
-            
-            filename = os.path.join(
-                self.data_dir, 
-                f"{'_'.join(filename_parts)}.json"
-            )
-            
-            # Spara enstaka episod i egen fil
-            with open(filename, 'w', encoding='utf-8') as f:
-                json.dump({
-                    "podcast_name": podcast_name,
-                    "analysis_date": datetime.now().isoformat(),
-                    "items": [item]  # OBS: Bara en episod i listan nu
-                }, f, ensure_ascii=False, indent=4)
-            
-            logger.info(f"Saved analysis for {podcast_name} - {title} to {filename}")
-            saved_files.append(filename)
-        
+            logger.info(f"Saved analysis for {podcast_name} - {item.get('title', '')}")
         return saved_files
     
     def save_to_database(self, podcast_name, items):
@@ -776,9 +1088,6 @@ class YouTubePodcastAnalyzer:
             return False
         
         try:
-            from models import Podcast, Episode, StockMention
-            from datetime import datetime
-            
             # Reducera kravet på antal omnämnanden
             valid_items = [
                 item for item in items 
@@ -789,205 +1098,237 @@ class YouTubePodcastAnalyzer:
                 logger.warning("No valid items to save to database")
                 return False
             
-            # Skapa en ny session
-            session = self.db_session()
-            
-            try:
-                # Transaktionshantering
-                with session.begin():
-                    # Hämta eller skapa podcast
-                    podcast = session.query(Podcast).filter_by(name=podcast_name).first()
-                    if not podcast:
-                        podcast = Podcast(
-                            name=podcast_name,
-                            playlist_id=self.podcasts.get(podcast_name)
-                        )
-                        session.add(podcast)
-                    
-                    # Bearbeta varje analyserad artikel
-                    for item in valid_items:
-                        # Undvik dubbletter
-                        existing_episode = (
-                            session.query(Episode)
-                            .filter_by(video_id=item['video_id'])
-                            .first()
-                        )
-                        
-                        if existing_episode:
-                            logger.info(f"Episode {item['video_id']} already exists, skipping")
-                            continue
-                        
-                        # Hantera publiceringsdatum
-                        published_at = None
-                        if item.get('published_at') and item['published_at'] != 'Unknown':
-                            try:
-                                published_at = datetime.strptime(
-                                    item['published_at'].split('T')[0], 
-                                    '%Y-%m-%d'
-                                )
-                            except Exception as e:
-                                logger.warning(f"Kunde inte tolka publiceringsdatum: {e}")
-                        
-                        # Skapa ny episod
-                        episode = Episode(
-                            video_id=item['video_id'],
-                            title=item.get('title', 'Okänd titel')[:255],
-                            video_url=item.get('video_url', '')[:512],
-                            published_at=published_at,
-                            description=item.get('description', '')[:1000],
-                            summary=item.get('summary', '')[:2000],
-                            transcript_length=item.get('transcript_length', 0),
-                            analysis_date=datetime.now(),
-                            podcast=podcast
-                        )
-                        session.add(episode)
-                        
-                        # Lägg till aktieomtal
-                        for mention in item.get('mentions', []):
-                            # Lägg till denna förbättring för alla fält som kan vara None
-                            stock_mention = StockMention(
-                                name=mention.get('name', 'Okänt')[:255],
-                                ticker=(mention.get('ticker') or '')[:50],
-                                context=(mention.get('context', ''))[:500],
-                                sentiment=(mention.get('sentiment', 'neutral'))[:50],
-                                recommendation=(mention.get('recommendation', 'none'))[:50],
-                                price_info=(mention.get('price_info') or '')[:255],
-                                mention_reason=(mention.get('mention_reason') or '')[:255],
-                                episode=episode
-                            )
-                            session.add(stock_mention)
-                
-                # Commit och stäng sessionen
-                session.commit()
-                logger.info(f"Sparade {len(valid_items)} episoder till databasen")
-                return True
-            
-            except Exception as e:
-                session.rollback()
-                logger.error(f"Databaslagringsfel: {e}")
-                return False
-            finally:
-                # Stäng sessionen
-                session.close()
+            # En transaktion: en IN-fråga för befintliga avsnitt, sedan flerradiga INSERT
+            writer = EpisodeBulkWriter(self.db_engine)
+            stats = writer.write(podcast_name, valid_items, playlist_id=self.podcasts.get(podcast_name))
+            logger.info(
+                f"Sparade {stats['episodes_inserted']} episoder och {stats['mentions_inserted']} "
+                f"aktieomnämnanden till databasen ({stats['episodes_skipped']} fanns redan)"
+            )
+            return True
         
         except Exception as e:
-            logger.error(f"Generellt databasfel: {e}")
+            logger.error(f"Databaslagringsfel: {e}")
             return False
     
     def analyze_youtube_urls(self, urls, podcast_name="YouTube Podcast"):
         """
         Analyze a list of individual YouTube URLs
+
+        The videos are put on the durable work queue and taken through the
+        fetch, analyze and save stages; an interrupted run continues from the
+        last completed stage of each video.
         
         :param urls: List of YouTube video URLs
         :param podcast_name: Name of the podcast
         :return: List of analyzed items
         """
-        analyzed_items = []
+        video_ids = self.enqueue_videos(urls, podcast_name)
+        return self.process_queue(podcast_name, video_ids=video_ids, workers=1)
+
+    def enqueue_videos(self, urls, podcast_name):
+        """
+        Put videos that have not been analyzed yet on the work queue
+
+        :param urls: List of YouTube video URLs
+        :param podcast_name: Name of the podcast
+        :return: Video IDs to process (including ones already queued earlier)
+        """
+        # Förhämta metadata för alla videor i så få API-anrop som möjligt
+        with self.metrics.span('metadata', items=len(urls)):
+            self.metadata.prefetch([self._extract_video_id(url) for url in urls])
         
-        for i, url in enumerate(urls):
-            print(f"\n{Fore.CYAN}===== Analyserar Video {i+1}/{len(urls)} ====={Style.RESET_ALL}")
-            print(f"URL: {url}")
-            
-            # Get video info
+        video_infos = []
+        for url in urls:
             video_info = self.get_video_info(url)
             video_id = video_info.get('video_id')
+            if video_id == 'Unknown':
+                print(f"{Fore.RED}Could not extract video ID from URL: {url}{Style.RESET_ALL}")
+                continue
             
             # Kontrollera om videon redan har analyserats
-            if video_id != 'Unknown' and self.has_analyzed_video(video_id):
+            if self.has_analyzed_video(video_id):
                 print(f"{Fore.YELLOW}Video {video_id} already analyzed, skipping{Style.RESET_ALL}")
                 continue
+            video_infos.append(video_info)
+        
+        added = self.queue.enqueue(podcast_name, video_infos)
+        if added < len(video_infos):
+            print(f"{Fore.CYAN}{len(video_infos) - added} videos already in the work queue, resuming{Style.RESET_ALL}")
+        return [info['video_id'] for info in video_infos]
+
+    def process_queue(self, podcast_name=None, video_ids=None, workers=1,
+                      stages=(STAGE_FETCH, STAGE_ANALYZE, STAGE_SAVE)):
+        """
+        Run the pipeline stages over the work queue
+
+        :param podcast_name: Only videos of this podcast
+        :param video_ids: Only these videos
+        :param workers: Concurrent transcript fetches
+        :param stages: Stages to run, in order
+        :return: List of items saved by this call
+        """
+        if STAGE_FETCH in stages:
+            TranscriptPrefetcher(self, workers=workers).run(podcast_name, video_ids)
+        if STAGE_ANALYZE in stages:
+            self._analyze_queued(podcast_name, video_ids)
+        if STAGE_SAVE in stages:
+            return self._save_queued(podcast_name, video_ids)
+        return []
+
+    def _analyze_queued(self, podcast_name=None, video_ids=None):
+        """
+        Analyze fetched videos in one scheduler batch per podcast
+
+        Every result is checkpointed in the queue (and successful Gemini answers
+        in the analysis cache as soon as they arrive).
+        """
+        prefetcher = TranscriptPrefetcher(self)
+        while True:
+            claimed = self.queue.claim(STATE_FETCHED, QUEUE_BATCH_SIZE, podcast_name=podcast_name, video_ids=video_ids)
+            if not claimed:
+                return
+            claimed_ids = [item['video_id'] for item in claimed]
+            try:
+                self._analyze_claimed(claimed, prefetcher)
+            except Exception as e:
+                logger.error(f"Analyze stage failed for a batch of {len(claimed)} videos: {e}")
+                self.queue.fail_leased(claimed_ids, STAGE_ANALYZE, str(e))
+            finally:
+                # Videor som varken flyttats eller markerats (t.ex. vid Ctrl-C) lämnas tillbaka direkt
+                self.queue.release(claimed_ids)
+
+    def _analyze_claimed(self, claimed, prefetcher):
+        by_podcast = {}
+        for item in claimed:
+            by_podcast.setdefault(item['podcast_name'], []).append(item)
+        
+        for name, items in by_podcast.items():
+            collected = []  # (item, text, extra fields)
+            for item in items:
+                text = prefetcher.load_text(item)
+                if not text:
+                    self.queue.fail(item['video_id'], STAGE_ANALYZE, 'Cached transcript missing')
+                    continue
+                if item.get('source') == 'description':
+                    extra = {'using_description': True}
+                else:
+                    extra = {'transcript_length': len(text)}
+                collected.append((item, text, extra))
             
-            # Get transcript from YouTubeToTranscript.com
-            transcript_text = self.get_transcript_from_website(url)
+            if not collected:
+                continue
             
-            if transcript_text:
-                print(f"{Fore.GREEN}Transcript fetched successfully ({len(transcript_text)} characters){Style.RESET_ALL}")
-                
-                # Analyze transcript with Gemini
-                if self.google_api_key:  # ändrat från google_cloud_project
-                    print(f"{Fore.CYAN}Analyzing transcript with Gemini...{Style.RESET_ALL}")
-                    analysis = self.analyze_with_gemini(
-                        transcript_text, 
-                        podcast_name, 
-                        video_info['title']
-                    )
-                else:
-                    # If Gemini is not configured, just return basic info
-                    analysis = {
+            failures = {}
+            if self.google_api_key:  # ändrat från google_cloud_project
+                print(f"{Fore.CYAN}Analyzing {len(collected)} texts with Gemini...{Style.RESET_ALL}")
+                analyses = self.analyze_many_with_gemini([
+                    (idx, text, name, item['title'])
+                    for idx, (item, text, _) in enumerate(collected)
+                ], failures=failures)
+            else:
+                # If Gemini is not configured, just return basic info
+                analyses = {
+                    idx: {
                         "summary": "Gemini analysis not configured",
                         "mentions": []
                     }
-                
-                # Combine analysis with item metadata
-                full_item = {
-                    **video_info,
-                    **analysis,
-                    'transcript_length': len(transcript_text)
+                    for idx in range(len(collected))
                 }
-                
-                analyzed_items.append(full_item)
-            else:
-                # Om ingen transkribering hittas, analysera beskrivningen istället
-                print(f"{Fore.RED}Could not fetch transcript{Style.RESET_ALL}")
-                
-                if video_info['description'] and len(video_info['description']) > 100:
-                    print(f"{Fore.YELLOW}Analyzing description instead{Style.RESET_ALL}")
-                    
-                    if self.google_api_key:  # ändrat från google_cloud_project
-                        analysis = self.analyze_with_gemini(
-                            video_info['description'],
-                            podcast_name,
-                            video_info['title']
-                        )
-                    else:
-                        analysis = {
-                            "summary": "Gemini analysis not configured",
-                            "mentions": []
-                        }
-                    
-                    # Combine analysis with item metadata
-                    full_item = {
-                        **video_info,
-                        **analysis,
-                        'using_description': True
-                    }
-                    
-                    analyzed_items.append(full_item)
-                else:
-                    print(f"{Fore.RED}No transcript or useful description available{Style.RESET_ALL}")
             
-            # Add a delay to avoid overwhelming the website
-            if i < len(urls) - 1:
-                print(f"{Fore.CYAN}Waiting before processing next video...{Style.RESET_ALL}")
-                time.sleep(3)
+            for idx, (item, _, extra) in enumerate(collected):
+                if idx in failures:
+                    self.queue.fail(item['video_id'], STAGE_ANALYZE, failures[idx])
+                else:
+                    self.queue.advance(item['video_id'], STATE_ANALYZED, analysis={**analyses[idx], **extra})
+
+    def _save_queued(self, podcast_name=None, video_ids=None):
+        """
+        Save analyzed videos to the analysis store (and database) and mark them saved
+
+        :return: List of saved items
+        """
+        saved_items = []
+        while True:
+            claimed = self.queue.claim(STATE_ANALYZED, QUEUE_BATCH_SIZE, podcast_name=podcast_name, video_ids=video_ids)
+            if not claimed:
+                return saved_items
+            claimed_ids = [item['video_id'] for item in claimed]
+            try:
+                saved_items.extend(self._save_claimed(claimed))
+            except Exception as e:
+                logger.error(f"Save stage failed for a batch of {len(claimed)} videos: {e}")
+                self.queue.fail_leased(claimed_ids, STAGE_SAVE, str(e))
+            finally:
+                self.queue.release(claimed_ids)
+
+    def _save_claimed(self, claimed):
+        by_podcast = {}
+        for item in claimed:
+            by_podcast.setdefault(item['podcast_name'], []).append(item)
         
-        # Save analysis results if we have any
-        if analyzed_items:
-            saved_files = self.save_analysis(podcast_name, analyzed_items)
+        saved_items = []
+        for name, items in by_podcast.items():
+            # Combine analysis with item metadata
+            analyzed_items = [{
+                'podcast_name': name,
+                'title': item['title'],
+                'video_id': item['video_id'],
+                'video_url': item['video_url'],
+                'published_at': item['published_at'],
+                'description': item['description'] or '',
+                **item['analysis']
+            } for item in items]
+            
+            try:
+                with self.metrics.span('store_save', items=len(analyzed_items)):
+                    saved_files = self.save_analysis(name, analyzed_items)
+            except Exception as e:
+                logger.error(f"Error saving analysis: {e}")
+                for item in items:
+                    self.queue.fail(item['video_id'], STAGE_SAVE, str(e))
+                continue
             for file in saved_files:
                 print(f"{Fore.GREEN}Analysis saved to: {file}{Style.RESET_ALL}")
-        
+            
             # Also save to database if available
             if self.db_session:
-                if self.save_to_database(podcast_name, analyzed_items):
+                with self.metrics.span('db_save', items=len(analyzed_items)) as span:
+                    span['ok'] = self.save_to_database(name, analyzed_items)
+                if span['ok']:
                     print(f"{Fore.GREEN}Data also saved to database{Style.RESET_ALL}")
                 else:
                     print(f"{Fore.YELLOW}Failed to save to database{Style.RESET_ALL}")
+                    # Stannar i spara-steget så att retry-failed försöker igen
+                    for item in items:
+                        self.queue.fail(item['video_id'], STAGE_SAVE, 'Database save failed')
+                    continue
+            
+            for item in items:
+                self.queue.advance(item['video_id'], STATE_SAVED)
+            saved_items.extend(analyzed_items)
         
-        return analyzed_items
+        return saved_items
     
-    def analyze_podcast_playlist(self, podcast_name, playlist_id, max_episodes=5):
+    def analyze_podcast_playlist(self, podcast_name, playlist_id, max_episodes=5, sync_mode='full'):
         """
         Analyze a complete podcast playlist
         
         :param podcast_name: Podcast name
         :param playlist_id: YouTube playlist ID
         :param max_episodes: Maximum number of episodes to analyze
+        :param sync_mode: 'full', 'incremental' (only videos newer than the stored watermark)
+                          or 'backfill' (resumable walk through older videos)
         """
         print(f"\n{Fore.CYAN}Analyzing playlist: {podcast_name}{Style.RESET_ALL}")
         
         # Get videos from playlist
-        video_urls = self.get_playlist_videos(playlist_id, max_videos=max_episodes)
+        video_urls = self.get_playlist_videos(playlist_id, max_videos=max_episodes, sync_mode=sync_mode)
+        
+        if not video_urls and sync_mode != 'full':
+            print(f"{Fore.GREEN}No new videos for {podcast_name} ({sync_mode} sync){Style.RESET_ALL}")
+            print(f"{Fore.CYAN}YouTube API quota used: {self.quota.report()}{Style.RESET_ALL}")
+            return []
         
         if not video_urls:
             print(f"{Fore.RED}No videos found in playlist. Using fallback list.{Style.RESET_ALL}")
@@ -1006,7 +1347,59 @@ class YouTubePodcastAnalyzer:
         print(f"{Fore.GREEN}Found {len(video_urls)} videos to analyze{Style.RESET_ALL}")
         
         # Analyze each video
-        return self.analyze_youtube_urls(video_urls, podcast_name)
+        results = self.analyze_youtube_urls(video_urls, podcast_name)
+        
+        # Uppdatera vattenmärket först när videorna är behandlade
+        self.commit_playlist_sync(playlist_id, video_urls)
+        print(f"{Fore.CYAN}YouTube API quota used: {self.quota.report()}{Style.RESET_ALL}")
+        
+        return results
+
+    def prefetch_transcripts(self, urls, podcast_name="YouTube Podcast", workers=4):
+        """
+        Fill the transcript cache for a list of videos without calling Gemini
+
+        :param urls: List of YouTube video URLs
+        :param podcast_name: Name of the podcast
+        :param workers: Number of concurrent fetch threads
+        :return: Queue counts per state for the podcast
+        """
+        video_ids = self.enqueue_videos(urls, podcast_name)
+        self.process_queue(podcast_name, video_ids=video_ids, workers=workers, stages=(STAGE_FETCH,))
+        return self.queue.counts(podcast_name)
+
+    def prefetch_podcast_playlist(self, podcast_name, playlist_id, max_episodes=5, sync_mode='full', workers=4):
+        """
+        Walk a playlist and prefetch its transcripts (no analysis)
+
+        The playlist sync state is advanced here; the fetched videos wait in the
+        work queue until analyze_cached_transcripts picks them up.
+
+        :param podcast_name: Podcast name
+        :param playlist_id: YouTube playlist ID
+        :param max_episodes: Maximum number of episodes to fetch
+        :param sync_mode: 'full', 'incremental' or 'backfill'
+        :param workers: Number of concurrent fetch threads
+        :return: Queue counts per state for the podcast
+        """
+        print(f"\n{Fore.CYAN}Prefetching transcripts: {podcast_name}{Style.RESET_ALL}")
+        video_urls = self.get_playlist_videos(playlist_id, max_videos=max_episodes, sync_mode=sync_mode)
+        if not video_urls:
+            print(f"{Fore.YELLOW}No videos to prefetch for {podcast_name}{Style.RESET_ALL}")
+            return self.queue.counts(podcast_name)
+        
+        counts = self.prefetch_transcripts(video_urls, podcast_name, workers=workers)
+        self.commit_playlist_sync(playlist_id, video_urls)
+        return counts
+
+    def analyze_cached_transcripts(self, podcast_name=None):
+        """
+        Analyze and save prefetched transcripts from the work queue
+
+        :param podcast_name: Only analyze videos prefetched for this podcast
+        :return: List of analyzed items
+        """
+        return self.process_queue(podcast_name, stages=(STAGE_ANALYZE, STAGE_SAVE))
 
     def import_transcript_from_file(self, file_path, video_url=None, podcast_name="Imported Podcast"):
         """
@@ -1018,15 +1411,21 @@ class YouTubePodcastAnalyzer:
         :return: Analysis result
         """
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                transcript_text = f.read()
+            if file_path.endswith(('.vtt', '.srt')):
+                # Undertextfiler rensas från tidskoder och rullande dubbletter
+                parsed = parse_subtitle_file(file_path)
+                transcript_text = parsed['text']
+                print(f"{Fore.GREEN}Cleaned subtitles: {format_reduction_stats(parsed['stats'])}{Style.RESET_ALL}")
+            else:
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    transcript_text = f.read()
             
             print(f"{Fore.GREEN}Loaded transcript from file: {file_path} ({len(transcript_text)} characters){Style.RESET_ALL}")
             
             # Extract file name as title if no video URL provided
             title = os.path.basename(file_path)
-            if title.endswith('.txt'):
-                title = title[:-4]  # Remove .txt extension
+            if title.endswith(('.txt', '.vtt', '.srt')):
+                title = title[:-4]  # Remove extension
             
             # Get video info if URL provided
             video_info = {
@@ -1066,8 +1465,8 @@ class YouTubePodcastAnalyzer:
             
             # Save analysis
             analyzed_items = [full_item]
-            saved_file = self.save_analysis(podcast_name, analyzed_items)
-            print(f"{Fore.GREEN}Analysis saved to: {saved_file}{Style.RESET_ALL}")
+            for saved_file in self.save_analysis(podcast_name, analyzed_items):
+                print(f"{Fore.GREEN}Analysis saved to: {saved_file}{Style.RESET_ALL}")
             
             return full_item
         
@@ -1078,34 +1477,15 @@ class YouTubePodcastAnalyzer:
 
 def export_to_csv(results, output_file):
     """
-    Export analysis results to CSV file
+    Export analysis results to CSV file (or Parquet if the name ends with .parquet)
     
     :param results: List of analysis results
-    :param output_file: Path to output CSV file
+    :param output_file: Path to output file
     """
     try:
-        # Flatten mentions for CSV export
-        export_data = []
-        for result in results:
-            podcast_name = result.get('podcast_name', 'Unknown')
-            for mention in result.get('mentions', []):
-                export_item = {
-                    'Podcast': podcast_name,
-                    'Episode': result.get('title', 'Unknown'),
-                    'Date': result.get('published_at', 'Unknown'),
-                    'Stock': mention['name'],
-                    'Ticker': mention.get('ticker', ''),
-                    'Sentiment': mention.get('sentiment', 'unknown'),
-                    'Recommendation': mention.get('recommendation', 'None'),
-                    'PriceInfo': mention.get('price_info', ''),
-                    'Context': mention.get('context', '')
-                }
-                export_data.append(export_item)
-        
-        # Export to CSV
-        df = pd.DataFrame(export_data)
-        df.to_csv(output_file, index=False, encoding='utf-8-sig')
-        print(f"{Fore.GREEN}Results exported to {output_file}{Style.RESET_ALL}")
+        # Rader skrivs en i taget i stället för att byggas upp i minnet
+        count = export_rows(iter_result_rows(results), output_file)
+        print(f"{Fore.GREEN}Results exported to {output_file} ({count} mentions){Style.RESET_ALL}")
         
     except Exception as e:
         logger.error(f"Error exporting results to CSV: {e}")
@@ -1151,6 +1531,23 @@ def print_analysis_summary(results, filter_stock=None):
     print(f"\n{Fore.GREEN}Total episodes analyzed: {len(results)}{Style.RESET_ALL}")
     print(f"{Fore.GREEN}Total stock mentions: {len(all_mentions)}{Style.RESET_ALL}")
 
+def print_run_report(analyzer):
+    """
+    Print the per-stage timing and cost summary and save it under run_reports/
+    
+    :param analyzer: Analyzer whose metrics cover the run
+    """
+    summary = analyzer.metrics.summary()
+    if not summary['stages']:
+        return
+    print(f"\n{Fore.CYAN}=== RUN REPORT ==={Style.RESET_ALL}")
+    print(format_summary(summary))
+    try:
+        path = analyzer.metrics.write(analyzer.data_dir, summary)
+        print(f"{Fore.CYAN}Run report saved to: {path}{Style.RESET_ALL}")
+    except OSError as e:
+        logger.warning(f"Could not write run report: {e}")
+
 def main():
     # Load environment variables
     load_dotenv()
@@ -1170,7 +1567,13 @@ def main():
     parser.add_argument('--stock', '-s', 
                     help='Search for mentions of a specific stock')
     parser.add_argument('--transcripts-only', action='store_true',
-                    help='Only fetch transcripts without analysis')
+                    help='Only fetch transcripts without analysis (resumable prefetch stage)')
+    parser.add_argument('--analyze-cached', action='store_true',
+                    help='Analyze previously prefetched transcripts instead of fetching new ones')
+    parser.add_argument('--prefetch-workers', type=int, default=4,
+                    help='Concurrent transcript fetches for --transcripts-only')
+    parser.add_argument('--workers', type=int, default=1,
+                    help='Worker processes; podcasts and episodes are sharded across them')
     parser.add_argument('--import-transcript', '-i',
                     help='Import transcript from a local file')
     parser.add_argument('--output-dir', '-o', default='podcast_data',
@@ -1189,6 +1592,17 @@ def main():
                     help='Database password')
     parser.add_argument('--use-db', action='store_true',
                     help='Use database connection from .env if available')
+    parser.add_argument('--sync', choices=SYNC_MODES, default='full',
+                    help='Playlist listing: full (top N), incremental (only videos newer than the stored '
+                         'watermark) or backfill (resumable walk through older videos)')
+    parser.add_argument('--no-analysis-cache', action='store_true',
+                    help='Always call Gemini, ignoring cached analyses')
+    parser.add_argument('--no-prefilter', action='store_true',
+                    help='Send every text to Gemini, even without detected stock talk')
+    parser.add_argument('--gemini-rpm', type=int,
+                    help='Gemini requests per minute budget (default: GEMINI_RPM or 15)')
+    parser.add_argument('--gemini-tpm', type=int,
+                    help='Gemini tokens per minute budget (default: GEMINI_TPM or 1000000)')
     args = parser.parse_args()
     
     # Get API keys from environment
@@ -1204,14 +1618,8 @@ def main():
         print(f"{Fore.CYAN}Using database connection from command line arguments{Style.RESET_ALL}")
     # Then check environment variables if --use-db flag is present
     elif args.use_db:
-        db_host = os.getenv('DB_HOST')
-        db_port = os.getenv('DB_PORT', '5432')
-        db_name = os.getenv('DB_NAME', 'postgres')
-        db_user = os.getenv('DB_USER', 'postgres')
-        db_password = os.getenv('DB_PASSWORD')
-        
-        if db_host and db_password:
-            db_url = f"postgresql://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}"
+        db_url = db_url_from_env()
+        if db_url:
             print(f"{Fore.CYAN}Using database connection from environment variables{Style.RESET_ALL}")
     
     # Lägg till denna kod precis innan raden med analyzer-initieringen
@@ -1227,7 +1635,10 @@ def main():
         except Exception as e:
             print(f"{Fore.RED}Kunde inte ansluta till databasen: {e}{Style.RESET_ALL}")
     # Initialize analyzer with available credentials
-    analyzer = YouTubePodcastAnalyzer(youtube_api_key, google_api_key, args.output_dir, db_url)
+    analyzer = YouTubePodcastAnalyzer(youtube_api_key, google_api_key, args.output_dir, db_url,
+                                      use_analysis_cache=not args.no_analysis_cache,
+                                      gemini_rpm=args.gemini_rpm, gemini_tpm=args.gemini_tpm,
+                                      use_prefilter=not args.no_prefilter)
     
     # List available podcasts if requested
     if args.list_podcasts:
@@ -1262,8 +1673,75 @@ def main():
         
         return
     
+    # Förhämtningssteget: bara transkript, inga Gemini-anrop
+    if args.transcripts_only:
+        targets = []
+        if args.url:
+            targets.append((args.podcast or "YouTube Video", args.url))
+        elif args.podcasts:
+            for podcast_name in args.podcasts:
+                playlist_id = analyzer.podcasts.get(podcast_name)
+                if playlist_id:
+                    targets.append((podcast_name, playlist_id))
+                else:
+                    print(f"{Fore.YELLOW}No playlist found for {podcast_name}{Style.RESET_ALL}")
+        else:
+            print(f"{Fore.YELLOW}No podcast or URL specified. Use --podcasts or provide a URL.{Style.RESET_ALL}")
+            return
+        
+        for podcast_name, target in targets:
+            if "playlist" in target or "list=" in target or target in analyzer.podcasts.values():
+                summary = analyzer.prefetch_podcast_playlist(
+                    podcast_name, target, max_episodes=args.episodes,
+                    sync_mode=args.sync, workers=args.prefetch_workers
+                )
+            else:
+                summary = analyzer.prefetch_transcripts([target], podcast_name, workers=args.prefetch_workers)
+            print(f"{Fore.GREEN}{podcast_name}: {summary['fetched']} fetched and waiting for analysis, "
+                  f"{summary['queued']} still queued, {summary['failed']} failed{Style.RESET_ALL}")
+        
+        if analyzer.quota.calls:
+            print(f"{Fore.CYAN}YouTube API quota used this run: {analyzer.quota.report()}{Style.RESET_ALL}")
+        print_run_report(analyzer)
+        return
+    
+    # Analys av tidigare förhämtade transkript
+    if args.analyze_cached:
+        podcast_filters = args.podcasts or [args.podcast]
+        for podcast_name in podcast_filters:
+            all_results.extend(analyzer.analyze_cached_transcripts(podcast_name))
+    
+    # Flera processer: podcasts och avsnitt delas upp över en processpool
+    elif args.workers > 1 and (args.url or args.podcasts):
+        from parallel_runner import run_parallel
+        
+        if args.url:
+            targets = [(args.podcast or "YouTube Video", args.url)]
+        else:
+            targets = []
+            for podcast_name in args.podcasts:
+                playlist_id = analyzer.podcasts.get(podcast_name)
+                if playlist_id:
+                    targets.append((podcast_name, playlist_id))
+                else:
+                    print(f"{Fore.YELLOW}No playlist found for {podcast_name}{Style.RESET_ALL}")
+        
+        config = {
+            'youtube_api_key': youtube_api_key,
+            'google_api_key': google_api_key,
+            'data_dir': args.output_dir,
+            'db_url': db_url,
+            'use_analysis_cache': not args.no_analysis_cache,
+            'gemini_rpm': args.gemini_rpm,
+            'gemini_tpm': args.gemini_tpm,
+            'use_prefilter': not args.no_prefilter,
+        }
+        print(f"{Fore.CYAN}Processing {len(targets)} targets with {args.workers} worker processes{Style.RESET_ALL}")
+        all_results.extend(run_parallel(analyzer, targets, args.workers, config,
+                                        max_episodes=args.episodes, sync_mode=args.sync))
+    
     # Process single URL if provided
-    if args.url:
+    elif args.url:
         podcast_name = args.podcast or "YouTube Video"
         
         # Check if it's a playlist
@@ -1272,7 +1750,8 @@ def main():
             results = analyzer.analyze_podcast_playlist(
                 podcast_name,
                 args.url,
-                max_episodes=args.episodes
+                max_episodes=args.episodes,
+                sync_mode=args.sync
             )
         else:
             # Single video
@@ -1293,7 +1772,8 @@ def main():
             results = analyzer.analyze_podcast_playlist(
                 podcast_name, 
                 playlist_id, 
-                max_episodes=args.episodes
+                max_episodes=args.episodes,
+                sync_mode=args.sync
             )
             
             all_results.extend(results)
@@ -1303,6 +1783,13 @@ def main():
             parser.print_help()
             return
     
+    if analyzer.quota.calls:
+        print(f"{Fore.CYAN}YouTube API quota used this run: {analyzer.quota.report()}{Style.RESET_ALL}")
+    if any(analyzer.prefilter_stats.values()):
+        stats = analyzer.prefilter_stats
+        print(f"{Fore.CYAN}Pre-filter: {stats['skipped']} skipped, {stats['reduced']} reduced to dense chunks, "
+              f"{stats['full']} sent in full{Style.RESET_ALL}")
+    
     # Print analysis summary
     if all_results:
         print_analysis_summary(all_results, args.stock)
@@ -1312,6 +1799,8 @@ def main():
             export_to_csv(all_results, args.export)
     else:
         print(f"{Fore.YELLOW}No results were generated. Check your inputs and try again.{Style.RESET_ALL}")
+    
+    print_run_report(analyzer)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file